@@ -1,17 +1,39 @@
 from django.contrib import admin
-from .models import CourierProfile, DeliveryTask, CourierApplication
+
+from users.access import invalidate_access
+from .models import CourierProfile, DeliveryRun, DeliveryTask, CourierApplication
 
 @admin.register(DeliveryTask)
 class DeliveryTaskAdmin(admin.ModelAdmin):
-    list_display = ('order', 'courier', 'status', 'assigned_at', 'completed_at')
+    list_display = ('order', 'courier', 'status', 'created_at', 'assigned_at', 'picked_up_at', 'completed_at')
+    list_filter = ('status',)
+
+
+@admin.register(DeliveryRun)
+class DeliveryRunAdmin(admin.ModelAdmin):
+    list_display = ('id', 'courier', 'status', 'distance_km', 'created_at', 'assigned_at')
     list_filter = ('status',)
 
 
 @admin.register(CourierProfile)
 class CourierProfileAdmin(admin.ModelAdmin):
-    list_display = ('user', 'vehicle_type', 'is_active')
+    list_display = ('user', 'vehicle_type', 'is_active', 'last_location_at')
     list_filter = ('vehicle_type', 'is_active')
 
+    # профиль курьера и его активность кешируются в users.access
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        invalidate_access(obj.user_id, form.initial.get('user'))
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        invalidate_access(obj.user_id)
+
+    def delete_queryset(self, request, queryset):
+        user_ids = set(queryset.values_list('user_id', flat=True))
+        super().delete_queryset(request, queryset)
+        invalidate_access(*user_ids)
+
 
 @admin.register(CourierApplication)
 class CourierApplicationAdmin(admin.ModelAdmin):
@@ -0,0 +1,73 @@
+"""
+Взятие задач доставки курьерами без очередей на блокировках.
+
+claim_next_task отдаёт курьеру самую старую свободную задачу одним UPDATE:
+подзапрос выбирает её с FOR UPDATE SKIP LOCKED, поэтому параллельные
+курьеры не ждут друг друга на одной строке, а сразу получают следующую
+свободную. Проверка «у курьера нет активной задачи» — в том же UPDATE.
+"""
+from django.db import connection
+from django.utils import timezone
+
+from orders.models import Order
+from realtime.hub import publish_on_commit
+from .models import DeliveryTask
+
+
+def publish_assigned(assignments):
+    """assignments — [(task_id, order_id, courier_id, restaurant_id), ...]"""
+    for task_id, order_id, courier_id, restaurant_id in assignments:
+        publish_on_commit(
+            ['offers', f'order:{order_id}', f'restaurant:{restaurant_id}', f'courier:{courier_id}'],
+            {
+                'type': 'delivery.assigned',
+                'task_id': task_id,
+                'order_id': order_id,
+                'courier_id': courier_id,
+            },
+        )
+
+
+def claim_next_task(courier_id: int):
+    """
+    Назначает курьеру самую старую свободную задачу.
+    Возвращает {'id', 'order_id', 'courier_id', 'restaurant_id',
+    'delivery_address'} или None, если свободных задач нет или у курьера уже есть активная задача.
+    """
+    task_table = DeliveryTask._meta.db_table
+    order_table = Order._meta.db_table
+    now = timezone.now()
+
+    with connection.cursor() as cursor:
+        # order_id растёт вместе с временем создания заказа, поэтому порядок
+        # «самый старый первым» берётся прямо из частичного task_open_offer_idx
+        cursor.execute(
+            f'UPDATE {task_table} AS t '
+            f'SET courier_id = %s, status = %s, assigned_at = %s, updated_at = %s '
+            f'FROM {order_table} AS o '
+            f'WHERE o.id = t.order_id AND t.id = ('
+            f'SELECT id FROM {task_table} '
+            f'WHERE status = %s AND courier_id IS NULL AND run_id IS NULL '
+            f'ORDER BY order_id LIMIT 1 '
+            f'FOR UPDATE SKIP LOCKED) '
+            f'AND NOT EXISTS ('
+            f'SELECT 1 FROM {task_table} AS busy '
+            f'WHERE busy.courier_id = %s AND busy.status IN (%s, %s)) '
+            f'RETURNING t.id, t.order_id, t.courier_id, o.restaurant_id, o.delivery_address',
+            [
+                courier_id,
+                DeliveryTask.Status.ASSIGNED,
+                now,
+                now,
+                DeliveryTask.Status.PENDING,
+                courier_id,
+                DeliveryTask.Status.ASSIGNED,
+                DeliveryTask.Status.IN_PROGRESS,
+            ],
+        )
+        row = cursor.fetchone()
+
+    if row is None:
+        return None
+    publish_assigned([row[:4]])
+    return dict(zip(('id', 'order_id', 'courier_id', 'restaurant_id', 'delivery_address'), row))
@@ -0,0 +1,266 @@
+"""
+Пакетное автоматическое назначение курьеров (диспетчер).
+
+Вместо того чтобы курьеры наперегонки забирали офферы, диспетчер раз в тик:
+
+1. собирает свободные задачи (PENDING без курьера) и свободных курьеров
+   (активный профиль, нет задачи ASSIGNED/IN_PROGRESS);
+2. строит матрицу стоимостей задача × курьер (numpy);
+3. решает задачу о назначениях: scipy.optimize.linear_sum_assignment
+   (scipy есть в requirements.txt); без scipy — жадно, самым срочным задачам
+   самых дешёвых из свободных курьеров;
+4. применяет все назначения одним UPDATE в одной транзакции. UPDATE повторно
+   проверяет, что задача ещё свободна, а у курьера нет активной задачи,
+   поэтому ручное взятие оффера параллельно с тиком ничего не ломает.
+
+Стоимость пары (меньше — лучше):
+
+- ожидание: чем дольше заказ ждёт курьера, тем дешевле его назначить —
+  если курьеров меньше, чем задач, первыми уходят самые старые заказы;
+- транспорт: крупный заказ (по сумме) пешему или велокурьеру сверх их
+  вместимости — штраф; машины по возможности остаются для крупных заказов;
+- расстояние (км) от курьера до ресторана, если известны обе точки
+  (позиция курьера — последняя GPS-точка не старше LOCATION_MAX_AGE).
+"""
+from dataclasses import dataclass
+from datetime import datetime
+
+import numpy as np
+from django.db import connection, transaction
+from django.utils import timezone
+
+from orders.models import Order
+from .claims import publish_assigned
+from .locations import LOCATION_MAX_AGE
+from .models import CourierProfile, DeliveryTask
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:  # scipy не обязателен
+    linear_sum_assignment = None
+
+# сколько самых старых задач разбирается за тик
+DISPATCH_MAX_TASKS = 5000
+
+WAIT_WEIGHT = 1.0  # за минуту ожидания
+DISTANCE_WEIGHT = 4.0  # за километр
+OVERSIZE_WEIGHT = 0.02  # за рубль сверх вместимости транспорта
+
+# сумма заказа, которую курьер берёт без штрафа
+VEHICLE_CAPACITY = {
+    CourierProfile.VehicleTypes.FOOT: 1500.0,
+    CourierProfile.VehicleTypes.BIKE: 4000.0,
+    CourierProfile.VehicleTypes.CAR: np.inf,
+}
+# небольшая надбавка, чтобы не занимать машины мелкими заказами
+VEHICLE_COST = {
+    CourierProfile.VehicleTypes.FOOT: 0.0,
+    CourierProfile.VehicleTypes.BIKE: 1.0,
+    CourierProfile.VehicleTypes.CAR: 2.0,
+}
+
+_EARTH_RADIUS_KM = 6371.0
+
+
+@dataclass
+class DispatchBatch:
+    """Задачи и курьеры одного тика в виде numpy-массивов."""
+    task_ids: np.ndarray
+    wait_minutes: np.ndarray
+    order_totals: np.ndarray
+    courier_ids: np.ndarray
+    capacities: np.ndarray
+    vehicle_costs: np.ndarray
+    # (N, 2) широта/долгота в градусах, NaN — неизвестно
+    task_points: np.ndarray | None = None
+    courier_points: np.ndarray | None = None
+
+
+def collect_batch(now: datetime | None = None) -> DispatchBatch:
+    now = now or timezone.now()
+
+    tasks = list(
+        DeliveryTask.objects
+        .filter(status=DeliveryTask.Status.PENDING, courier__isnull=True, run__isnull=True)
+        .order_by('order__created_at')
+        .values_list(
+            'id',
+            'order__created_at',
+            'order__total_price',
+            'order__restaurant__lat',
+            'order__restaurant__lon',
+        )
+        [:DISPATCH_MAX_TASKS]
+    )
+    couriers = list(
+        CourierProfile.objects
+        .filter(is_active=True)
+        .exclude(
+            deliveries__status__in=[
+                DeliveryTask.Status.ASSIGNED,
+                DeliveryTask.Status.IN_PROGRESS,
+            ],
+        )
+        .values_list('id', 'vehicle_type', 'last_lat', 'last_lon', 'last_location_at')
+    )
+    fresh_after = now - LOCATION_MAX_AGE
+
+    return DispatchBatch(
+        task_ids=np.array([task[0] for task in tasks], dtype=np.int64),
+        wait_minutes=np.array(
+            [(now - task[1]).total_seconds() / 60 for task in tasks],
+            dtype=np.float64,
+        ),
+        order_totals=np.array([float(task[2]) for task in tasks], dtype=np.float64),
+        # None из БД становится NaN — расстояние неизвестно
+        task_points=np.array(
+            [(task[3], task[4]) for task in tasks],
+            dtype=np.float64,
+        ).reshape(-1, 2),
+        courier_ids=np.array([courier[0] for courier in couriers], dtype=np.int64),
+        capacities=np.array(
+            [VEHICLE_CAPACITY[courier[1]] for courier in couriers],
+            dtype=np.float64,
+        ),
+        vehicle_costs=np.array(
+            [VEHICLE_COST[courier[1]] for courier in couriers],
+            dtype=np.float64,
+        ),
+        courier_points=np.array(
+            [
+                (lat, lon) if seen_at is not None and seen_at >= fresh_after else (np.nan, np.nan)
+                for _, _, lat, lon, seen_at in couriers
+            ],
+            dtype=np.float64,
+        ).reshape(-1, 2),
+    )
+
+
+def _distance_km(task_points: np.ndarray, courier_points: np.ndarray) -> np.ndarray:
+    """
+    Матрица расстояний; NaN, где координаты неизвестны. В пределах города
+    равнопромежуточной проекции хватает, и она в разы дешевле гаверсинуса.
+    """
+    lat1, lon1 = np.radians(task_points).T
+    lat2, lon2 = np.radians(courier_points).T
+    dx = lon2[None, :] - lon1[:, None]
+    dx *= np.cos(lat1)[:, None]
+    dy = lat2[None, :] - lat1[:, None]
+    distance = np.hypot(dx, dy, out=dx)
+    distance *= _EARTH_RADIUS_KM
+    return distance
+
+
+def build_cost_matrix(batch: DispatchBatch) -> np.ndarray:
+    """Матрица (задачи × курьеры) стоимостей назначения."""
+    oversize = np.maximum(batch.order_totals[:, None] - batch.capacities[None, :], 0.0)
+    cost = oversize
+    cost *= OVERSIZE_WEIGHT
+    cost += batch.vehicle_costs[None, :]
+    cost -= WAIT_WEIGHT * batch.wait_minutes[:, None]
+    if batch.task_points is not None and batch.courier_points is not None:
+        distance = _distance_km(batch.task_points, batch.courier_points)
+        distance *= DISTANCE_WEIGHT
+        # неизвестное расстояние не штрафуется
+        cost += np.nan_to_num(distance, nan=0.0, copy=False)
+    return cost
+
+
+def _greedy_assignment(cost: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Задачи по возрастанию их лучшей стоимости (в первую очередь — самые
+    старые), каждой — самый дешёвый из ещё свободных курьеров.
+    """
+    n_tasks, n_couriers = cost.shape
+    limit = min(n_tasks, n_couriers)
+    rows = np.argsort(cost.min(axis=1), kind='stable')[:limit]
+    taken = np.zeros(n_couriers, dtype=np.float64)  # +inf у занятых курьеров
+    cols = np.empty(limit, dtype=np.int64)
+    for index, row in enumerate(rows):
+        col = int(np.argmin(cost[row] + taken))
+        cols[index] = col
+        taken[col] = np.inf
+    return rows, cols
+
+
+def solve_assignment(cost: np.ndarray, method: str | None = None):
+    """
+    Возвращает (индексы задач, индексы курьеров).
+    method: 'optimal' (scipy), 'greedy' или None — optimal, если scipy есть.
+    """
+    if cost.size == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+    if method is None:
+        method = 'optimal' if linear_sum_assignment is not None else 'greedy'
+    if method == 'optimal':
+        if linear_sum_assignment is None:
+            raise RuntimeError('scipy is not installed')
+        return linear_sum_assignment(cost)
+    return _greedy_assignment(cost)
+
+
+def commit_assignments(pairs) -> list[tuple[int, int, int, int]]:
+    """
+    Применяет [(task_id, courier_id), ...] одним UPDATE. Возвращает
+    применённые назначения (task_id, order_id, courier_id, restaurant_id):
+    пары, где задачу уже взяли или курьер уже занят, пропускаются.
+    """
+    # NOT EXISTS ниже видит снимок до UPDATE и не заметит две пары одного
+    # курьера (или одной задачи) в одной пачке — оставляем первую
+    seen_tasks, seen_couriers = set(), set()
+    unique = []
+    for task_id, courier_id in pairs:
+        if task_id in seen_tasks or courier_id in seen_couriers:
+            continue
+        seen_tasks.add(task_id)
+        seen_couriers.add(courier_id)
+        unique.append((task_id, courier_id))
+    pairs = unique
+    if not pairs:
+        return []
+
+    task_table = DeliveryTask._meta.db_table
+    order_table = Order._meta.db_table
+    values = ', '.join(['(%s, %s)'] * len(pairs))
+    params = [value for pair in pairs for value in pair]
+    now = timezone.now()
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {task_table} AS t '
+                f'SET courier_id = v.courier_id, status = %s, assigned_at = %s, updated_at = %s '
+                f'FROM (VALUES {values}) AS v (task_id, courier_id), {order_table} AS o '
+                f'WHERE t.id = v.task_id AND o.id = t.order_id '
+                f'AND t.status = %s AND t.courier_id IS NULL AND t.run_id IS NULL '
+                f'AND NOT EXISTS ('
+                f'SELECT 1 FROM {task_table} AS busy '
+                f'WHERE busy.courier_id = v.courier_id AND busy.status IN (%s, %s)) '
+                f'RETURNING t.id, t.order_id, t.courier_id, o.restaurant_id',
+                [DeliveryTask.Status.ASSIGNED, now, now]
+                + params
+                + [
+                    DeliveryTask.Status.PENDING,
+                    DeliveryTask.Status.ASSIGNED,
+                    DeliveryTask.Status.IN_PROGRESS,
+                ],
+            )
+            assigned = cursor.fetchall()
+
+        publish_assigned(assigned)
+    return assigned
+
+
+def dispatch_once(method: str | None = None) -> int:
+    """Один тик диспетчера. Возвращает число назначенных задач."""
+    batch = collect_batch()
+    if not len(batch.task_ids) or not len(batch.courier_ids):
+        return 0
+
+    rows, cols = solve_assignment(build_cost_matrix(batch), method)
+    pairs = [
+        (int(task_id), int(courier_id))
+        for task_id, courier_id in zip(batch.task_ids[rows], batch.courier_ids[cols])
+    ]
+    return len(commit_assignments(pairs))
@@ -0,0 +1,227 @@
+"""
+Прогноз времени доставки (ETA) по истории задач.
+
+Обучение (команда fit_eta_model) идёт офлайн: по завершённым задачам за
+ETA_HISTORY_DAYS дней считаются медианы трёх отрезков — ожидание курьера
+(created_at -> assigned_at), дорога до ресторана (assigned_at -> picked_up_at)
+и доставка клиенту (picked_up_at -> completed_at) — для групп
+(ресторан, час создания задачи, тип транспорта) и более грубых
+(ресторан, час), (ресторан), «все». Медианы групп считаются векторно:
+сортировка по (группа, значение) и выбор середины каждой группы.
+Результат сохраняется снимком DeliveryEtaModel.
+
+Каждый процесс держит последний снимок в памяти как словарь и перечитывает
+его не чаще раза в ETA_RELOAD_INTERVAL секунд, поэтому ETA в ответах —
+это поиск в словаре и сложение, без запросов и вычислений на запрос.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from django.utils import timezone
+
+from .models import CourierProfile, DeliveryEtaModel, DeliveryTask
+
+ETA_HISTORY_DAYS = 28
+# группа с меньшим числом доставок не попадает в таблицу — берётся более грубая
+ETA_MIN_SAMPLES = 5
+ETA_RELOAD_INTERVAL = 300
+# отрезки длиннее считаются сбоем учёта и не участвуют в обучении
+ETA_MAX_SEGMENT = 6 * 60 * 60
+
+VEHICLE_TYPES = tuple(CourierProfile.VehicleTypes.values)
+
+# уровни группировки: какие ключи (ресторан, час, транспорт) учитываются
+_LEVELS = (
+    (True, True, True),
+    (True, True, False),
+    (True, False, False),
+    (False, False, False),
+)
+
+
+def load_history(since: datetime):
+    """
+    Завершённые задачи с полным набором отметок времени.
+    Возвращает (ключи (N, 3): ресторан, час, код транспорта; отрезки (N, 3) в секундах).
+    """
+    rows = (
+        DeliveryTask.objects
+        .filter(
+            status=DeliveryTask.Status.DONE,
+            completed_at__gte=since,
+            created_at__isnull=False,
+            assigned_at__isnull=False,
+            picked_up_at__isnull=False,
+            courier__isnull=False,
+        )
+        .values_list(
+            'order__restaurant_id',
+            'courier__vehicle_type',
+            'created_at',
+            'assigned_at',
+            'picked_up_at',
+            'completed_at',
+        )
+        .iterator(chunk_size=5000)
+    )
+
+    keys = []
+    stamps = []
+    for restaurant_id, vehicle_type, created, assigned, picked_up, completed in rows:
+        keys.append(
+            (restaurant_id, timezone.localtime(created).hour, VEHICLE_TYPES.index(vehicle_type))
+        )
+        stamps.append(
+            (created.timestamp(), assigned.timestamp(), picked_up.timestamp(), completed.timestamp())
+        )
+
+    keys = np.array(keys, dtype=np.int64).reshape(-1, 3)
+    segments = np.diff(np.array(stamps, dtype=np.float64).reshape(-1, 4), axis=1)
+    valid = np.all((segments >= 0) & (segments <= ETA_MAX_SEGMENT), axis=1)
+    return keys[valid], segments[valid]
+
+
+def _pack_keys(keys: np.ndarray) -> np.ndarray:
+    """
+    (ресторан, час, транспорт) -> одно int64, -1 («любой») -> 0: группировка
+    по одному числу во много раз быстрее np.unique по строкам.
+    """
+    restaurant, hour, vehicle = (keys + 1).T
+    return (restaurant * 25 + hour) * (len(VEHICLE_TYPES) + 1) + vehicle
+
+
+def _unpack_key(code: int) -> tuple[int | None, int | None, int | None]:
+    code, vehicle = divmod(code, len(VEHICLE_TYPES) + 1)
+    restaurant, hour = divmod(code, 25)
+    return tuple(value - 1 if value else None for value in (restaurant, hour, vehicle))
+
+
+def _group_medians(codes: np.ndarray, values: np.ndarray):
+    """Уникальные коды групп, медианы values по каждой группе и размеры групп."""
+    groups, inverse, counts = np.unique(codes, return_inverse=True, return_counts=True)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    low = starts + (counts - 1) // 2
+    high = starts + counts // 2
+
+    medians = np.empty((len(groups), values.shape[1]), dtype=np.float64)
+    for column in range(values.shape[1]):
+        ordered = values[np.lexsort((values[:, column], inverse)), column]
+        medians[:, column] = (ordered[low] + ordered[high]) / 2
+    return groups, medians, counts
+
+
+def fit(keys: np.ndarray, segments: np.ndarray) -> list[list]:
+    """Строки таблицы ETA (формат DeliveryEtaModel.table)."""
+    table = []
+    for level in _LEVELS:
+        # неучитываемые ключи заменяем на -1, и они сливаются в одну группу
+        codes = _pack_keys(np.where(np.array(level), keys, -1))
+        groups, medians, counts = _group_medians(codes, segments)
+        if any(level):
+            enough = counts >= ETA_MIN_SAMPLES
+            groups, medians, counts = groups[enough], medians[enough], counts[enough]
+        medians = np.rint(medians).astype(np.int64)
+        for code, median, count in zip(groups.tolist(), medians.tolist(), counts.tolist()):
+            restaurant_id, hour, vehicle = _unpack_key(code)
+            table.append(
+                [
+                    restaurant_id,
+                    hour,
+                    VEHICLE_TYPES[vehicle] if vehicle is not None else None,
+                    *median,
+                    count,
+                ]
+            )
+    return table
+
+
+def fit_snapshot(days: int = ETA_HISTORY_DAYS) -> DeliveryEtaModel | None:
+    keys, segments = load_history(timezone.now() - timedelta(days=days))
+    if not len(keys):
+        return None
+    return DeliveryEtaModel.objects.create(
+        fitted_at=timezone.now(),
+        samples=len(keys),
+        table=fit(keys, segments),
+    )
+
+
+class EtaTable:
+    def __init__(self, rows):
+        self._durations = {
+            (restaurant_id, hour, vehicle): (to_assign, to_pickup, to_dropoff)
+            for restaurant_id, hour, vehicle, to_assign, to_pickup, to_dropoff, _ in rows
+        }
+
+    def lookup(self, restaurant_id: int, hour: int, vehicle_type: str | None):
+        """(до назначения, до забора, до вручения) в секундах или None."""
+        for key in (
+            (restaurant_id, hour, vehicle_type),
+            (restaurant_id, hour, None),
+            (restaurant_id, None, None),
+            (None, None, None),
+        ):
+            durations = self._durations.get(key)
+            if durations is not None:
+                return durations
+        return None
+
+
+_table: EtaTable | None = None
+_snapshot_id: int | None = None
+_checked_at: float | None = None
+_lock = threading.Lock()
+
+
+def get_table() -> EtaTable | None:
+    """Последний снимок модели; БД проверяется не чаще раза в ETA_RELOAD_INTERVAL."""
+    global _table, _snapshot_id, _checked_at
+    now = time.monotonic()
+    if _checked_at is not None and now - _checked_at < ETA_RELOAD_INTERVAL:
+        return _table
+
+    with _lock:
+        if _checked_at is None or now - _checked_at >= ETA_RELOAD_INTERVAL:
+            latest_id = DeliveryEtaModel.objects.order_by('-id').values_list('id', flat=True).first()
+            if latest_id != _snapshot_id:
+                rows = DeliveryEtaModel.objects.filter(pk=latest_id).values_list('table', flat=True).first()
+                _table = EtaTable(rows) if rows is not None else None
+                _snapshot_id = latest_id
+            _checked_at = now
+    return _table
+
+
+def estimate_delivery(
+    restaurant_id: int,
+    vehicle_type: str | None,
+    status: str,
+    created_at: datetime | None,
+    assigned_at: datetime | None,
+    picked_up_at: datetime | None,
+) -> datetime | None:
+    """Ожидаемое время вручения заказа по текущему статусу задачи доставки."""
+    if status == DeliveryTask.Status.DONE:
+        return None
+    table = get_table()
+    if table is None:
+        return None
+
+    now = timezone.now()
+    hour = timezone.localtime(created_at or now).hour
+    durations = table.lookup(restaurant_id, hour, vehicle_type)
+    if durations is None:
+        return None
+    to_assign, to_pickup, to_dropoff = durations
+
+    if status == DeliveryTask.Status.PENDING:
+        started, remaining = created_at, to_assign + to_pickup + to_dropoff
+    elif status == DeliveryTask.Status.ASSIGNED:
+        started, remaining = assigned_at, to_pickup + to_dropoff
+    else:
+        started, remaining = picked_up_at, to_dropoff
+
+    # у старых задач отметок может не быть — считаем от текущего момента
+    eta = (started or now) + timedelta(seconds=remaining)
+    return max(eta, now)
@@ -0,0 +1,66 @@
+"""
+Сетка для поиска офферов рядом с курьером.
+
+Точка забора задачи доставки (координаты ресторана) раскладывается
+в ячейку сетки GRID_STEP × GRID_STEP градусов: DeliveryTask.cell_y/cell_x.
+Частичный индекс task_open_offer_cell_idx содержит только открытые офферы,
+так что запрос «ячейки в квадрате вокруг курьера» читает из индекса
+лишь офферы поблизости, не просматривая весь бэклог PENDING.
+"""
+import math
+
+GRID_STEP = 0.01  # ~1.1 км по широте
+
+KM_PER_DEGREE = 111.32
+
+
+def grid_cell(lat: float | None, lon: float | None) -> tuple[int | None, int | None]:
+    if lat is None or lon is None:
+        return None, None
+    return math.floor(lat / GRID_STEP), math.floor(lon / GRID_STEP)
+
+
+def cell_ranges(lat: float, lon: float, radius_km: float) -> tuple[tuple[int, int], tuple[int, int]]:
+    """Диапазоны (cell_y, cell_x) ячеек, покрывающих круг радиуса radius_km."""
+    dlat = radius_km / KM_PER_DEGREE
+    # у полюса градус долготы стремится к нулю — ограничиваем снизу
+    dlon = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+    south, west = grid_cell(lat - dlat, lon - dlon)
+    north, east = grid_cell(lat + dlat, lon + dlon)
+    return (south, north), (west, east)
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Расстояние по гаверсинусу."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(a))
+
+
+def parse_point(lat, lon) -> tuple[float, float] | None:
+    """Координаты из запроса; None, если не переданы или некорректны."""
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+def refresh_open_offer_cells(restaurant_id: int, lat: float | None, lon: float | None) -> int:
+    """Перекладывает открытые офферы ресторана в ячейку его новых координат."""
+    from .models import DeliveryTask
+
+    cell_y, cell_x = grid_cell(lat, lon)
+    return (
+        DeliveryTask.objects
+        .filter(
+            order__restaurant_id=restaurant_id,
+            status=DeliveryTask.Status.PENDING,
+            courier__isnull=True,
+        )
+        .update(cell_y=cell_y, cell_x=cell_x)
+    )
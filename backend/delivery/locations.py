@@ -0,0 +1,286 @@
+"""
+Приём GPS-точек курьеров.
+
+Запрос с точками не пишет в БД сам: точки кладутся в очередь процесса,
+а фоновый поток LocationWriter раз в FLUSH_INTERVAL секунд (или по
+FLUSH_SIZE точек) сохраняет их одним bulk INSERT в CourierLocation и одним
+UPDATE переносит последнюю позицию каждого курьера в CourierProfile —
+её читают диспетчер и другие процессы.
+
+Последняя позиция курьера на этой ноде хранится в LatestPositions —
+плотные numpy-массивы со слотом на курьера: чтение одной позиции — обращение
+к словарю и массиву. Точки того же курьера могут приходить и на другие
+воркеры, поэтому память отвечает сама, только пока её точка свежее
+LOCAL_POSITION_MAX_AGE; иначе берётся более новая из памяти и CourierProfile.
+"""
+import atexit
+import logging
+import math
+import queue
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .models import CourierLocation, CourierProfile
+
+logger = logging.getLogger(__name__)
+
+MAX_POINTS_PER_REQUEST = 100
+# точки, не записанные в БД; при переполнении ingest отвечает 503
+MAX_PENDING_POINTS = 200_000
+FLUSH_INTERVAL = 1.0
+FLUSH_SIZE = 5000
+# более старая позиция курьера считается неизвестной (лента офферов, диспетчер)
+LOCATION_MAX_AGE = timedelta(minutes=10)
+# точка в памяти старше этого могла устареть: более новую мог записать другой воркер
+LOCAL_POSITION_MAX_AGE = 5 * FLUSH_INTERVAL
+
+
+class LatestPositions:
+    """Последние (lat, lon, время) курьеров в памяти процесса."""
+
+    def __init__(self, capacity: int = 1024):
+        self._slots: dict[int, int] = {}
+        self._coords = np.full((capacity, 2), np.nan, dtype=np.float64)
+        self._timestamps = np.zeros(capacity, dtype=np.float64)
+        self._lock = threading.Lock()
+
+    def _slot(self, courier_id: int) -> int:
+        slot = self._slots.get(courier_id)
+        if slot is None:
+            slot = len(self._slots)
+            if slot == len(self._timestamps):
+                self._coords = np.concatenate(
+                    [self._coords, np.full_like(self._coords, np.nan)]
+                )
+                self._timestamps = np.concatenate(
+                    [self._timestamps, np.zeros_like(self._timestamps)]
+                )
+            self._slots[courier_id] = slot
+        return slot
+
+    def update(self, courier_id: int, lat: float, lon: float, timestamp: float):
+        """Запоминает точку, если она не старше уже известной."""
+        with self._lock:
+            slot = self._slot(courier_id)
+            if timestamp >= self._timestamps[slot]:
+                self._coords[slot] = (lat, lon)
+                self._timestamps[slot] = timestamp
+
+    def get(self, courier_id: int) -> dict | None:
+        with self._lock:
+            slot = self._slots.get(courier_id)
+            if slot is None:
+                return None
+            lat, lon = self._coords[slot]
+            timestamp = self._timestamps[slot]
+        return {
+            'lat': float(lat),
+            'lon': float(lon),
+            'at': datetime.fromtimestamp(timestamp, tz=dt_timezone.utc),
+        }
+
+
+class LocationWriter:
+    """Фоновая пачечная запись точек в БД."""
+
+    def __init__(self):
+        self._queue: queue.Queue = queue.Queue(maxsize=MAX_PENDING_POINTS)
+        self._thread: threading.Thread | None = None
+        self._thread_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def submit(self, points) -> bool:
+        """
+        points — [(courier_id, lat, lon, accuracy, recorded_at, received_at), ...].
+        Возвращает False, если очередь переполнена (БД не успевает).
+        """
+        self._ensure_thread()
+        for index, point in enumerate(points):
+            try:
+                self._queue.put_nowait(point)
+            except queue.Full:
+                logger.warning('Location queue is full, dropped %d points', len(points) - index)
+                return False
+        return True
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run,
+                name='courier-location-writer',
+                daemon=True,
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            deadline = time.monotonic() + FLUSH_INTERVAL
+            while self._queue.qsize() < FLUSH_SIZE and time.monotonic() < deadline:
+                time.sleep(0.05)
+            try:
+                close_old_connections()
+                self.flush()
+            except Exception:
+                logger.exception('Failed to write courier locations')
+
+    def flush(self) -> int:
+        """Записывает всё, что накопилось в очереди. Возвращает число точек."""
+        with self._flush_lock:
+            batch = []
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return 0
+            try:
+                _write_points(batch)
+            except IntegrityError:
+                # профиль курьера удалён, пока его точки ждали записи —
+                # не теряем из-за него точки остальных
+                existing = set(
+                    CourierProfile.objects
+                    .filter(pk__in={point[0] for point in batch})
+                    .values_list('id', flat=True)
+                )
+                batch = [point for point in batch if point[0] in existing]
+                if batch:
+                    _write_points(batch)
+            return len(batch)
+
+
+@transaction.atomic
+def _write_points(batch):
+    CourierLocation.objects.bulk_create(
+        [
+            CourierLocation(
+                courier_id=courier_id,
+                lat=lat,
+                lon=lon,
+                accuracy=accuracy,
+                recorded_at=recorded_at,
+                received_at=received_at,
+            )
+            for courier_id, lat, lon, accuracy, recorded_at, received_at in batch
+        ],
+        batch_size=FLUSH_SIZE,
+    )
+
+    latest = {}
+    for courier_id, lat, lon, _, recorded_at, _ in batch:
+        current = latest.get(courier_id)
+        if current is None or recorded_at >= current[2]:
+            latest[courier_id] = (lat, lon, recorded_at)
+
+    table = CourierProfile._meta.db_table
+    values = ', '.join(['(%s, %s, %s, %s)'] * len(latest))
+    params = []
+    for courier_id, (lat, lon, recorded_at) in latest.items():
+        params += [courier_id, lat, lon, recorded_at]
+    with connection.cursor() as cursor:
+        # точки из разных пачек могут прийти не по порядку — старая не затирает новую
+        cursor.execute(
+            f'UPDATE {table} AS c '
+            f'SET last_lat = v.lat, last_lon = v.lon, last_location_at = v.at '
+            f'FROM (VALUES {values}) AS v (id, lat, lon, at) '
+            f'WHERE c.id = v.id '
+            f'AND (c.last_location_at IS NULL OR c.last_location_at <= v.at)',
+            params,
+        )
+
+
+latest_positions = LatestPositions()
+location_writer = LocationWriter()
+
+# при штатной остановке процесса дописываем хвост очереди
+atexit.register(location_writer.flush)
+
+
+def parse_points(raw_points):
+    """
+    [{"lat": .., "lon": .., "ts": <unix-время в секундах или мс>, "accuracy": ..}, ...]
+    -> [(lat, lon, accuracy, recorded_at), ...]. Бросает ValueError с описанием.
+    """
+    if not isinstance(raw_points, list) or not raw_points:
+        raise ValueError('points must be a non-empty list')
+    if len(raw_points) > MAX_POINTS_PER_REQUEST:
+        raise ValueError(f'At most {MAX_POINTS_PER_REQUEST} points per request')
+
+    now = time.time()
+    parsed = []
+    for index, raw in enumerate(raw_points):
+        try:
+            lat = float(raw['lat'])
+            lon = float(raw['lon'])
+            ts = float(raw['ts'])
+            accuracy = raw.get('accuracy')
+            accuracy = float(accuracy) if accuracy is not None else None
+        except (TypeError, KeyError, ValueError):
+            raise ValueError(f'points[{index}]: lat, lon and ts are required numbers')
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise ValueError(f'points[{index}]: coordinates out of range')
+        if not math.isfinite(ts):
+            raise ValueError(f'points[{index}]: invalid ts')
+        if ts > 1e11:
+            ts /= 1000  # миллисекунды
+        # часы телефона могут спешить — будущее время обрезаем до текущего
+        ts = min(ts, now)
+        if ts <= 0:
+            raise ValueError(f'points[{index}]: invalid ts')
+        parsed.append(
+            (lat, lon, accuracy, datetime.fromtimestamp(ts, tz=dt_timezone.utc))
+        )
+    return parsed
+
+
+def ingest(courier_id: int, points) -> bool:
+    """points — результат parse_points. False — очередь записи переполнена."""
+    received_at = timezone.now()
+    for lat, lon, _, recorded_at in points:
+        latest_positions.update(courier_id, lat, lon, recorded_at.timestamp())
+    return location_writer.submit(
+        [
+            (courier_id, lat, lon, accuracy, recorded_at, received_at)
+            for lat, lon, accuracy, recorded_at in points
+        ]
+    )
+
+
+def courier_position(courier_id: int) -> dict | None:
+    """
+    Последняя позиция: свежая точка из памяти этой ноды, иначе более новая
+    из памяти и CourierProfile.
+    """
+    position = latest_positions.get(courier_id)
+    if position is not None and time.time() - position['at'].timestamp() < LOCAL_POSITION_MAX_AGE:
+        return position
+    row = (
+        CourierProfile.objects
+        .filter(pk=courier_id, last_location_at__isnull=False)
+        .values('last_lat', 'last_lon', 'last_location_at')
+        .first()
+    )
+    if row is None or (position is not None and position['at'] >= row['last_location_at']):
+        return position
+    return {'lat': row['last_lat'], 'lon': row['last_lon'], 'at': row['last_location_at']}
+
+
+def fresh_courier_position(courier_id: int) -> tuple[float, float] | None:
+    """
+    (lat, lon) курьера, если точка не старше LOCATION_MAX_AGE: старая точка
+    ничего не говорит о том, где курьер сейчас.
+    """
+    position = courier_position(courier_id)
+    if position is None or position['at'] < timezone.now() - LOCATION_MAX_AGE:
+        return None
+    return position['lat'], position['lon']
@@ -0,0 +1,93 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from delivery.dispatch import (
+    VEHICLE_CAPACITY,
+    VEHICLE_COST,
+    DispatchBatch,
+    build_cost_matrix,
+    linear_sum_assignment,
+    solve_assignment,
+)
+from delivery.models import CourierProfile
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет диспетчер на синтетических данных: построение матрицы '
+        'стоимостей и решение задачи о назначениях для N задач и M курьеров. '
+        'БД не используется.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=3000)
+        parser.add_argument('--couriers', type=int, default=3000)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--no-coords',
+            action='store_true',
+            help='Без координат (стоимость без расстояния)',
+        )
+
+    def handle(self, *args, **options):
+        if options['tasks'] <= 0 or options['couriers'] <= 0 or options['repeat'] <= 0:
+            raise CommandError('--tasks, --couriers and --repeat must be positive')
+
+        batch = self._batch(options)
+        methods = ['greedy']
+        if linear_sum_assignment is not None:
+            methods.append('optimal')
+        else:
+            self.stdout.write('scipy is not installed, only greedy is measured')
+
+        self.stdout.write(
+            f'{options["tasks"]} tasks x {options["couriers"]} couriers, '
+            f'best of {options["repeat"]}'
+        )
+
+        build_time, cost = self._best(options['repeat'], lambda: build_cost_matrix(batch))
+        self.stdout.write(f'  cost matrix       {build_time * 1000:9.1f} ms')
+
+        for method in methods:
+            solve_time, (rows, cols) = self._best(
+                options['repeat'], lambda: solve_assignment(cost, method)
+            )
+            total = cost[rows, cols].sum()
+            self.stdout.write(
+                f'  {method:<17} {solve_time * 1000:9.1f} ms  '
+                f'assigned {len(rows)}, total cost {total:.1f}'
+            )
+
+    @staticmethod
+    def _best(repeat: int, func):
+        best, result = None, None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    @staticmethod
+    def _batch(options) -> DispatchBatch:
+        rng = np.random.default_rng(options['seed'])
+        n_tasks, n_couriers = options['tasks'], options['couriers']
+        vehicles = rng.choice(list(CourierProfile.VehicleTypes.values), size=n_couriers)
+
+        batch = DispatchBatch(
+            task_ids=np.arange(n_tasks, dtype=np.int64),
+            wait_minutes=rng.exponential(8.0, size=n_tasks),
+            order_totals=rng.lognormal(7.3, 0.6, size=n_tasks).round(2),
+            courier_ids=np.arange(n_couriers, dtype=np.int64),
+            capacities=np.array([VEHICLE_CAPACITY[v] for v in vehicles], dtype=np.float64),
+            vehicle_costs=np.array([VEHICLE_COST[v] for v in vehicles], dtype=np.float64),
+        )
+        if not options['no_coords']:
+            # город ~30 x 30 км
+            center = np.array([55.75, 37.62])
+            batch.task_points = center + rng.uniform(-0.14, 0.14, size=(n_tasks, 2))
+            batch.courier_points = center + rng.uniform(-0.14, 0.14, size=(n_couriers, 2))
+        return batch
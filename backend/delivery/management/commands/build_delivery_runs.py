@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from delivery.runs import build_runs, release_stale_runs
+
+
+class Command(BaseCommand):
+    help = (
+        'Собирает свободные офферы с близкими точками забора и доставки в рейсы '
+        'и распускает невостребованные. dispatch_couriers делает это сам '
+        'перед каждым назначением; команда — для ручного запуска и cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help='Повторять каждые N секунд (по умолчанию — один проход)',
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        while True:
+            started = time.monotonic()
+            released = release_stale_runs()
+            runs = build_runs()
+            elapsed = time.monotonic() - started
+            if runs or released or options['verbosity'] > 1:
+                orders = sum(1 for run in runs for stop in run.stops if stop['type'] == 'pickup')
+                self.stdout.write(
+                    f'Built {len(runs)} runs ({orders} orders), released {released} '
+                    f'in {elapsed * 1000:.0f} ms'
+                )
+            if interval <= 0:
+                return
+            time.sleep(max(interval - elapsed, 0))
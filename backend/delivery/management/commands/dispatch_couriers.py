@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from delivery.dispatch import dispatch_once
+from delivery.runs import build_runs, release_stale_runs
+
+
+class Command(BaseCommand):
+    help = (
+        'Собирает свободные задачи в рейсы и пакетно назначает оставшиеся '
+        'свободным курьерам. Запускается по расписанию или, с --interval, как постоянный процесс.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help='Повторять каждые N секунд (по умолчанию — один проход)',
+        )
+        parser.add_argument(
+            '--method',
+            choices=('optimal', 'greedy'),
+            default=None,
+            help='Алгоритм назначения (по умолчанию optimal, если установлен scipy)',
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        while True:
+            started = time.monotonic()
+            # рейсы — до назначения: иначе диспетчер разберёт по одной задачи,
+            # которые можно было объединить
+            released = release_stale_runs()
+            runs = build_runs()
+            assigned = dispatch_once(options['method'])
+            elapsed = time.monotonic() - started
+            if runs or released or assigned or options['verbosity'] > 1:
+                self.stdout.write(
+                    f'Built {len(runs)} runs, released {released}, '
+                    f'assigned {assigned} tasks in {elapsed * 1000:.0f} ms'
+                )
+            if interval <= 0:
+                return
+            # тик фиксированной длины: время прохода вычитается из паузы
+            time.sleep(max(interval - elapsed, 0))
@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from delivery.eta import ETA_HISTORY_DAYS, fit_snapshot
+from delivery.models import DeliveryEtaModel
+
+
+class Command(BaseCommand):
+    help = (
+        'Обучает модель ETA по истории завершённых доставок и сохраняет снимок; '
+        'веб-процессы подхватывают его в течение нескольких минут. '
+        'С --interval работает как постоянный процесс.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=ETA_HISTORY_DAYS,
+            help=f'Глубина истории в днях (по умолчанию {ETA_HISTORY_DAYS})',
+        )
+        parser.add_argument(
+            '--keep',
+            type=int,
+            default=10,
+            help='Сколько последних снимков оставить',
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=0,
+            help='Переобучать каждые N секунд (по умолчанию — один проход)',
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        while True:
+            self.fit_once(options['days'], options['keep'])
+            if interval <= 0:
+                return
+            time.sleep(interval)
+
+    def fit_once(self, days: int, keep: int):
+        started = time.monotonic()
+        snapshot = fit_snapshot(days)
+        if snapshot is None:
+            self.stdout.write('No completed deliveries with full timings, nothing to fit')
+            return
+
+        stale = (
+            DeliveryEtaModel.objects
+            .order_by('-id')
+            .values_list('id', flat=True)[max(keep, 1):]
+        )
+        DeliveryEtaModel.objects.filter(pk__in=list(stale)).delete()
+
+        self.stdout.write(
+            f'Fitted on {snapshot.samples} deliveries: {len(snapshot.table)} groups '
+            f'in {time.monotonic() - started:.2f} s'
+        )
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-17 06:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0003_courierapplication'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deliverytask',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
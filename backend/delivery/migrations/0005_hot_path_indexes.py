@@ -0,0 +1,29 @@
+# Generated by Django 6.0 on 2026-10-17 06:11
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # индексы на горячих таблицах строим без блокировки записи
+    atomic = False
+
+    dependencies = [
+        ('delivery', '0004_deliverytask_updated_at'),
+        ('orders', '0004_order_updated_at'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='deliverytask',
+            index=models.Index(condition=models.Q(('courier__isnull', True), ('status', 'PENDING')), fields=['order'], name='task_open_offer_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='deliverytask',
+            index=models.Index(condition=models.Q(('status__in', ['ASSIGNED', 'IN_PROGRESS'])), fields=['courier', 'status'], name='task_courier_active_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='deliverytask',
+            index=models.Index(fields=['courier', 'status', '-assigned_at'], name='task_courier_list_idx'),
+        ),
+    ]
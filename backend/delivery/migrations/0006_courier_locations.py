@@ -0,0 +1,44 @@
+# Generated by Django 6.0 on 2026-10-17 06:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0005_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='courierprofile',
+            name='last_lat',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='courierprofile',
+            name='last_location_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='courierprofile',
+            name='last_lon',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='CourierLocation',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('lat', models.FloatField()),
+                ('lon', models.FloatField()),
+                ('accuracy', models.FloatField(blank=True, null=True)),
+                ('recorded_at', models.DateTimeField()),
+                ('received_at', models.DateTimeField()),
+                ('courier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='locations', to='delivery.courierprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['courier', '-recorded_at'], name='courier_location_track_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 6.0 on 2026-10-17 06:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0006_courier_locations'),
+        ('orders', '0007_coordinates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deliverytask',
+            name='cell_x',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='deliverytask',
+            name='cell_y',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='deliverytask',
+            index=models.Index(condition=models.Q(('courier__isnull', True), ('status', 'PENDING')), fields=['cell_y', 'cell_x'], name='task_open_offer_cell_idx'),
+        ),
+    ]
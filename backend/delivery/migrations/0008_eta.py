@@ -0,0 +1,32 @@
+# Generated by Django 6.0 on 2026-10-17 06:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0007_coordinates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliveryEtaModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fitted_at', models.DateTimeField()),
+                ('samples', models.IntegerField()),
+                ('table', models.JSONField(default=list)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='deliverytask',
+            name='created_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='deliverytask',
+            name='picked_up_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
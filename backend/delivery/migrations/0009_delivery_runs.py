@@ -0,0 +1,35 @@
+# Generated by Django 6.0 on 2026-10-17 06:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0008_eta'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliveryRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('OPEN', 'Open'), ('ASSIGNED', 'Assigned'), ('DONE', 'Done')], default='OPEN', max_length=20)),
+                ('stops', models.JSONField(default=list)),
+                ('distance_km', models.FloatField(default=0)),
+                ('created_at', models.DateTimeField()),
+                ('assigned_at', models.DateTimeField(blank=True, null=True)),
+                ('courier', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='runs', to='delivery.courierprofile')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='deliverytask',
+            name='run',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tasks', to='delivery.deliveryrun'),
+        ),
+        migrations.AddIndex(
+            model_name='deliveryrun',
+            index=models.Index(condition=models.Q(('status', 'OPEN')), fields=['created_at'], name='run_open_idx'),
+        ),
+    ]
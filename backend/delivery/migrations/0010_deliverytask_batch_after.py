@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-17 07:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0009_delivery_runs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deliverytask',
+            name='batch_after',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
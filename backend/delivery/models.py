@@ -19,11 +19,38 @@ class CourierProfile(models.Model):
         default=VehicleTypes.FOOT,
     )
     is_active = models.BooleanField(default=True)
+    # последняя известная позиция; пишется пачками из delivery.locations
+    last_lat = models.FloatField(null=True, blank=True)
+    last_lon = models.FloatField(null=True, blank=True)
+    last_location_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f'Courier {self.user.username}'
 
 
+class CourierLocation(models.Model):
+    """Сырые GPS-точки курьера (только добавление, пачками)."""
+    id = models.BigAutoField(primary_key=True)
+    courier = models.ForeignKey(
+        CourierProfile,
+        on_delete=models.CASCADE,
+        related_name='locations',
+    )
+    lat = models.FloatField()
+    lon = models.FloatField()
+    accuracy = models.FloatField(null=True, blank=True)
+    recorded_at = models.DateTimeField()
+    received_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['courier', '-recorded_at'], name='courier_location_track_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.courier_id} @ {self.lat:.5f},{self.lon:.5f}'
+
+
 class DeliveryTask(models.Model):
     class Status(models.TextChoices):
         PENDING = 'PENDING', 'Pending'
@@ -31,6 +58,21 @@ class DeliveryTask(models.Model):
         IN_PROGRESS = 'IN_PROGRESS', 'In progress'
         DONE = 'DONE', 'Done'
 
+    # PENDING -> ASSIGNED выполняется только через назначение курьера
+    TRANSITIONS = {
+        Status.PENDING: (Status.ASSIGNED,),
+        Status.ASSIGNED: (Status.IN_PROGRESS,),
+        Status.IN_PROGRESS: (Status.DONE,),
+        Status.DONE: (),
+    }
+    # колонка, в которой отмечается время перехода в статус
+    STATUS_TIMESTAMPS = {
+        Status.PENDING: 'created_at',
+        Status.ASSIGNED: 'assigned_at',
+        Status.IN_PROGRESS: 'picked_up_at',
+        Status.DONE: 'completed_at',
+    }
+
     order = models.OneToOneField(
         Order,
         on_delete=models.CASCADE,
@@ -48,12 +90,115 @@ class DeliveryTask(models.Model):
         choices=Status.choices,
         default=Status.PENDING,
     )
+    created_at = models.DateTimeField(null=True, blank=True)
     assigned_at = models.DateTimeField(null=True, blank=True)
+    picked_up_at = models.DateTimeField(null=True, blank=True)
     completed_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # ячейка сетки точки забора (delivery.geo), None — у ресторана нет координат
+    cell_y = models.IntegerField(null=True, blank=True)
+    cell_x = models.IntegerField(null=True, blank=True)
+    # задача входит в рейс из нескольких заказов (delivery.runs)
+    run = models.ForeignKey(
+        'DeliveryRun',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='tasks',
+    )
+    # задача из распущенного рейса: до этого момента в новый рейс не собирается
+    batch_after = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # лента офферов: только свободные задачи, индекс остаётся маленьким
+            models.Index(
+                fields=['order'],
+                name='task_open_offer_idx',
+                condition=models.Q(status='PENDING', courier__isnull=True),
+            ),
+            # офферы рядом с курьером: диапазон ячеек сетки
+            models.Index(
+                fields=['cell_y', 'cell_x'],
+                name='task_open_offer_cell_idx',
+                condition=models.Q(status='PENDING', courier__isnull=True),
+            ),
+            # активные задачи курьера (проверка "нет ли уже активной задачи")
+            models.Index(
+                fields=['courier', 'status'],
+                name='task_courier_active_idx',
+                condition=models.Q(status__in=['ASSIGNED', 'IN_PROGRESS']),
+            ),
+            # список задач курьера
+            models.Index(
+                fields=['courier', 'status', '-assigned_at'],
+                name='task_courier_list_idx',
+            ),
+        ]
 
     def __str__(self):
         return f'Delivery for order #{self.order.id} ({self.status})'
 
+    @classmethod
+    def sources_for(cls, status: str) -> list[str]:
+        """Статусы, из которых разрешён переход в status."""
+        return [source for source, targets in cls.TRANSITIONS.items() if status in targets]
+
+
+class DeliveryRun(models.Model):
+    """
+    Рейс: несколько заказов с близкими точками забора и доставки,
+    которые один курьер берёт целиком. stops — упорядоченный маршрут
+    [{"type": "pickup"|"dropoff", "task_id", "order_id", "lat", "lon"}, ...].
+    """
+    class Status(models.TextChoices):
+        OPEN = 'OPEN', 'Open'
+        ASSIGNED = 'ASSIGNED', 'Assigned'
+        DONE = 'DONE', 'Done'
+
+    courier = models.ForeignKey(
+        CourierProfile,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='runs',
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=Status.choices,
+        default=Status.OPEN,
+    )
+    stops = models.JSONField(default=list)
+    distance_km = models.FloatField(default=0)
+    created_at = models.DateTimeField()
+    assigned_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['created_at'],
+                name='run_open_idx',
+                condition=models.Q(status='OPEN'),
+            ),
+        ]
+
+    def __str__(self):
+        return f'Run #{self.id} ({self.status})'
+
+
+class DeliveryEtaModel(models.Model):
+    """
+    Снимок модели ETA, обученной командой fit_eta_model (delivery/eta.py).
+    table — строки [restaurant_id, hour, vehicle_type, секунды до назначения,
+    до забора, до вручения, число доставок]; None в ключе — «любой».
+    """
+    fitted_at = models.DateTimeField()
+    samples = models.IntegerField()
+    table = models.JSONField(default=list)
+
+    def __str__(self):
+        return f'ETA model {self.fitted_at:%Y-%m-%d %H:%M} ({self.samples} deliveries)'
+
 
 class CourierApplication(models.Model):
     class Status(models.TextChoices):
@@ -0,0 +1,74 @@
+"""
+Порядок точек маршрута рейса: ближайший сосед + 2-opt.
+
+Точек в рейсе немного (DELIVERY_RUN_MAX_ORDERS заказов — вдвое больше
+остановок), поэтому матрица расстояний строится целиком, а 2-opt
+перебирает все пары рёбер до тех пор, пока маршрут укорачивается.
+"""
+import numpy as np
+
+_EARTH_RADIUS_KM = 6371.0
+
+
+def distance_matrix(points: np.ndarray) -> np.ndarray:
+    """(N, 2) широта/долгота в градусах -> (N, N) расстояний в км."""
+    lat, lon = np.radians(points).T
+    dx = (lon[None, :] - lon[:, None]) * np.cos((lat[None, :] + lat[:, None]) / 2)
+    dy = lat[None, :] - lat[:, None]
+    return _EARTH_RADIUS_KM * np.hypot(dx, dy)
+
+
+def distances_from(point, points: np.ndarray) -> np.ndarray:
+    """Расстояния в км от одной точки до (N, 2) точек."""
+    lat, lon = np.radians(point)
+    lats, lons = np.radians(points).T
+    dx = (lons - lon) * np.cos((lats + lat) / 2)
+    dy = lats - lat
+    return _EARTH_RADIUS_KM * np.hypot(dx, dy)
+
+
+def path_length(distances: np.ndarray, order) -> float:
+    order = np.asarray(order)
+    return float(distances[order[:-1], order[1:]].sum())
+
+
+def _nearest_neighbour(distances: np.ndarray, start: int) -> list[int]:
+    visited = np.zeros(len(distances), dtype=bool)
+    order = [start]
+    visited[start] = True
+    for _ in range(len(distances) - 1):
+        row = np.where(visited, np.inf, distances[order[-1]])
+        nxt = int(np.argmin(row))
+        order.append(nxt)
+        visited[nxt] = True
+    return order
+
+
+def _two_opt(distances: np.ndarray, order: list[int]) -> list[int]:
+    """
+    Улучшает открытый путь с фиксированным началом: разворачивает отрезок
+    order[i..j], если это укорачивает путь.
+    """
+    n = len(order)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, n - 1):
+            for j in range(i + 1, n):
+                a, b = order[i - 1], order[i]
+                c = order[j]
+                d = order[j + 1] if j + 1 < n else None
+                before = distances[a, b] + (distances[c, d] if d is not None else 0.0)
+                after = distances[a, c] + (distances[b, d] if d is not None else 0.0)
+                if after < before - 1e-9:
+                    order[i:j + 1] = order[i:j + 1][::-1]
+                    improved = True
+    return order
+
+
+def plan_path(points: np.ndarray, start: int = 0) -> list[int]:
+    """Порядок обхода точек, начиная с start, без возврата в начало."""
+    if len(points) <= 2:
+        return [start] + [index for index in range(len(points)) if index != start]
+    distances = distance_matrix(points)
+    return _two_opt(distances, _nearest_neighbour(distances, start))
@@ -0,0 +1,272 @@
+"""
+Рейсы из нескольких заказов (пакетная доставка).
+
+Рейсы собираются из свободных задач доставки (DeliveryTask PENDING без
+курьера), а не из заказов в статусе READY: задача и оффер появляются
+только при переходе заказа в ON_DELIVERY (orders/status.py), и до этого
+курьеру нечего назначать. Поэтому «готовый к выдаче заказ» здесь — это
+открытая задача доставки.
+
+build_runs раз в тик dispatch_couriers — до назначения, чтобы диспетчер
+не разобрал задачи по одной раньше, чем их объединят, — собирает свободные
+офферы с известными координатами ресторана и точки доставки в рейсы: к самому
+старому заказу добавляются заказы, у которых и ресторан, и адрес доставки
+рядом с его рестораном и адресом, — до DELIVERY_RUN_MAX_ORDERS заказов.
+Маршрут рейса — сначала все точки забора, затем все точки доставки,
+каждый участок упорядочен эвристикой ближайшего соседа с 2-opt
+(delivery/routing.py).
+
+Задача, попавшая в рейс, пропадает из одиночных офферов, claim-next и
+диспетчера. Курьер забирает рейс целиком (claim_run): рейс и все его
+задачи назначаются в одной транзакции. Невостребованный рейс через
+DELIVERY_RUN_OPEN_TTL распускается, и его заказы снова идут по одному:
+ещё DELIVERY_RUN_REBATCH_COOLDOWN они не попадают в новые рейсы, иначе
+следующий же тик собрал бы из них тот же рейс.
+"""
+from datetime import datetime, timedelta
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Case, Exists, F, OuterRef, Q, Value, When
+from django.utils import timezone
+
+from realtime.hub import publish_on_commit
+from .claims import publish_assigned
+from .models import DeliveryRun, DeliveryTask
+from .routing import distance_matrix, distances_from, path_length, plan_path
+
+DELIVERY_RUN_MAX_ORDERS = 4
+DELIVERY_RUN_PICKUP_RADIUS_KM = 1.0
+DELIVERY_RUN_DROPOFF_RADIUS_KM = 3.0
+DELIVERY_RUN_OPEN_TTL = timedelta(minutes=5)
+DELIVERY_RUN_REBATCH_COOLDOWN = timedelta(minutes=10)
+# сколько самых старых офферов рассматривается за тик
+DELIVERY_RUN_MAX_CANDIDATES = 2000
+
+ACTIVE_TASK_STATUSES = (DeliveryTask.Status.ASSIGNED, DeliveryTask.Status.IN_PROGRESS)
+
+
+def release_stale_runs(now: datetime | None = None) -> int:
+    """Распускает невостребованные рейсы старше DELIVERY_RUN_OPEN_TTL."""
+    now = now or timezone.now()
+    with transaction.atomic():
+        stale = list(
+            DeliveryRun.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=DeliveryRun.Status.OPEN, created_at__lt=now - DELIVERY_RUN_OPEN_TTL)
+            .values_list('id', flat=True)
+        )
+        if not stale:
+            return 0
+        DeliveryTask.objects.filter(run_id__in=stale).update(
+            run=None,
+            batch_after=now + DELIVERY_RUN_REBATCH_COOLDOWN,
+            updated_at=now,
+        )
+        DeliveryRun.objects.filter(pk__in=stale).delete()
+    publish_on_commit(['offers'], {'type': 'run.released', 'run_ids': stale})
+    return len(stale)
+
+
+def _group(pickups: np.ndarray, dropoffs: np.ndarray) -> list[list[int]]:
+    """Индексы офферов по рейсам; офферы отсортированы от старых к новым."""
+    used = np.zeros(len(pickups), dtype=bool)
+    groups = []
+    for seed in range(len(pickups)):
+        if used[seed]:
+            continue
+        pickup_distance = distances_from(pickups[seed], pickups)
+        dropoff_distance = distances_from(dropoffs[seed], dropoffs)
+        near = (
+            ~used
+            & (pickup_distance <= DELIVERY_RUN_PICKUP_RADIUS_KM)
+            & (dropoff_distance <= DELIVERY_RUN_DROPOFF_RADIUS_KM)
+        )
+        near[seed] = False
+        candidates = np.flatnonzero(near)
+        if not len(candidates):
+            continue
+        closest = np.argsort(
+            pickup_distance[candidates] + dropoff_distance[candidates],
+            kind='stable',
+        )
+        members = [seed, *candidates[closest[:DELIVERY_RUN_MAX_ORDERS - 1]].tolist()]
+        used[members] = True
+        groups.append(members)
+    return groups
+
+
+def _route(rows: list[dict]) -> tuple[list[dict], float]:
+    """Упорядоченные остановки рейса и длина маршрута в км."""
+    pickups = np.array([(row['pickup_lat'], row['pickup_lon']) for row in rows])
+    dropoffs = np.array([(row['dropoff_lat'], row['dropoff_lon']) for row in rows])
+
+    # забор начинается с самого старого заказа (он первый в rows)
+    pickup_order = plan_path(pickups, start=0)
+    last_pickup = pickups[pickup_order[-1]]
+    # доставка продолжается от последнего ресторана: он — нулевая точка пути
+    dropoff_path = plan_path(np.vstack([last_pickup, dropoffs]), start=0)
+    dropoff_order = [index - 1 for index in dropoff_path[1:]]
+
+    stops = []
+    for kind, order, points in (
+        ('pickup', pickup_order, pickups),
+        ('dropoff', dropoff_order, dropoffs),
+    ):
+        for index in order:
+            stops.append(
+                {
+                    'type': kind,
+                    'task_id': rows[index]['id'],
+                    'order_id': rows[index]['order_id'],
+                    'restaurant_id': rows[index]['restaurant_id'],
+                    'lat': float(points[index][0]),
+                    'lon': float(points[index][1]),
+                }
+            )
+
+    route_points = np.array([(stop['lat'], stop['lon']) for stop in stops])
+    length = path_length(distance_matrix(route_points), range(len(stops)))
+    return stops, round(length, 2)
+
+
+def build_runs(now: datetime | None = None) -> list[DeliveryRun]:
+    """Собирает новые рейсы из свободных офферов. Возвращает созданные рейсы."""
+    now = now or timezone.now()
+    with transaction.atomic():
+        # офферы блокируются на время сборки; claim-next их просто пропускает
+        rows = list(
+            DeliveryTask.objects
+            .select_for_update(skip_locked=True, of=('self',))
+            .filter(
+                status=DeliveryTask.Status.PENDING,
+                courier__isnull=True,
+                run__isnull=True,
+                order__restaurant__lat__isnull=False,
+                order__restaurant__lon__isnull=False,
+                order__delivery_lat__isnull=False,
+                order__delivery_lon__isnull=False,
+            )
+            .filter(Q(batch_after__isnull=True) | Q(batch_after__lte=now))
+            .order_by('order_id')
+            .values(
+                'id',
+                'order_id',
+                restaurant_id=F('order__restaurant_id'),
+                pickup_lat=F('order__restaurant__lat'),
+                pickup_lon=F('order__restaurant__lon'),
+                dropoff_lat=F('order__delivery_lat'),
+                dropoff_lon=F('order__delivery_lon'),
+            )
+            [:DELIVERY_RUN_MAX_CANDIDATES]
+        )
+        if len(rows) < 2:
+            return []
+
+        groups = _group(
+            np.array([(row['pickup_lat'], row['pickup_lon']) for row in rows]),
+            np.array([(row['dropoff_lat'], row['dropoff_lon']) for row in rows]),
+        )
+        if not groups:
+            return []
+
+        runs = []
+        for members in groups:
+            stops, length = _route([rows[index] for index in members])
+            runs.append(DeliveryRun(stops=stops, distance_km=length, created_at=now))
+        runs = DeliveryRun.objects.bulk_create(runs)
+
+        # все задачи всех рейсов — одним UPDATE
+        DeliveryTask.objects.filter(
+            pk__in=[rows[index]['id'] for members in groups for index in members],
+        ).update(
+            run_id=Case(
+                *(
+                    When(pk=rows[index]['id'], then=Value(run.id))
+                    for run, members in zip(runs, groups)
+                    for index in members
+                ),
+            ),
+            updated_at=now,
+        )
+
+    publish_on_commit(
+        ['offers'],
+        {'type': 'run.created', 'run_ids': [run.id for run in runs]},
+    )
+    return runs
+
+
+def claim_run(run_id: int, courier_id: int) -> list[tuple] | None:
+    """
+    Назначает курьеру рейс целиком. Возвращает назначенные задачи
+    [(task_id, order_id, courier_id, restaurant_id), ...] или None, если рейс
+    уже взят, распущен, или у курьера есть активная задача.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        # UPDATE рейса блокирует его строку: параллельный захват того же рейса
+        # дождётся коммита и увидит, что рейс уже не OPEN
+        claimed = (
+            DeliveryRun.objects
+            .filter(pk=run_id, status=DeliveryRun.Status.OPEN)
+            .filter(
+                ~Exists(
+                    DeliveryTask.objects.filter(
+                        courier_id=courier_id,
+                        status__in=ACTIVE_TASK_STATUSES,
+                    )
+                )
+            )
+            .update(courier_id=courier_id, status=DeliveryRun.Status.ASSIGNED, assigned_at=now)
+        )
+        if not claimed:
+            return None
+
+        tasks = DeliveryTask.objects.filter(
+            run_id=run_id,
+            status=DeliveryTask.Status.PENDING,
+            courier__isnull=True,
+        )
+        assigned = list(tasks.values_list('id', 'order_id', 'order__restaurant_id'))
+        tasks.update(
+            courier_id=courier_id,
+            status=DeliveryTask.Status.ASSIGNED,
+            assigned_at=now,
+            updated_at=now,
+        )
+        assigned = [
+            (task_id, order_id, courier_id, restaurant_id)
+            for task_id, order_id, restaurant_id in assigned
+        ]
+        publish_assigned(assigned)
+    return assigned
+
+
+def complete_run_if_done(run_id: int) -> bool:
+    """
+    Закрывает рейс, когда доставлены все его задачи. Строка рейса
+    блокируется до проверки: две параллельно завершённые последние задачи
+    проверяют по очереди, и вторая уже видит закоммиченную первую.
+    """
+    with transaction.atomic():
+        locked = (
+            DeliveryRun.objects
+            .select_for_update()
+            .filter(pk=run_id, status=DeliveryRun.Status.ASSIGNED)
+            .exists()
+        )
+        if not locked:
+            return False
+        return bool(
+            DeliveryRun.objects
+            .filter(pk=run_id)
+            .exclude(
+                Exists(
+                    DeliveryTask.objects
+                    .filter(run_id=OuterRef('pk'))
+                    .exclude(status=DeliveryTask.Status.DONE)
+                )
+            )
+            .update(status=DeliveryRun.Status.DONE)
+        )
@@ -1,3 +1,693 @@
-from django.test import TestCase
+import asyncio
+import json
+import subprocess
+import sys
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connections
+from django.test import AsyncClient, TestCase, TransactionTestCase
+from django.utils import timezone
+
+from delivery import dispatch, eta, locations, runs
+from delivery.geo import grid_cell, refresh_open_offer_cells
+from delivery.claims import claim_next_task
+from delivery.models import CourierLocation, CourierProfile, DeliveryRun, DeliveryTask
+from orders.models import Order
+from orders.sync import encode_watermark
+from realtime.hub import PostgresNotifyBackend, get_backend
+from restaurants.models import Restaurant
+from users.models import User
+
+
+def _make_tasks(count: int) -> list[int]:
+    owner = User.objects.create_user('owner', password='x', role=User.Roles.RESTAURANT)
+    client = User.objects.create_user('client', password='x', role=User.Roles.CLIENT)
+    restaurant = Restaurant.objects.create(owner=owner, name='R', address='A')
+    orders = Order.objects.bulk_create(
+        [
+            Order(client=client, restaurant=restaurant, delivery_address='a', total_price=1)
+            for _ in range(count)
+        ]
+    )
+    tasks = DeliveryTask.objects.bulk_create([DeliveryTask(order=order) for order in orders])
+    return [task.id for task in tasks]
+
+
+def _make_courier(username: str) -> CourierProfile:
+    user = User.objects.create_user(username, password='x', role=User.Roles.COURIER)
+    return CourierProfile.objects.create(user=user)
+
+
+class ClaimNextTaskTests(TestCase):
+    def test_claims_oldest_free_task(self):
+        task_ids = _make_tasks(2)
+        courier = _make_courier('courier')
+
+        claimed = claim_next_task(courier.id)
+
+        self.assertEqual(claimed['id'], task_ids[0])
+        task = DeliveryTask.objects.get(pk=task_ids[0])
+        self.assertEqual(task.courier_id, courier.id)
+        self.assertEqual(task.status, DeliveryTask.Status.ASSIGNED)
+
+    def test_courier_with_active_task_gets_nothing(self):
+        _make_tasks(2)
+        courier = _make_courier('courier')
+        self.assertIsNotNone(claim_next_task(courier.id))
+
+        self.assertIsNone(claim_next_task(courier.id))
+        self.assertEqual(DeliveryTask.objects.filter(courier=courier).count(), 1)
+
+    def test_endpoint(self):
+        _make_tasks(1)
+        courier = _make_courier('courier')
+        self.client.force_login(courier.user)
+
+        response = self.client.post('/api/delivery/offers/claim-next/')
+        self.assertEqual(response.status_code, 200)
+        # активная задача уже есть
+        response = self.client.post('/api/delivery/offers/claim-next/')
+        self.assertEqual(response.status_code, 400)
+
+        other = _make_courier('other')
+        self.client.force_login(other.user)
+        response = self.client.post('/api/delivery/offers/claim-next/')
+        self.assertEqual(response.status_code, 404)
+
+
+class ClaimNextTaskConcurrencyTests(TransactionTestCase):
+    def test_each_task_is_claimed_once(self):
+        task_ids = _make_tasks(60)
+        couriers = [_make_courier(f'courier{index}').id for index in range(8)]
+        claimed = []
+        lock = threading.Lock()
+
+        def work(courier_id):
+            try:
+                while True:
+                    task = claim_next_task(courier_id)
+                    if task is None:
+                        return
+                    with lock:
+                        claimed.append(task['id'])
+                    # освобождаем курьера для следующей задачи
+                    DeliveryTask.objects.filter(pk=task['id']).update(status=DeliveryTask.Status.DONE)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=work, args=(courier_id,)) for courier_id in couriers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(claimed), sorted(task_ids))
+
+
+class DeliveryTaskStatusTests(TestCase):
+    def setUp(self):
+        self.task_id = _make_tasks(1)[0]
+        self.admin = User.objects.create_user('admin', password='x', role=User.Roles.ADMIN)
+        self.client.force_login(self.admin)
+
+    def change_status(self, status):
+        return self.client.patch(
+            f'/api/delivery/tasks/{self.task_id}/status/',
+            json.dumps({'status': status}),
+            content_type='application/json',
+        )
+
+    def test_admin_cannot_assign_without_courier(self):
+        response = self.change_status(DeliveryTask.Status.ASSIGNED)
+
+        self.assertEqual(response.status_code, 400)
+        task = DeliveryTask.objects.get(pk=self.task_id)
+        self.assertEqual(task.status, DeliveryTask.Status.PENDING)
+        self.assertIsNone(task.courier_id)
+
+    def test_transition_must_follow_table(self):
+        response = self.change_status(DeliveryTask.Status.DONE)
+
+        self.assertNotEqual(response.status_code, 200)
+        self.assertEqual(
+            DeliveryTask.objects.get(pk=self.task_id).status,
+            DeliveryTask.Status.PENDING,
+        )
+
+
+class CommitAssignmentsTests(TestCase):
+    def setUp(self):
+        self.task_ids = _make_tasks(3)
+        self.couriers = [_make_courier(f'courier{index}') for index in range(3)]
+
+    def test_applies_pairs_and_publishes_after_commit(self):
+        first, second = self.couriers[:2]
+        backend = mock.Mock()
+
+        with mock.patch('realtime.hub.get_backend', return_value=backend):
+            with self.captureOnCommitCallbacks(execute=True):
+                assigned = dispatch.commit_assignments(
+                    [(self.task_ids[0], first.id), (self.task_ids[1], second.id)]
+                )
+
+        self.assertEqual(
+            sorted((task_id, courier_id) for task_id, _, courier_id, _ in assigned),
+            [(self.task_ids[0], first.id), (self.task_ids[1], second.id)],
+        )
+        task = DeliveryTask.objects.get(pk=self.task_ids[0])
+        self.assertEqual((task.status, task.courier_id), (DeliveryTask.Status.ASSIGNED, first.id))
+        self.assertIsNotNone(task.assigned_at)
+        self.assertEqual(backend.publish.call_count, 2)
+
+    def test_skips_taken_tasks_and_busy_couriers(self):
+        busy, free, other = self.couriers
+        dispatch.commit_assignments([(self.task_ids[0], busy.id)])
+
+        assigned = dispatch.commit_assignments(
+            [(self.task_ids[0], free.id), (self.task_ids[1], busy.id), (self.task_ids[2], other.id)]
+        )
+
+        self.assertEqual([(row[0], row[2]) for row in assigned], [(self.task_ids[2], other.id)])
+        self.assertEqual(DeliveryTask.objects.get(pk=self.task_ids[0]).courier_id, busy.id)
+
+    def test_one_task_per_courier_within_a_batch(self):
+        courier = self.couriers[0]
+
+        assigned = dispatch.commit_assignments(
+            [(self.task_ids[0], courier.id), (self.task_ids[1], courier.id)]
+        )
+
+        self.assertEqual(len(assigned), 1)
+        self.assertEqual(DeliveryTask.objects.filter(courier=courier).count(), 1)
+
+    def test_dispatch_once_assigns_oldest_tasks_first(self):
+        CourierProfile.objects.filter(pk__in=[c.id for c in self.couriers[1:]]).update(is_active=False)
+
+        self.assertEqual(dispatch.dispatch_once(), 1)
+
+        self.assertEqual(
+            DeliveryTask.objects.get(courier=self.couriers[0]).id,
+            self.task_ids[0],
+        )
+
+
+class SolveAssignmentTests(TestCase):
+    cost = np.array([[4.0, 1.0, 3.0], [2.0, 0.0, 5.0], [3.0, 2.0, 2.0]])
+
+    def test_greedy_gives_each_task_a_distinct_courier(self):
+        rows, cols = dispatch.solve_assignment(self.cost.copy(), 'greedy')
+
+        self.assertEqual(sorted(rows.tolist()), [0, 1, 2])
+        self.assertEqual(sorted(cols.tolist()), [0, 1, 2])
+
+    def test_optimal_minimises_total_cost(self):
+        if dispatch.linear_sum_assignment is None:
+            self.skipTest('scipy is not installed')
+
+        rows, cols = dispatch.solve_assignment(self.cost.copy(), 'optimal')
+
+        self.assertEqual(self.cost[rows, cols].sum(), 5.0)
+
+    def test_empty_cost(self):
+        rows, cols = dispatch.solve_assignment(np.empty((0, 2)))
+
+        self.assertEqual((len(rows), len(cols)), (0, 0))
+
+
+@mock.patch.object(locations.location_writer, '_ensure_thread')
+class CourierLocationIngestTests(TestCase):
+    def setUp(self):
+        self.courier = _make_courier('courier')
+        self.client.force_login(self.courier.user)
+
+    def send(self, points):
+        return self.client.post(
+            '/api/delivery/courier/location/',
+            json.dumps({'points': points}),
+            content_type='application/json',
+        )
+
+    def test_points_are_written_in_background_batch(self, _):
+        now = time.time()
+        response = self.send(
+            [
+                {'lat': 55.75, 'lon': 37.61, 'ts': now - 2},
+                # миллисекунды тоже принимаются
+                {'lat': 55.76, 'lon': 37.62, 'ts': (now - 1) * 1000, 'accuracy': 5},
+            ]
+        )
+
+        self.assertEqual(response.status_code, 202)
+        self.assertFalse(CourierLocation.objects.exists())
+        self.assertEqual(locations.courier_position(self.courier.id)['lat'], 55.76)
+
+        self.assertEqual(locations.location_writer.flush(), 2)
+        self.assertEqual(CourierLocation.objects.filter(courier=self.courier).count(), 2)
+        self.courier.refresh_from_db()
+        self.assertEqual((self.courier.last_lat, self.courier.last_lon), (55.76, 37.62))
+
+    def test_late_batch_does_not_overwrite_newer_position(self, _):
+        now = time.time()
+        self.send([{'lat': 1.0, 'lon': 1.0, 'ts': now}])
+        locations.location_writer.flush()
+        self.send([{'lat': 2.0, 'lon': 2.0, 'ts': now - 60}])
+        locations.location_writer.flush()
+
+        self.courier.refresh_from_db()
+        self.assertEqual(self.courier.last_lat, 1.0)
+
+    def test_invalid_points(self, _):
+        self.assertEqual(self.send([]).status_code, 400)
+        self.assertEqual(self.send([{'lat': 91, 'lon': 0, 'ts': time.time()}]).status_code, 400)
+        self.assertEqual(self.send([{'lat': 1, 'lon': 1}]).status_code, 400)
+        too_many = [{'lat': 1, 'lon': 1, 'ts': time.time()}] * (locations.MAX_POINTS_PER_REQUEST + 1)
+        self.assertEqual(self.send(too_many).status_code, 400)
+
+    def test_only_couriers_may_send(self, _):
+        client = User.objects.create_user('client', password='x', role=User.Roles.CLIENT)
+        self.client.force_login(client)
+
+        self.assertEqual(self.send([{'lat': 1, 'lon': 1, 'ts': time.time()}]).status_code, 403)
+
+
+class LatestPositionsTests(TestCase):
+    def test_keeps_newest_point_and_grows(self):
+        positions = locations.LatestPositions(capacity=1)
+        positions.update(1, 10.0, 20.0, 200.0)
+        positions.update(1, 11.0, 21.0, 100.0)
+        positions.update(2, 30.0, 40.0, 100.0)
+
+        self.assertEqual(positions.get(1)['lat'], 10.0)
+        self.assertEqual(positions.get(2)['lon'], 40.0)
+        self.assertIsNone(positions.get(3))
+
+    def test_stale_memory_yields_to_newer_database_position(self):
+        courier = _make_courier('courier')
+        stale = time.time() - 60
+        CourierProfile.objects.filter(pk=courier.id).update(
+            last_lat=5.0,
+            last_lon=6.0,
+            last_location_at=timezone.now(),
+        )
+
+        with mock.patch.object(locations, 'latest_positions', locations.LatestPositions()) as positions:
+            positions.update(courier.id, 1.0, 2.0, stale)
+            self.assertEqual(locations.courier_position(courier.id)['lat'], 5.0)
+
+
+class NearbyOffersTests(TestCase):
+    # курьер в центре, рестораны — примерно в 1, 3 и 20 км к северу
+    center = (55.75, 37.62)
+
+    def setUp(self):
+        owner = User.objects.create_user('owner', password='x', role=User.Roles.RESTAURANT)
+        self.client_user = User.objects.create_user('client', password='x', role=User.Roles.CLIENT)
+        self.near = self.add_offer(Restaurant.objects.create(owner=owner, name='N', address='a', lat=55.759, lon=37.62))
+        self.mid = self.add_offer(Restaurant.objects.create(owner=owner, name='M', address='b', lat=55.777, lon=37.62))
+        self.far = self.add_offer(Restaurant.objects.create(owner=owner, name='F', address='c', lat=55.93, lon=37.62))
+        self.unlocated = self.add_offer(Restaurant.objects.create(owner=owner, name='U', address='d'))
+        self.courier = _make_courier('courier')
+        self.client.force_login(self.courier.user)
+
+    def add_offer(self, restaurant) -> int:
+        order = Order.objects.create(
+            client=self.client_user,
+            restaurant=restaurant,
+            delivery_address='a',
+            total_price=1,
+        )
+        cell_y, cell_x = grid_cell(restaurant.lat, restaurant.lon)
+        return DeliveryTask.objects.create(order=order, cell_y=cell_y, cell_x=cell_x).id
+
+    def offers(self, **params):
+        return self.client.get('/api/delivery/offers/', params)
+
+    def test_nearest_offers_within_radius_then_unlocated(self):
+        data = self.offers(lat=self.center[0], lon=self.center[1], radius_km=5).json()
+
+        self.assertEqual([offer['id'] for offer in data], [self.near, self.mid, self.unlocated])
+        self.assertAlmostEqual(data[0]['distance_km'], 1.0, delta=0.05)
+        self.assertNotIn('distance_km', data[2])
+
+    def test_limit_keeps_the_nearest(self):
+        data = self.offers(lat=self.center[0], lon=self.center[1], limit=1).json()
+
+        self.assertEqual([offer['id'] for offer in data], [self.near, self.unlocated])
+
+    def test_last_gps_point_is_used(self):
+        CourierProfile.objects.filter(pk=self.courier.id).update(
+            last_lat=self.center[0],
+            last_lon=self.center[1],
+            last_location_at=timezone.now(),
+        )
+
+        data = self.offers(radius_km=2).json()
+
+        self.assertEqual([offer['id'] for offer in data], [self.near, self.unlocated])
+
+    def test_stale_position_falls_back_to_full_list(self):
+        CourierProfile.objects.filter(pk=self.courier.id).update(
+            last_lat=self.center[0],
+            last_lon=self.center[1],
+            last_location_at=timezone.now() - locations.LOCATION_MAX_AGE - timedelta(minutes=1),
+        )
+
+        self.assertEqual(len(self.offers().json()), 4)
+
+    def test_moved_restaurant_moves_its_offers(self):
+        restaurant = Restaurant.objects.get(name='F')
+        refresh_open_offer_cells(restaurant.id, 55.76, 37.62)
+        Restaurant.objects.filter(pk=restaurant.id).update(lat=55.76)
+
+        data = self.offers(lat=self.center[0], lon=self.center[1], radius_km=2).json()
+
+        self.assertIn(self.far, [offer['id'] for offer in data])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.offers(lat='x', lon=1).status_code, 400)
+        self.assertEqual(self.offers(lat=1, lon=1, radius_km=10_000).status_code, 400)
+
+
+class DeliveryRunTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user('owner', password='x', role=User.Roles.RESTAURANT)
+        self.client_user = User.objects.create_user('client', password='x', role=User.Roles.CLIENT)
+        # два ресторана по соседству и один на другом конце города
+        self.near = Restaurant.objects.create(owner=owner, name='N', address='a', lat=55.75, lon=37.62)
+        self.next_door = Restaurant.objects.create(owner=owner, name='D', address='b', lat=55.751, lon=37.621)
+        self.far = Restaurant.objects.create(owner=owner, name='F', address='c', lat=55.95, lon=37.4)
+
+    def add_task(self, restaurant, dropoff=(55.76, 37.63)) -> int:
+        order = Order.objects.create(
+            client=self.client_user,
+            restaurant=restaurant,
+            delivery_address='a',
+            delivery_lat=dropoff[0],
+            delivery_lon=dropoff[1],
+            total_price=1,
+        )
+        return DeliveryTask.objects.create(order=order).id
+
+    def test_nearby_tasks_are_batched_with_pickups_first(self):
+        first = self.add_task(self.near)
+        second = self.add_task(self.next_door, dropoff=(55.761, 37.631))
+        alone = self.add_task(self.far)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            built = runs.build_runs()
+
+        self.assertEqual(len(built), 1)
+        stops = built[0].stops
+        self.assertEqual([stop['type'] for stop in stops], ['pickup', 'pickup', 'dropoff', 'dropoff'])
+        self.assertEqual(stops[0]['task_id'], first)
+        self.assertEqual({stop['task_id'] for stop in stops}, {first, second})
+        self.assertIsNone(DeliveryTask.objects.get(pk=alone).run_id)
+
+    def test_dispatch_tick_batches_before_assigning(self):
+        tasks = [self.add_task(self.near), self.add_task(self.next_door)]
+        CourierProfile.objects.filter(pk=_make_courier('courier').pk).update(
+            last_lat=55.75,
+            last_lon=37.62,
+            last_location_at=timezone.now(),
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('dispatch_couriers', method='greedy', stdout=mock.Mock())
+
+        # задачи ушли в рейс, а не достались курьеру по одной
+        batched = DeliveryTask.objects.filter(pk__in=tasks)
+        self.assertEqual(batched.filter(run__isnull=False).count(), 2)
+        self.assertFalse(batched.filter(courier__isnull=False).exists())
+
+    def test_stale_run_is_released_and_not_rebuilt_at_once(self):
+        tasks = [self.add_task(self.near), self.add_task(self.next_door)]
+        with self.captureOnCommitCallbacks(execute=True):
+            run = runs.build_runs()[0]
+        DeliveryRun.objects.filter(pk=run.pk).update(
+            created_at=timezone.now() - runs.DELIVERY_RUN_OPEN_TTL - timedelta(seconds=1),
+        )
+
+        with mock.patch.object(runs, 'publish_on_commit') as publish:
+            self.assertEqual(runs.release_stale_runs(), 1)
+
+        publish.assert_called_once_with(['offers'], {'type': 'run.released', 'run_ids': [run.pk]})
+        self.assertFalse(DeliveryRun.objects.exists())
+        self.assertFalse(DeliveryTask.objects.filter(pk__in=tasks, batch_after__isnull=True).exists())
+        self.assertEqual(runs.build_runs(), [])
+
+    def test_claim_assigns_the_whole_run_once(self):
+        tasks = [self.add_task(self.near), self.add_task(self.next_door)]
+        with self.captureOnCommitCallbacks(execute=True):
+            run = runs.build_runs()[0]
+        courier = _make_courier('courier')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            assigned = runs.claim_run(run.pk, courier.id)
+
+        self.assertEqual(sorted(task_id for task_id, *_ in assigned), sorted(tasks))
+        self.assertEqual(
+            DeliveryTask.objects.filter(pk__in=tasks, courier=courier, status=DeliveryTask.Status.ASSIGNED).count(),
+            2,
+        )
+        self.assertIsNone(runs.claim_run(run.pk, _make_courier('other').id))
+
+    def test_runs_list_ignores_stale_position(self):
+        self.add_task(self.near)
+        self.add_task(self.next_door)
+        self.add_task(self.far, dropoff=(55.95, 37.41))
+        self.add_task(self.far, dropoff=(55.951, 37.411))
+        with self.captureOnCommitCallbacks(execute=True):
+            near_run, far_run = runs.build_runs()
+        courier = _make_courier('courier')
+        self.client.force_login(courier.user)
+
+        # точка у дальнего ресторана, но ей уже больше LOCATION_MAX_AGE
+        CourierProfile.objects.filter(pk=courier.pk).update(
+            last_lat=55.95,
+            last_lon=37.4,
+            last_location_at=timezone.now() - locations.LOCATION_MAX_AGE - timedelta(minutes=1),
+        )
+        data = self.client.get('/api/delivery/runs/').json()
+        self.assertEqual([run['id'] for run in data], [near_run.pk, far_run.pk])
+
+        CourierProfile.objects.filter(pk=courier.pk).update(last_location_at=timezone.now())
+        data = self.client.get('/api/delivery/runs/').json()
+        self.assertEqual([run['id'] for run in data], [far_run.pk, near_run.pk])
+
+
+class EtaModelTests(TestCase):
+    def test_fit_takes_group_medians_and_falls_back_for_small_groups(self):
+        foot = eta.VEHICLE_TYPES.index(CourierProfile.VehicleTypes.FOOT)
+        car = eta.VEHICLE_TYPES.index(CourierProfile.VehicleTypes.CAR)
+        keys = np.array([(1, 12, foot)] * 5 + [(1, 12, car)] * 2, dtype=np.int64)
+        segments = np.array(
+            [(60, 300, 600), (120, 300, 600), (180, 300, 900), (240, 300, 900), (300, 300, 900)]
+            + [(10, 10, 10)] * 2,
+            dtype=np.float64,
+        )
+
+        table = eta.EtaTable(eta.fit(keys, segments))
+
+        self.assertEqual(table.lookup(1, 12, CourierProfile.VehicleTypes.FOOT), (180, 300, 900))
+        # у машин всего две доставки — берётся группа (ресторан, час) по всем семи
+        self.assertEqual(table.lookup(1, 12, CourierProfile.VehicleTypes.CAR), (120, 300, 600))
+        # другой ресторан — общая медиана
+        self.assertEqual(table.lookup(2, 3, None), (120, 300, 600))
+
+    def test_estimate_counts_remaining_segments_from_last_stamp(self):
+        table = eta.EtaTable([[None, None, None, 60, 300, 600, 10]])
+        now = timezone.now()
+
+        with mock.patch.object(eta, 'get_table', return_value=table):
+            pending = eta.estimate_delivery(1, None, DeliveryTask.Status.PENDING, now, None, None)
+            in_progress = eta.estimate_delivery(
+                1, None, DeliveryTask.Status.IN_PROGRESS, now, now, now - timedelta(minutes=5),
+            )
+            done = eta.estimate_delivery(1, None, DeliveryTask.Status.DONE, now, now, now)
+
+        self.assertEqual(pending, now + timedelta(seconds=960))
+        self.assertEqual(in_progress, now + timedelta(minutes=5))
+        self.assertIsNone(done)
+
+    def test_transitions_are_stamped_and_fitted(self):
+        task_ids = _make_tasks(eta.ETA_MIN_SAMPLES)
+        courier = _make_courier('courier')
+        self.client.force_login(courier.user)
+        DeliveryTask.objects.filter(pk__in=task_ids).update(created_at=timezone.now())
+
+        for task_id in task_ids:
+            DeliveryTask.objects.filter(pk=task_id).update(
+                courier=courier,
+                status=DeliveryTask.Status.ASSIGNED,
+                assigned_at=timezone.now(),
+            )
+            for status in (DeliveryTask.Status.IN_PROGRESS, DeliveryTask.Status.DONE):
+                response = self.client.patch(
+                    f'/api/delivery/tasks/{task_id}/status/',
+                    json.dumps({'status': status}),
+                    content_type='application/json',
+                )
+                self.assertEqual(response.status_code, 200)
+
+        task = DeliveryTask.objects.get(pk=task_ids[0])
+        self.assertIsNotNone(task.picked_up_at)
+        self.assertIsNotNone(task.completed_at)
+
+        snapshot = eta.fit_snapshot()
+        self.assertEqual(snapshot.samples, eta.ETA_MIN_SAMPLES)
+
+
+# задержка коммита в тестах поллинга — чтобы не ждать по 2 секунды
+POLL_TEST_LAG = timedelta(milliseconds=300)
+
+# распускает рейсы из отдельного процесса, как dispatch_couriers в docker-compose
+RELEASE_SCRIPT = """
+import sys
+
+import django
+
+django.setup()
+
+from django.conf import settings
+
+settings.DATABASES['default']['NAME'] = sys.argv[1]
+settings.REALTIME_BACKEND = 'realtime.hub.PostgresNotifyBackend'
+
+from delivery.runs import release_stale_runs
+
+release_stale_runs()
+"""
+
+
+def _patch_commit_lag(test):
+    for target in ('orders.sync.SYNC_COMMIT_LAG', 'delivery.views.SYNC_COMMIT_LAG'):
+        patcher = mock.patch(target, POLL_TEST_LAG)
+        patcher.start()
+        test.addCleanup(patcher.stop)
+
+
+async def _poll(client, **params):
+    started = time.monotonic()
+    response = await client.get('/api/delivery/offers/poll/', params)
+    return response, time.monotonic() - started
+
+
+class OffersPollTests(TestCase):
+    def setUp(self):
+        _patch_commit_lag(self)
+        self.courier = _make_courier('courier')
+        self.since = encode_watermark(timezone.now(), 0)
+
+    async def client_for_courier(self):
+        client = AsyncClient()
+        await client.aforce_login(self.courier.user)
+        return client
+
+    async def test_committed_offers_are_returned_at_once(self):
+        task_ids = await sync_to_async(_make_tasks)(1)
+        await DeliveryTask.objects.filter(pk__in=task_ids).aupdate(
+            updated_at=timezone.now() - POLL_TEST_LAG * 2,
+        )
+        client = await self.client_for_courier()
+
+        response, elapsed = await _poll(client, timeout=5)
+
+        self.assertEqual([offer['id'] for offer in response.json()['results']], task_ids)
+        self.assertLess(elapsed, POLL_TEST_LAG.total_seconds())
+
+    async def test_offer_written_before_subscription_is_returned_after_lag(self):
+        # свежая строка придержана, а её событие ушло до подписки
+        task_ids = await sync_to_async(_make_tasks)(1)
+        client = await self.client_for_courier()
+
+        response, elapsed = await _poll(client, timeout=5)
+
+        self.assertEqual([offer['id'] for offer in response.json()['results']], task_ids)
+        self.assertLess(elapsed, 5)
+
+    async def test_wake_event_rereads_after_lag(self):
+        client = await self.client_for_courier()
+
+        async def create_offer():
+            await asyncio.sleep(0.5)
+            task_ids = await sync_to_async(_make_tasks)(1)
+            get_backend().publish(['offers'], {'type': 'offer.created', 'task_id': task_ids[0]})
+            return task_ids
+
+        (response, elapsed), task_ids = await asyncio.gather(
+            _poll(client, since=self.since, timeout=10),
+            create_offer(),
+        )
+
+        self.assertEqual([offer['id'] for offer in response.json()['results']], task_ids)
+        self.assertLess(elapsed, 10)
+
+    async def test_timeout_keeps_watermark(self):
+        client = await self.client_for_courier()
+
+        response, _ = await _poll(client, since=self.since, timeout=0.5)
+
+        self.assertEqual(response.json(), {'results': [], 'watermark': self.since, 'has_more': False})
+
+
+class OffersPollNotifyTests(TransactionTestCase):
+    def setUp(self):
+        _patch_commit_lag(self)
+        self.backend = PostgresNotifyBackend()
+        self.backend.poll_interval = 0.2
+        self.addCleanup(self.backend.close)
+        patcher = mock.patch('delivery.views.get_backend', return_value=self.backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def wait_for_listener(self):
+        # LISTEN выполняется в фоновом потоке — ждём, пока он начнёт принимать события
+        probe = self.backend.subscribe(['probe'])
+        try:
+            for _ in range(20):
+                await sync_to_async(self.backend.publish)(['probe'], {'type': 'probe'})
+                if await probe.get(0.5) is not None:
+                    return
+        finally:
+            self.backend.unsubscribe(probe)
+        self.fail('Realtime listener did not start')
+
+    async def test_run_released_in_another_process_wakes_poll(self):
+        task_ids = await sync_to_async(_make_tasks)(2)
+        run = await DeliveryRun.objects.acreate(
+            stops=[],
+            distance_km=0,
+            created_at=timezone.now() - runs.DELIVERY_RUN_OPEN_TTL - timedelta(seconds=1),
+        )
+        await DeliveryTask.objects.filter(pk__in=task_ids).aupdate(run=run)
+        courier = await sync_to_async(_make_courier)('courier')
+        client = AsyncClient()
+        await client.aforce_login(courier.user)
+        await self.wait_for_listener()
+        since = encode_watermark(timezone.now(), 0)
+
+        async def release_elsewhere():
+            await asyncio.sleep(0.5)
+            await asyncio.to_thread(
+                subprocess.run,
+                [sys.executable, '-c', RELEASE_SCRIPT, connections['default'].settings_dict['NAME']],
+                cwd=settings.BASE_DIR,
+                check=True,
+                timeout=30,
+            )
+
+        (response, elapsed), _ = await asyncio.gather(
+            _poll(client, since=since, timeout=20),
+            release_elsewhere(),
+        )
+
+        self.assertEqual(sorted(offer['id'] for offer in response.json()['results']), sorted(task_ids))
+        self.assertLess(elapsed, 20)
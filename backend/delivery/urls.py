@@ -11,6 +11,11 @@ urlpatterns = [
 
     path('delivery/offers/', views.delivery_offers_list, name='delivery_offers_list'),
     path('delivery/offers/<int:task_id>/assign/', views.delivery_task_assign, name='delivery_task_assign'),
+    path('delivery/offers/claim-next/', views.delivery_task_claim_next, name='delivery_task_claim_next'),
+    path('delivery/offers/poll/', views.delivery_offers_poll, name='delivery_offers_poll'),
+    path('delivery/runs/', views.delivery_runs_list, name='delivery_runs_list'),
+    path('delivery/runs/<int:run_id>/claim/', views.delivery_run_claim, name='delivery_run_claim'),
 
+    path('delivery/courier/location/', views.courier_location_ingest, name='courier_location_ingest'),
     path('delivery/courier/apply/', views.courier_application_create, name='courier_apply'),
 ]
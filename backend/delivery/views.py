@@ -1,13 +1,34 @@
+import heapq
 import json
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
 
 from django.http import JsonResponse, Http404
 from django.views.decorators.csrf import csrf_exempt
 from django.db import transaction
+from django.db.models import Q
 from django.utils import timezone
 
-from .models import DeliveryTask, CourierProfile, CourierApplication
+from .claims import claim_next_task
+from .eta import estimate_delivery
+from .geo import cell_ranges, distance_km, parse_point
+from .locations import fresh_courier_position, ingest, parse_points
+from .models import DeliveryRun, DeliveryTask, CourierApplication
+from .runs import claim_run, complete_run_if_done
 from users.models import User
 from orders.models import Order
+from orders.status import transition_order
+from orders.sync import (
+    SYNC_COMMIT_LAG,
+    changed_since,
+    collection_etag,
+    decode_watermark,
+    not_modified,
+    sync_cutoff,
+)
+from realtime.hub import get_backend, publish_on_commit
 
 
 def _parse_json(request):
@@ -17,9 +38,44 @@ def _parse_json(request):
         return None
 
 
+def _serialize_task(task: DeliveryTask) -> dict:
+    order = task.order
+    client = order.client
+
+    # если в User нет phone — либо убери это поле, либо замени на своё
+    client_phone = getattr(client, "phone", "")
+    client_name = getattr(client, 'display_name', '') or client.username
+
+    return {
+        'id': task.id,
+        'order_id': task.order_id,
+        'status': task.status,
+        'courier_id': task.courier_id,
+        'client_id': order.client_id,
+        'client_username': client_name,
+        'client_phone': client_phone,
+        'restaurant_id': order.restaurant_id,
+        'restaurant_name': order.restaurant.name,
+        'delivery_address': order.delivery_address,
+        'order_total_price': str(order.total_price),
+        'order_created_at': order.created_at.isoformat(),
+        'eta': estimate_delivery(
+            order.restaurant_id,
+            task.courier.vehicle_type if task.courier else None,
+            task.status,
+            task.created_at,
+            task.assigned_at,
+            task.picked_up_at,
+        ),
+    }
+
+
 def delivery_task_list(request):
     """
     Список задач доставки для текущего курьера (или админа).
+
+    ?since=<watermark> — только изменённые задачи и новый водяной знак.
+    Ответ содержит ETag; при совпадении If-None-Match возвращается 304.
     """
     if request.method != 'GET':
         return JsonResponse({'detail': 'Method not allowed'}, status=405)
@@ -35,43 +91,132 @@ def delivery_task_list(request):
     )
 
     if user.role == User.Roles.COURIER:
-        try:
-            courier_profile = CourierProfile.objects.get(user=user)
-        except CourierProfile.DoesNotExist:
+        courier_id = request.access.courier_id
+        if courier_id is None:
             return JsonResponse({'detail': 'Courier profile not found'}, status=404)
-        qs = qs.filter(courier=courier_profile)
+        qs = qs.filter(courier_id=courier_id)
     elif user.role == User.Roles.ADMIN:
         pass
     else:
         return JsonResponse({'detail': 'Forbidden'}, status=403)
 
-    data = []
-    for task in qs.order_by('status', '-assigned_at'):
-        order = task.order
-        client = order.client
-
-        # если в User нет phone — либо убери это поле, либо замени на своё
-        client_phone = getattr(client, "phone", "")
-        client_name = getattr(client, 'display_name', '') or client.username
-
-        data.append(
+    since = request.GET.get('since')
+    # ?since= отдаёт только строки старше задержки коммита — ETag по ним же
+    cutoff = sync_cutoff() if since else None
+    etag = collection_etag(request, qs, cutoff)
+    not_modified_response = not_modified(request, etag)
+    if not_modified_response is not None:
+        return not_modified_response
+
+    if since:
+        position = decode_watermark(since)
+        if position is None:
+            return JsonResponse({'detail': 'Invalid since'}, status=400)
+        tasks, watermark, has_more = changed_since(qs, position, cutoff)
+        response = JsonResponse(
             {
-                'id': task.id,
-                'order_id': task.order_id,
-                'status': task.status,
-                'courier_id': task.courier_id,
-                'client_id': order.client_id,
-                'client_username': client_name,
-                'client_phone': client_phone,
-                'restaurant_id': order.restaurant_id,
-                'restaurant_name': order.restaurant.name,
-                'delivery_address': order.delivery_address,
-                'order_total_price': str(order.total_price),
-                'order_created_at': order.created_at.isoformat(),
-            }
+                'results': [_serialize_task(task) for task in tasks],
+                'watermark': watermark,
+                'has_more': has_more,
+            },
+            json_dumps_params={'ensure_ascii': False},
         )
+    else:
+        data = [_serialize_task(task) for task in qs.order_by('status', '-assigned_at')]
+        response = JsonResponse(data, safe=False, json_dumps_params={'ensure_ascii': False})
+
+    response['ETag'] = etag
+    return response
+
+
+OFFERS_RADIUS_KM = 5.0
+OFFERS_MAX_RADIUS_KM = 30.0
+OFFERS_NEARBY_LIMIT = 20
+OFFERS_MAX_LIMIT = 100
+
+OFFER_FIELDS = (
+    "id",
+    "order_id",
+    "status",
+    "order__restaurant_id",
+    "order__restaurant__name",
+    "order__restaurant__lat",
+    "order__restaurant__lon",
+    "order__client_id",
+    "order__delivery_address",
+    "order__delivery_lat",
+    "order__delivery_lon",
+    "order__total_price",
+    "order__created_at",
+)
+
+
+def _serialize_offer(row: dict) -> dict:
+    return {
+        "id": row["id"],
+        "order_id": row["order_id"],
+        "status": row["status"],
+        "restaurant_id": row["order__restaurant_id"],
+        "restaurant_name": row["order__restaurant__name"],
+        "restaurant_lat": row["order__restaurant__lat"],
+        "restaurant_lon": row["order__restaurant__lon"],
+        "client_id": row["order__client_id"],
+        "delivery_address": row["order__delivery_address"],
+        "delivery_lat": row["order__delivery_lat"],
+        "delivery_lon": row["order__delivery_lon"],
+        "order_total_price": str(row["order__total_price"]),
+        "order_created_at": row["order__created_at"].isoformat(),
+    }
+
+
+def _bounded_param(request, name: str, default: float, maximum: float) -> float | None:
+    raw = request.GET.get(name)
+    if raw is None:
+        return default
+    try:
+        value = float(raw)
+    except ValueError:
+        return None
+    if not 0 < value <= maximum:
+        return None
+    return value
+
 
-    return JsonResponse(data, safe=False, json_dumps_params={'ensure_ascii': False})
+def _offers_scope(request, user: User):
+    """
+    Проверяет, что пользователь может смотреть офферы, и определяет точку,
+    от которой они отбираются. Возвращает (ответ с ошибкой или None, позиция или None).
+    """
+    if user.role not in (User.Roles.COURIER, User.Roles.ADMIN):
+        return JsonResponse({"detail": "Forbidden"}, status=403), None
+
+    # курьер должен иметь профиль и быть активным
+    if user.role == User.Roles.COURIER:
+        if request.access.courier_id is None:
+            return JsonResponse({"detail": "Courier profile not found"}, status=404), None
+        if not request.access.courier_is_active:
+            return JsonResponse(
+                {"detail": "Courier profile is not active"},
+                status=403,
+            ), None
+
+    position = None
+    if "lat" in request.GET or "lon" in request.GET:
+        position = parse_point(request.GET.get("lat"), request.GET.get("lon"))
+        if position is None:
+            return JsonResponse({"detail": "Invalid lat/lon"}, status=400), None
+    elif user.role == User.Roles.COURIER:
+        position = fresh_courier_position(request.access.courier_id)
+    return None, position
+
+
+def _open_offers():
+    # задачи, собранные в рейс, предлагаются только вместе с рейсом
+    return DeliveryTask.objects.filter(
+        status=DeliveryTask.Status.PENDING,
+        courier__isnull=True,
+        run__isnull=True,
+    )
 
 
 def delivery_offers_list(request):
@@ -79,6 +224,13 @@ def delivery_offers_list(request):
     Список свободных задач (офферы) для курьеров:
     - статус PENDING
     - courier IS NULL
+
+    Если известна позиция курьера (последняя GPS-точка или ?lat=&lon=),
+    отдаются только ближайшие ?limit= офферов (по умолчанию 20) в радиусе
+    ?radius_km= (по умолчанию 5) от точки забора, с полем distance_km,
+    а за ними — офферы ресторанов без координат. Кандидаты выбираются по
+    ячейкам сетки из частичного индекса (delivery/geo.py). Без позиции
+    (или если GPS-точка старше LOCATION_MAX_AGE) — весь список, как раньше.
     """
     if request.method != "GET":
         return JsonResponse({"detail": "Method not allowed"}, status=405)
@@ -87,48 +239,190 @@ def delivery_offers_list(request):
     if user is None:
         return JsonResponse({"detail": "Authentication required"}, status=401)
 
-    if user.role not in (User.Roles.COURIER, User.Roles.ADMIN):
-        return JsonResponse({"detail": "Forbidden"}, status=403)
+    error, position = _offers_scope(request, user)
+    if error is not None:
+        return error
 
-    # курьер должен иметь профиль и быть активным
-    if user.role == User.Roles.COURIER:
-        try:
-            courier_profile = CourierProfile.objects.get(user=user)
-        except CourierProfile.DoesNotExist:
-            return JsonResponse({"detail": "Courier profile not found"}, status=404)
-        if not courier_profile.is_active:
-            return JsonResponse(
-                {"detail": "Courier profile is not active"},
-                status=403,
-            )
+    qs = _open_offers()
 
-    qs = (
-        DeliveryTask.objects
-        .select_related("order__restaurant")
-        .filter(
-            status=DeliveryTask.Status.PENDING,
-            courier__isnull=True,
+    if position is None:
+        rows = qs.order_by("-order__created_at").values(*OFFER_FIELDS)
+        data = [_serialize_offer(row) for row in rows]
+        return JsonResponse(data, safe=False, json_dumps_params={"ensure_ascii": False})
+
+    radius_km = _bounded_param(request, "radius_km", OFFERS_RADIUS_KM, OFFERS_MAX_RADIUS_KM)
+    limit = _bounded_param(request, "limit", OFFERS_NEARBY_LIMIT, OFFERS_MAX_LIMIT)
+    if radius_km is None or limit is None:
+        return JsonResponse(
+            {
+                "detail": f"radius_km must be in (0, {OFFERS_MAX_RADIUS_KM:g}], "
+                f"limit in (0, {OFFERS_MAX_LIMIT}]"
+            },
+            status=400,
         )
-    )
+
+    lat, lon = position
+    cells_y, cells_x = cell_ranges(lat, lon, radius_km)
+    candidates = qs.filter(cell_y__range=cells_y, cell_x__range=cells_x).values(*OFFER_FIELDS)
+
+    nearby = []
+    for row in candidates:
+        distance = distance_km(lat, lon, row["order__restaurant__lat"], row["order__restaurant__lon"])
+        if distance <= radius_km:
+            nearby.append((distance, row["id"], row))
 
     data = []
-    for task in qs.order_by("-order__created_at"):
-        order = task.order
-        data.append(
+    for distance, _, row in heapq.nsmallest(int(limit), nearby):
+        offer = _serialize_offer(row)
+        offer["distance_km"] = round(distance, 2)
+        data.append(offer)
+
+    # у ресторанов без координат ячейки нет и расстояние неизвестно —
+    # такие офферы идут следом за ближайшими, без distance_km
+    unlocated = qs.filter(cell_y__isnull=True).order_by("-order__created_at").values(*OFFER_FIELDS)
+    data += [_serialize_offer(row) for row in unlocated]
+
+    return JsonResponse(data, safe=False, json_dumps_params={"ensure_ascii": False})
+
+
+OFFERS_POLL_TIMEOUT = 25.0
+# nginx по умолчанию закрывает ответ, который дольше 60 секунд молчит
+OFFERS_POLL_MAX_TIMEOUT = 55.0
+# события канала "offers", после которых в ленте могут появиться офферы
+OFFERS_POLL_WAKE_EVENTS = frozenset({"offer.created", "run.released"})
+# без ?since= лента отдаётся с самого начала
+_POLL_START = (datetime(1970, 1, 1, tzinfo=dt_timezone.utc), 0)
+
+
+def _poll_prepare(request, user: User):
+    """Синхронная часть long-poll: доступ, точка, параметры. (ошибка, параметры)."""
+    error, point = _offers_scope(request, user)
+    if error is not None:
+        return error, None
+
+    since = request.GET.get("since")
+    position = decode_watermark(since) if since else _POLL_START
+    if position is None:
+        return JsonResponse({"detail": "Invalid since"}, status=400), None
+
+    timeout = _bounded_param(request, "timeout", OFFERS_POLL_TIMEOUT, OFFERS_POLL_MAX_TIMEOUT)
+    radius_km = _bounded_param(request, "radius_km", OFFERS_RADIUS_KM, OFFERS_MAX_RADIUS_KM)
+    if timeout is None or radius_km is None:
+        return JsonResponse(
             {
-                "id": task.id,
-                "order_id": order.id,
-                "status": task.status,
-                "restaurant_id": order.restaurant_id,
-                "restaurant_name": order.restaurant.name,
-                "client_id": order.client_id,
-                "delivery_address": order.delivery_address,
-                "order_total_price": str(order.total_price),
-                "order_created_at": order.created_at.isoformat(),
-            }
+                "detail": f"timeout must be in (0, {OFFERS_POLL_MAX_TIMEOUT:g}], "
+                f"radius_km in (0, {OFFERS_MAX_RADIUS_KM:g}]"
+            },
+            status=400,
+        ), None
+    return None, (position, point, radius_km, timeout)
+
+
+def _offers_since(position, point, radius_km: float):
+    """
+    Офферы, изменённые после водяного знака position (orders.sync.changed_since):
+    новые и вернувшиеся в ленту из распущенных рейсов. Строки моложе
+    SYNC_COMMIT_LAG придерживаются, с той же гарантией, что и у списка задач.
+    Возвращает
+    (офферы, новый водяной знак, есть ли ещё). Если точка курьера известна —
+    только офферы в радиусе и офферы ресторанов без координат; знак всё
+    равно сдвигается за просмотренные дальние.
+    """
+    qs = _open_offers()
+    if point is not None:
+        cells_y, cells_x = cell_ranges(point[0], point[1], radius_km)
+        qs = qs.filter(
+            Q(cell_y__range=cells_y, cell_x__range=cells_x) | Q(cell_y__isnull=True)
         )
+    qs = qs.values(*OFFER_FIELDS, "updated_at")
+
+    while True:
+        rows, watermark, has_more = changed_since(qs, position)
+        data = []
+        for row in rows:
+            offer = _serialize_offer(row)
+            if point is not None and row["order__restaurant__lat"] is not None:
+                distance = distance_km(
+                    point[0], point[1], row["order__restaurant__lat"], row["order__restaurant__lon"],
+                )
+                if distance > radius_km:
+                    continue
+                offer["distance_km"] = round(distance, 2)
+            data.append(offer)
+        # вся пачка оказалась дальше радиуса — сразу смотрим следующую
+        if data or not has_more:
+            return data, watermark, has_more
+        position = decode_watermark(watermark)
+
+
+async def delivery_offers_poll(request):
+    """
+    Long-poll ленты офферов: GET ?since=<watermark из прошлого ответа>.
+
+    Водяной знак — позиция (updated_at, id), как у списка задач
+    (orders/sync.py): задачи из распущенного рейса приходят снова, а оффер,
+    чья транзакция закоммитилась позже более нового, не теряется, если она
+    уложилась в SYNC_COMMIT_LAG. Если изменений нет, запрос ждёт до
+    ?timeout= секунд (по умолчанию 25) события offer.created или
+    run.released в канале "offers" realtime-хаба и перечитывает БД через
+    SYNC_COMMIT_LAG после него — раньше строка события ещё придержана.
+    Так же, через SYNC_COMMIT_LAG, перечитывается пустой первый ответ:
+    событие оффера, записанного перед подпиской, уже не придёт.
+    Ответ: {"results": [...], "watermark": ..., "has_more": ...}; по таймауту —
+    пустой results и прежний знак. Без since отдаются все открытые офферы.
+    Отбор по позиции — как в delivery_offers_list (?lat=&lon=, ?radius_km=).
+    """
+    if request.method != "GET":
+        return JsonResponse({"detail": "Method not allowed"}, status=405)
 
-    return JsonResponse(data, safe=False, json_dumps_params={"ensure_ascii": False})
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({"detail": "Authentication required"}, status=401)
+
+    error, params = await sync_to_async(_poll_prepare)(request, user)
+    if error is not None:
+        return error
+    position, point, radius_km, timeout = params
+
+    backend = get_backend()
+    # подписка до первого запроса: оффер, созданный между запросом и
+    # ожиданием, всё равно разбудит нас
+    subscription = backend.subscribe(["offers"])
+    lag = SYNC_COMMIT_LAG.total_seconds()
+    try:
+        deadline = time.monotonic() + timeout
+        results, watermark, has_more = await sync_to_async(_offers_since)(
+            position, point, radius_km,
+        )
+        # когда перечитать БД; last_due — срок для самого свежего события
+        recheck_at = last_due = time.monotonic() + lag
+        while not results and not has_more:
+            now = time.monotonic()
+            if recheck_at is not None and now >= recheck_at:
+                results, watermark, has_more = await sync_to_async(_offers_since)(
+                    decode_watermark(watermark), point, radius_km,
+                )
+                # событие пришло, пока ждали, — его строку ждём отдельно
+                recheck_at = last_due if last_due > now else None
+                continue
+            remaining = deadline - now
+            if remaining <= 0:
+                break
+            event = await subscription.get(
+                remaining if recheck_at is None else min(remaining, recheck_at - now)
+            )
+            if event is None or event["type"] not in OFFERS_POLL_WAKE_EVENTS:
+                continue
+            last_due = time.monotonic() + lag
+            if recheck_at is None:
+                recheck_at = last_due
+    finally:
+        backend.unsubscribe(subscription)
+
+    return JsonResponse(
+        {"results": results, "watermark": watermark, "has_more": has_more},
+        json_dumps_params={"ensure_ascii": False},
+    )
 
 
 @csrf_exempt
@@ -152,14 +446,13 @@ def delivery_task_assign(request, task_id: int):
     if user.role not in (User.Roles.COURIER, User.Roles.ADMIN):
         return JsonResponse({"detail": "Forbidden"}, status=403)
 
-    courier_profile = None
+    courier_id = None
     if user.role == User.Roles.COURIER:
-        try:
-            courier_profile = CourierProfile.objects.get(user=user)
-        except CourierProfile.DoesNotExist:
+        courier_id = request.access.courier_id
+        if courier_id is None:
             return JsonResponse({"detail": "Courier profile not found"}, status=404)
 
-        if not courier_profile.is_active:
+        if not request.access.courier_is_active:
             return JsonResponse(
                 {"detail": "Courier profile is not active"},
                 status=403,
@@ -167,7 +460,7 @@ def delivery_task_assign(request, task_id: int):
 
         # проверка: нет ли уже активной задачи
         has_active = DeliveryTask.objects.filter(
-            courier=courier_profile,
+            courier_id=courier_id,
             status__in=[
                 DeliveryTask.Status.ASSIGNED,
                 DeliveryTask.Status.IN_PROGRESS,
@@ -200,13 +493,32 @@ def delivery_task_assign(request, task_id: int):
                 status=400,
             )
 
+        if task.run_id is not None:
+            return JsonResponse(
+                {"detail": "Task is part of a delivery run, claim the run instead"},
+                status=400,
+            )
+
         if user.role == User.Roles.COURIER:
-            task.courier = courier_profile
+            task.courier_id = courier_id
 
         task.status = DeliveryTask.Status.ASSIGNED
         task.assigned_at = timezone.now()
         task.save()
 
+        channels = ["offers", f"order:{task.order_id}", f"restaurant:{task.order.restaurant_id}"]
+        if task.courier_id is not None:
+            channels.append(f"courier:{task.courier_id}")
+        publish_on_commit(
+            channels,
+            {
+                "type": "delivery.assigned",
+                "task_id": task.id,
+                "order_id": task.order_id,
+                "courier_id": task.courier_id,
+            },
+        )
+
     order = task.order
 
     return JsonResponse(
@@ -221,6 +533,216 @@ def delivery_task_assign(request, task_id: int):
     )
 
 
+@csrf_exempt
+def delivery_task_claim_next(request):
+    """
+    Курьер берёт самую старую свободную задачу, не выбирая её сам.
+
+    В отличие от delivery_task_assign, параллельные запросы не ждут
+    блокировку одной и той же строки: каждый получает свою задачу
+    (SELECT ... FOR UPDATE SKIP LOCKED, см. delivery/claims.py).
+    """
+    if request.method != "POST":
+        return JsonResponse({"detail": "Method not allowed"}, status=405)
+
+    user: User | None = request.user if request.user.is_authenticated else None
+    if user is None:
+        return JsonResponse({"detail": "Authentication required"}, status=401)
+
+    if user.role != User.Roles.COURIER:
+        return JsonResponse({"detail": "Forbidden"}, status=403)
+
+    courier_id = request.access.courier_id
+    if courier_id is None:
+        return JsonResponse({"detail": "Courier profile not found"}, status=404)
+
+    if not request.access.courier_is_active:
+        return JsonResponse(
+            {"detail": "Courier profile is not active"},
+            status=403,
+        )
+
+    claimed = claim_next_task(courier_id)
+    if claimed is None:
+        # причину выясняем только при неудаче, удачный путь — один запрос
+        has_active = DeliveryTask.objects.filter(
+            courier_id=courier_id,
+            status__in=[
+                DeliveryTask.Status.ASSIGNED,
+                DeliveryTask.Status.IN_PROGRESS,
+            ],
+        ).exists()
+        if has_active:
+            return JsonResponse(
+                {
+                    "detail": "У вас уже есть активная задача. "
+                    "Завершите её прежде чем брать новую."
+                },
+                status=400,
+                json_dumps_params={"ensure_ascii": False},
+            )
+        return JsonResponse({"detail": "No offers available"}, status=404)
+
+    return JsonResponse(
+        {
+            "id": claimed["id"],
+            "status": DeliveryTask.Status.ASSIGNED,
+            "order_id": claimed["order_id"],
+            "courier_id": claimed["courier_id"],
+            "delivery_address": claimed["delivery_address"],
+        },
+        json_dumps_params={"ensure_ascii": False},
+    )
+
+
+DELIVERY_RUNS_LIMIT = 50
+
+
+def _serialize_run(run: dict) -> dict:
+    return {
+        "id": run["id"],
+        "status": run["status"],
+        "orders_count": sum(1 for stop in run["stops"] if stop["type"] == "pickup"),
+        "distance_km": run["distance_km"],
+        "stops": run["stops"],
+        "created_at": run["created_at"].isoformat(),
+    }
+
+
+def delivery_runs_list(request):
+    """
+    Открытые рейсы: несколько заказов с упорядоченным маршрутом
+    (delivery/runs.py). Курьеру с известной позицией — сначала ближайшие
+    к первой точке забора; позиция старше LOCATION_MAX_AGE не учитывается,
+    как и в офферах.
+    """
+    if request.method != "GET":
+        return JsonResponse({"detail": "Method not allowed"}, status=405)
+
+    user: User | None = request.user if request.user.is_authenticated else None
+    if user is None:
+        return JsonResponse({"detail": "Authentication required"}, status=401)
+
+    if user.role not in (User.Roles.COURIER, User.Roles.ADMIN):
+        return JsonResponse({"detail": "Forbidden"}, status=403)
+
+    runs = list(
+        DeliveryRun.objects
+        .filter(status=DeliveryRun.Status.OPEN)
+        .order_by("created_at", "id")
+        .values("id", "status", "stops", "distance_km", "created_at")
+        [:DELIVERY_RUNS_LIMIT]
+    )
+
+    position = None
+    if user.role == User.Roles.COURIER and request.access.courier_id is not None:
+        position = fresh_courier_position(request.access.courier_id)
+    if position is not None:
+        runs.sort(
+            key=lambda run: distance_km(
+                position[0], position[1], run["stops"][0]["lat"], run["stops"][0]["lon"]
+            )
+        )
+
+    data = [_serialize_run(run) for run in runs]
+    return JsonResponse(data, safe=False, json_dumps_params={"ensure_ascii": False})
+
+
+@csrf_exempt
+def delivery_run_claim(request, run_id: int):
+    """Курьер берёт рейс целиком: все задачи рейса назначаются ему атомарно."""
+    if request.method != "POST":
+        return JsonResponse({"detail": "Method not allowed"}, status=405)
+
+    user: User | None = request.user if request.user.is_authenticated else None
+    if user is None:
+        return JsonResponse({"detail": "Authentication required"}, status=401)
+
+    if user.role != User.Roles.COURIER:
+        return JsonResponse({"detail": "Forbidden"}, status=403)
+
+    courier_id = request.access.courier_id
+    if courier_id is None:
+        return JsonResponse({"detail": "Courier profile not found"}, status=404)
+
+    if not request.access.courier_is_active:
+        return JsonResponse(
+            {"detail": "Courier profile is not active"},
+            status=403,
+        )
+
+    assigned = claim_run(run_id, courier_id)
+    if assigned is None:
+        run = DeliveryRun.objects.filter(pk=run_id).values("status").first()
+        if run is None:
+            raise Http404("Delivery run not found")
+        if run["status"] != DeliveryRun.Status.OPEN:
+            return JsonResponse({"detail": "Run is already taken"}, status=400)
+        return JsonResponse(
+            {
+                "detail": "У вас уже есть активная задача. "
+                "Завершите её прежде чем брать новую."
+            },
+            status=400,
+            json_dumps_params={"ensure_ascii": False},
+        )
+
+    run = (
+        DeliveryRun.objects
+        .filter(pk=run_id)
+        .values("id", "status", "stops", "distance_km", "created_at")
+        .get()
+    )
+    return JsonResponse(
+        {**_serialize_run(run), "task_ids": [task[0] for task in assigned]},
+        json_dumps_params={"ensure_ascii": False},
+    )
+
+
+@csrf_exempt
+def courier_location_ingest(request):
+    """
+    POST {"points": [{"lat": .., "lon": .., "ts": .., "accuracy": ..}, ...]}
+
+    GPS-точки текущего курьера пачкой. В БД пишутся фоновым потоком
+    (delivery/locations.py), поэтому ответ — 202 без записи в запросе.
+    """
+    if request.method != "POST":
+        return JsonResponse({"detail": "Method not allowed"}, status=405)
+
+    user: User | None = request.user if request.user.is_authenticated else None
+    if user is None:
+        return JsonResponse({"detail": "Authentication required"}, status=401)
+
+    if user.role != User.Roles.COURIER:
+        return JsonResponse({"detail": "Forbidden"}, status=403)
+
+    courier_id = request.access.courier_id
+    if courier_id is None:
+        return JsonResponse({"detail": "Courier profile not found"}, status=404)
+
+    data = _parse_json(request)
+    if not isinstance(data, dict):
+        return JsonResponse({"detail": "Invalid JSON"}, status=400)
+
+    try:
+        points = parse_points(data.get("points"))
+    except ValueError as exc:
+        return JsonResponse({"detail": str(exc)}, status=400)
+
+    if not ingest(courier_id, points):
+        return JsonResponse({"detail": "Location buffer is full, retry later"}, status=503)
+
+    return JsonResponse({"accepted": len(points)}, status=202)
+
+
+# какой переход заказа сопровождает переход задачи доставки
+ORDER_TRANSITION_FOR_TASK = {
+    DeliveryTask.Status.IN_PROGRESS: (Order.Status.READY, Order.Status.ON_DELIVERY),
+    DeliveryTask.Status.DONE: (Order.Status.ON_DELIVERY, Order.Status.DELIVERED),
+}
+
+
 @csrf_exempt
 def delivery_task_change_status(request, task_id: int):
     if request.method != 'PATCH':
@@ -230,15 +752,7 @@ def delivery_task_change_status(request, task_id: int):
     if user is None:
         return JsonResponse({'detail': 'Authentication required'}, status=401)
 
-    try:
-        task = DeliveryTask.objects.select_related('courier__user').get(pk=task_id)
-    except DeliveryTask.DoesNotExist:
-        raise Http404('Delivery task not found')
-
-    if user.role == User.Roles.COURIER:
-        if task.courier is None or task.courier.user_id != user.id:
-            return JsonResponse({'detail': 'Forbidden'}, status=403)
-    elif user.role != User.Roles.ADMIN:
+    if user.role not in (User.Roles.COURIER, User.Roles.ADMIN):
         return JsonResponse({'detail': 'Forbidden'}, status=403)
 
     data = _parse_json(request)
@@ -252,23 +766,90 @@ def delivery_task_change_status(request, task_id: int):
             status=400
         )
 
-    task.status = new_status
-    task.save()
+    # задачу назначают только на курьера: оффер, claim-next, диспетчер или рейс
+    if new_status == DeliveryTask.Status.ASSIGNED:
+        return JsonResponse(
+            {'detail': 'Tasks are assigned to a courier via the offer endpoints'},
+            status=400,
+        )
+
+    courier_filter = {}
+    if user.role == User.Roles.COURIER:
+        if request.access.courier_id is None:
+            return JsonResponse({'detail': 'Courier profile not found'}, status=404)
+        courier_filter['courier_id'] = request.access.courier_id
 
-    # синхронизируем статус заказа
-    if new_status == DeliveryTask.Status.IN_PROGRESS:
-        order = task.order
-        order.status = Order.Status.ON_DELIVERY
-        order.save()
-    elif new_status == DeliveryTask.Status.DONE:
-        order = task.order
-        order.status = Order.Status.DELIVERED
-        order.save()
+    # статус задачи и статус заказа меняются в одной транзакции условными UPDATE
+    now = timezone.now()
+    with transaction.atomic():
+        updated = (
+            DeliveryTask.objects
+            .filter(
+                pk=task_id,
+                status__in=DeliveryTask.sources_for(new_status),
+                **courier_filter,
+            )
+            .update(
+                status=new_status,
+                updated_at=now,
+                # время каждого перехода сохраняется для истории и модели ETA
+                **{DeliveryTask.STATUS_TIMESTAMPS[new_status]: now},
+            )
+        )
+        if updated:
+            task_row = (
+                DeliveryTask.objects
+                .filter(pk=task_id)
+                .values('order_id', 'order__restaurant_id', 'courier_id', 'run_id')
+                .get()
+            )
+            if new_status == DeliveryTask.Status.DONE and task_row['run_id'] is not None:
+                complete_run_if_done(task_row['run_id'])
+            if new_status in ORDER_TRANSITION_FOR_TASK:
+                from_status, to_status = ORDER_TRANSITION_FOR_TASK[new_status]
+                # если заказ уже в нужном статусе, переход просто не применится
+                transition_order(task_row['order_id'], from_status, to_status)
+
+            channels = [
+                f'order:{task_row["order_id"]}',
+                f'restaurant:{task_row["order__restaurant_id"]}',
+            ]
+            if task_row['courier_id'] is not None:
+                channels.append(f'courier:{task_row["courier_id"]}')
+            publish_on_commit(
+                channels,
+                {
+                    'type': 'delivery.status',
+                    'task_id': task_id,
+                    'order_id': task_row['order_id'],
+                    'status': new_status,
+                },
+            )
+
+    if not updated:
+        row = (
+            DeliveryTask.objects
+            .filter(pk=task_id)
+            .values('status', 'courier_id')
+            .first()
+        )
+        if row is None:
+            raise Http404('Delivery task not found')
+        if user.role == User.Roles.COURIER and row['courier_id'] != request.access.courier_id:
+            return JsonResponse({'detail': 'Forbidden'}, status=403)
+        return JsonResponse(
+            {
+                'detail': f'Cannot change status from {row["status"]} to {new_status}',
+                'status': row['status'],
+            },
+            status=409,
+            json_dumps_params={'ensure_ascii': False}
+        )
 
     return JsonResponse(
         {
-            'id': task.id,
-            'status': task.status,
+            'id': task_id,
+            'status': new_status,
         },
         json_dumps_params={'ensure_ascii': False}
     )
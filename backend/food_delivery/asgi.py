@@ -9,8 +9,14 @@ https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
+from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'food_delivery.settings')
 
 application = get_asgi_application()
+
+# в разработке статику (админка) раздавал runserver — под uvicorn отдаём её сами
+if settings.DEBUG:
+    application = ASGIStaticFilesHandler(application)
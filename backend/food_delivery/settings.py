@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -37,10 +38,12 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'users.apps.UsersConfig',
     'restaurants.apps.RestaurantsConfig',
     'orders.apps.OrdersConfig',
     'delivery.apps.DeliveryConfig',
+    'realtime.apps.RealtimeConfig',
 ]
 
 MIDDLEWARE = [
@@ -49,6 +52,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'users.tokens.TokenAuthenticationMiddleware',
+    'users.access.AccessMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -88,6 +93,48 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+#
+# По умолчанию — in-memory кэш процесса (TTL + вытеснение по MAX_ENTRIES),
+# только для разработки в одном процессе. В кеше лежат версии меню, которые
+# меняют и фоновые команды (release_stop_list), поэтому при нескольких
+# процессах задайте REDIS_URL, чтобы кэш был общим (docker-compose так и делает).
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'food-delivery',
+            'OPTIONS': {
+                'MAX_ENTRIES': 10000,
+                'CULL_FREQUENCY': 3,
+            },
+        }
+    }
+
+
+# Push-уведомления (SSE, /api/events/)
+# InProcessBackend — только для разработки в одном процессе: события из
+# других процессов (dispatcher, stop_list, воркеры uvicorn) до него не доходят.
+# В docker-compose и в проде — 'realtime.hub.PostgresNotifyBackend'.
+
+REALTIME_BACKEND = os.environ.get('REALTIME_BACKEND', 'realtime.hub.InProcessBackend')
+
+
+# Токены API (Authorization: Bearer, см. users/tokens.py), время жизни в секундах
+
+ACCESS_TOKEN_TTL = int(os.environ.get('ACCESS_TOKEN_TTL', 5 * 60))
+REFRESH_TOKEN_TTL = int(os.environ.get('REFRESH_TOKEN_TTL', 14 * 24 * 60 * 60))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -0,0 +1,48 @@
+"""
+Потоковые ответы, которые работают и под WSGI, и под ASGI.
+
+Под ASGI Django не умеет отдавать синхронный итератор потоком: он целиком
+вычитывает его через sync_to_async(list) и только потом отправляет тело.
+streaming_response в ASGI-запросе оборачивает синхронный генератор
+в асинхронный, который забирает части пачками по STREAM_BATCH_SIZE через
+sync_to_async — в одном и том же потоке запроса, поэтому серверный курсор
+(QuerySet.iterator) продолжает работать между пачками.
+"""
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+
+STREAM_BATCH_SIZE = 200
+
+
+def _next_batch(iterator, size: int) -> list:
+    batch = []
+    for part in iterator:
+        batch.append(part)
+        if len(batch) >= size:
+            break
+    return batch
+
+
+async def iterate_async(iterable, batch_size: int = STREAM_BATCH_SIZE):
+    """Асинхронный генератор поверх синхронного итератора, читающего БД."""
+    # тело генератора начинает выполняться только на первом next() — уже в потоке
+    iterator = iter(iterable)
+    try:
+        while True:
+            batch = await sync_to_async(_next_batch)(iterator, batch_size)
+            for part in batch:
+                yield part
+            if len(batch) < batch_size:
+                return
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            # генератор закрывается в том же потоке, где держит курсор
+            await sync_to_async(close)()
+
+
+def streaming_response(request, iterable, **kwargs) -> StreamingHttpResponse:
+    if isinstance(request, ASGIRequest):
+        iterable = iterate_async(iterable)
+    return StreamingHttpResponse(iterable, **kwargs)
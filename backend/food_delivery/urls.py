@@ -24,4 +24,5 @@ urlpatterns = [
     path('api/', include('restaurants.urls')),
     path('api/', include('orders.urls')),
     path('api/', include('delivery.urls')),
+    path('api/', include('realtime.urls')),
 ]
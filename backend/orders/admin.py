@@ -1,5 +1,9 @@
 from django.contrib import admin
+from django.db import transaction
+from django.utils import timezone
+
 from .models import Order, OrderItem
+from .rollups import rebuild_rollups, record_orders_deleted
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
@@ -10,3 +14,27 @@ class OrderAdmin(admin.ModelAdmin):
     list_display = ('id', 'client', 'restaurant', 'status', 'created_at', 'total_price')
     list_filter = ('status', 'restaurant')
     inlines = [OrderItemInline]
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # позиции правятся инлайном, поэтому документ заказа пересобираем после них
+        order = form.instance
+        items = order.items.select_related('menu_item')
+        Order.objects.filter(pk=order.pk).update(
+            summary=order.build_summary(items),
+            updated_at=timezone.now(),
+        )
+        # ручная правка статуса или позиций в обход переходов — пересобираем агрегаты ресторана
+        restaurant_ids = {order.restaurant_id, form.initial.get('restaurant')} - {None}
+        rebuild_rollups(restaurant_ids=restaurant_ids)
+
+    # удалённые заказы вычитаем из агрегатов ресторанов (кеш статистики сбрасывается там же)
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            record_orders_deleted(Order.objects.filter(pk=obj.pk))
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            record_orders_deleted(queryset)
+            super().delete_queryset(request, queryset)
@@ -0,0 +1,111 @@
+"""
+Поддержка заголовка Idempotency-Key для POST /api/orders/.
+
+Первый ответ на пару (пользователь, ключ) сохраняется в кэше с TTL.
+Повтор с тем же ключом получает сохранённый ответ и не доходит до таблиц
+заказов; параллельный повтор, пока первый запрос ещё выполняется, получает 409.
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+# сколько помним выполненный запрос
+IDEMPOTENCY_RESPONSE_TTL = 60 * 60 * 24
+# сколько держим отметку "в процессе", если воркер упал посреди запроса
+IDEMPOTENCY_LOCK_TTL = 60
+# сколько раз пытаемся поставить отметку, если ключ исчезает между add() и get()
+IDEMPOTENCY_ADD_ATTEMPTS = 3
+
+_IN_PROGRESS = 'in_progress'
+_DONE = 'done'
+
+
+def _cache_key(scope: str, user_id: int, key: str) -> str:
+    digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+    return f'idempotency:{scope}:{user_id}:{digest}'
+
+
+def _replay(stored: dict) -> HttpResponse:
+    response = HttpResponse(
+        stored['content'],
+        status=stored['status'],
+        content_type=stored['content_type'],
+    )
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _in_progress() -> HttpResponse:
+    response = JsonResponse(
+        {'detail': 'A request with this Idempotency-Key is still in progress'},
+        status=409,
+    )
+    response['Retry-After'] = '1'
+    return response
+
+
+def run_idempotent(request, user, scope: str, handler) -> HttpResponse:
+    """
+    Выполняет handler() не больше одного раза на (user, Idempotency-Key).
+
+    Без заголовка (или без пользователя) просто вызывает handler().
+    """
+    key = request.headers.get('Idempotency-Key')
+    if not key or user is None:
+        return handler()
+
+    if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        return JsonResponse({'detail': 'Idempotency-Key is too long'}, status=400)
+
+    cache_key = _cache_key(scope, user.id, key)
+    fingerprint = hashlib.sha256(request.body).hexdigest()
+
+    # add() атомарен: только первый запрос с этим ключом ставит отметку "в процессе"
+    for _ in range(IDEMPOTENCY_ADD_ATTEMPTS):
+        if cache.add(
+            cache_key,
+            {'state': _IN_PROGRESS, 'fingerprint': fingerprint},
+            timeout=IDEMPOTENCY_LOCK_TTL,
+        ):
+            break
+        stored = cache.get(cache_key)
+        if stored is None:
+            # ключ истёк или вытеснен между add() и get() — пробуем занять его снова,
+            # а не выполняем handler без отметки
+            continue
+        if stored['fingerprint'] != fingerprint:
+            return JsonResponse(
+                {'detail': 'Idempotency-Key was already used with a different request'},
+                status=422,
+            )
+        if stored['state'] == _IN_PROGRESS:
+            return _in_progress()
+        return _replay(stored)
+    else:
+        return _in_progress()
+
+    try:
+        response = handler()
+    except Exception:
+        cache.delete(cache_key)
+        raise
+
+    # ошибки сервера не запоминаем — клиент должен иметь возможность повторить
+    if response.status_code >= 500:
+        cache.delete(cache_key)
+        return response
+
+    cache.set(
+        cache_key,
+        {
+            'state': _DONE,
+            'fingerprint': fingerprint,
+            'status': response.status_code,
+            'content': response.content,
+            'content_type': response['Content-Type'],
+        },
+        timeout=IDEMPOTENCY_RESPONSE_TTL,
+    )
+    return response
@@ -0,0 +1,273 @@
+import random
+import re
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from delivery.models import CourierProfile, DeliveryTask
+from orders.models import Order, OrderItem, RestaurantDailyStats
+from orders.rollups import rebuild_rollups
+from restaurants.models import MenuItem, Restaurant
+from users.models import User
+
+BENCH_PREFIX = 'bench_'
+BATCH_SIZE = 5000
+
+_EXECUTION_TIME_RE = re.compile(r'Execution Time: ([\d.]+) ms')
+_INDEX_RE = re.compile(r'(?:Index(?: Only)? Scan(?: Backward)? using|Bitmap Index Scan on) (\w+)')
+_SEQ_SCAN_RE = re.compile(r'Seq Scan on (\w+)')
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет БД синтетическими заказами и печатает EXPLAIN ANALYZE '
+        'для запросов горячих эндпоинтов: время выполнения и использованные индексы.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=200_000)
+        parser.add_argument('--restaurants', type=int, default=200)
+        parser.add_argument('--clients', type=int, default=5_000)
+        parser.add_argument('--couriers', type=int, default=500)
+        parser.add_argument(
+            '--no-seed',
+            action='store_true',
+            help='Не генерировать данные, использовать уже засеянные',
+        )
+        parser.add_argument(
+            '--cleanup',
+            action='store_true',
+            help='Удалить синтетические данные и выйти',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('EXPLAIN ANALYZE benchmark requires PostgreSQL')
+
+        if options['cleanup']:
+            deleted, _ = User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+            self.stdout.write(f'Deleted {deleted} rows')
+            return
+
+        if not options['no_seed']:
+            self._seed(options)
+
+        client = User.objects.filter(username__startswith=f'{BENCH_PREFIX}client').first()
+        owner = User.objects.filter(username__startswith=f'{BENCH_PREFIX}owner').first()
+        courier = CourierProfile.objects.filter(user__username__startswith=BENCH_PREFIX).first()
+        if client is None or owner is None or courier is None:
+            raise CommandError('No seeded data found, run without --no-seed first')
+
+        restaurant = Restaurant.objects.filter(owner=owner).first()
+        week_ago = timezone.now() - timedelta(days=7)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        queries = [
+            (
+                'orders list (client)',
+                Order.objects.filter(client=client)
+                .order_by('-created_at', '-id')
+                .values('id', 'created_at', 'status', 'summary')[:50],
+            ),
+            (
+                'orders list (restaurant owner)',
+                Order.objects.filter(restaurant__owner=owner)
+                .order_by('-created_at', '-id')
+                .values('id', 'created_at', 'status', 'summary')[:50],
+            ),
+            (
+                'orders list (admin)',
+                Order.objects.order_by('-created_at', '-id')
+                .values('id', 'created_at', 'status', 'summary')[:50],
+            ),
+            (
+                'orders since watermark (client)',
+                Order.objects.filter(client=client, updated_at__gt=week_ago)
+                .order_by('updated_at', 'id')[:500],
+            ),
+            (
+                'delivery offers feed',
+                DeliveryTask.objects.select_related('order__restaurant')
+                .filter(status=DeliveryTask.Status.PENDING, courier__isnull=True)
+                .order_by('-order__created_at'),
+            ),
+            (
+                'courier active task check',
+                DeliveryTask.objects.filter(
+                    courier=courier,
+                    status__in=[DeliveryTask.Status.ASSIGNED, DeliveryTask.Status.IN_PROGRESS],
+                )[:1],
+            ),
+            (
+                'courier task list',
+                DeliveryTask.objects.filter(courier=courier).order_by('status', '-assigned_at'),
+            ),
+            (
+                'restaurant stats (all, rollups)',
+                RestaurantDailyStats.objects.filter(restaurant=restaurant)
+                .values('status')
+                .annotate(count=Sum('orders_count'), revenue=Sum('revenue'))
+                .order_by(),
+            ),
+        ]
+
+        self.stdout.write(f'{"query":<36} {"ms":>10}  plan')
+        for label, qs in queries:
+            plan = qs.explain(analyze=True, buffers=True)
+            match = _EXECUTION_TIME_RE.search(plan)
+            elapsed = match.group(1) if match else '?'
+            indexes = sorted(set(_INDEX_RE.findall(plan)))
+            seq_scans = sorted(set(_SEQ_SCAN_RE.findall(plan)))
+            notes = []
+            if indexes:
+                notes.append('index: ' + ', '.join(indexes))
+            if seq_scans:
+                notes.append('seq scan: ' + ', '.join(seq_scans))
+            self.stdout.write(f'{label:<36} {elapsed:>10}  {"; ".join(notes)}')
+            if options['verbosity'] > 1:
+                self.stdout.write(plan + '\n')
+
+    def _seed(self, options):
+        rng = random.Random(42)
+        now = timezone.now()
+        self.stdout.write(
+            f'Seeding {options["orders"]} orders, {options["restaurants"]} restaurants, '
+            f'{options["clients"]} clients, {options["couriers"]} couriers...'
+        )
+
+        with transaction.atomic():
+            owners = User.objects.bulk_create(
+                [
+                    User(
+                        username=f'{BENCH_PREFIX}owner{i}',
+                        password='!',
+                        role=User.Roles.RESTAURANT,
+                    )
+                    for i in range(options['restaurants'])
+                ],
+                batch_size=BATCH_SIZE,
+            )
+            clients = User.objects.bulk_create(
+                [
+                    User(username=f'{BENCH_PREFIX}client{i}', password='!')
+                    for i in range(options['clients'])
+                ],
+                batch_size=BATCH_SIZE,
+            )
+            courier_users = User.objects.bulk_create(
+                [
+                    User(
+                        username=f'{BENCH_PREFIX}courier{i}',
+                        password='!',
+                        role=User.Roles.COURIER,
+                    )
+                    for i in range(options['couriers'])
+                ],
+                batch_size=BATCH_SIZE,
+            )
+            couriers = CourierProfile.objects.bulk_create(
+                [CourierProfile(user=user) for user in courier_users],
+                batch_size=BATCH_SIZE,
+            )
+            restaurants = Restaurant.objects.bulk_create(
+                [
+                    Restaurant(owner=owner, name=f'Bench {owner.id}', address='Bench st.')
+                    for owner in owners
+                ],
+                batch_size=BATCH_SIZE,
+            )
+            menu = {
+                restaurant.id: MenuItem.objects.bulk_create(
+                    [
+                        MenuItem(
+                            restaurant=restaurant,
+                            name=f'Dish {n}',
+                            price=Decimal(rng.randint(200, 1500)),
+                        )
+                        for n in range(10)
+                    ]
+                )
+                for restaurant in restaurants
+            }
+
+        statuses = Order.Status.values
+        created = 0
+        while created < options['orders']:
+            size = min(BATCH_SIZE, options['orders'] - created)
+            with transaction.atomic():
+                orders = Order.objects.bulk_create(
+                    [
+                        Order(
+                            client=rng.choice(clients),
+                            restaurant=rng.choice(restaurants),
+                            status=rng.choice(statuses),
+                            delivery_address='Bench ave.',
+                            total_price=Decimal(rng.randint(300, 5000)),
+                        )
+                        for _ in range(size)
+                    ]
+                )
+                OrderItem.objects.bulk_create(
+                    [
+                        OrderItem(
+                            order=order,
+                            menu_item=dish,
+                            quantity=rng.randint(1, 3),
+                            price_at_moment=dish.price,
+                        )
+                        for order in orders
+                        for dish in rng.sample(menu[order.restaurant_id], 2)
+                    ]
+                )
+                tasks = []
+                for order in orders:
+                    if order.status == Order.Status.ON_DELIVERY:
+                        courier = rng.choice(couriers) if rng.random() < 0.5 else None
+                        tasks.append(
+                            DeliveryTask(
+                                order=order,
+                                courier=courier,
+                                status=(
+                                    DeliveryTask.Status.IN_PROGRESS
+                                    if courier else DeliveryTask.Status.PENDING
+                                ),
+                                assigned_at=now if courier else None,
+                            )
+                        )
+                    elif order.status == Order.Status.DELIVERED:
+                        tasks.append(
+                            DeliveryTask(
+                                order=order,
+                                courier=rng.choice(couriers),
+                                status=DeliveryTask.Status.DONE,
+                                assigned_at=now,
+                                completed_at=now,
+                            )
+                        )
+                DeliveryTask.objects.bulk_create(tasks)
+            created += size
+            self.stdout.write(f'  {created} orders')
+
+        # created_at/updated_at проставляются автоматически — размазываем заказы по году
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'WITH shifted AS ('
+                f"  SELECT id, now() - random() * interval '365 days' AS ts "
+                f'  FROM {Order._meta.db_table} '
+                f'  WHERE client_id IN ('
+                f'    SELECT id FROM {User._meta.db_table} WHERE username LIKE %s'
+                f'  )'
+                f') '
+                f'UPDATE {Order._meta.db_table} o '
+                f'SET created_at = shifted.ts, updated_at = shifted.ts '
+                f'FROM shifted WHERE o.id = shifted.id',
+                [f'{BENCH_PREFIX}%'],
+            )
+
+        # заказы вставлены в обход API — агрегаты статистики собираем отдельно
+        rebuild_rollups(restaurant_ids=[restaurant.id for restaurant in restaurants])
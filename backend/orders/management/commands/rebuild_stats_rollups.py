@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from orders.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересобирает дневные агрегаты статистики ресторанов из истории заказов. '
+        'Нужна после первого деплоя и после правок заказов в обход API.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--restaurant',
+            type=int,
+            action='append',
+            dest='restaurants',
+            help='ID ресторана (можно указать несколько раз); по умолчанию — все',
+        )
+
+    def handle(self, *args, **options):
+        daily, items = rebuild_rollups(restaurant_ids=options['restaurants'])
+        self.stdout.write(f'Rebuilt {daily} daily rows and {items} item rows')
@@ -0,0 +1,60 @@
+# Generated by Django 6.0 on 2026-10-17 06:04
+
+from django.db import migrations, models
+
+
+def fill_order_summary(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+
+    batch = []
+    orders = (
+        Order.objects
+        .select_related('restaurant')
+        .prefetch_related('items__menu_item')
+        .order_by('id')
+    )
+    for order in orders.iterator(chunk_size=500):
+        order.summary = {
+            'id': order.id,
+            'client_id': order.client_id,
+            'restaurant_id': order.restaurant_id,
+            'restaurant_name': order.restaurant.name,
+            'restaurant_address': order.restaurant.address,
+            'delivery_address': order.delivery_address,
+            'total_price': str(order.total_price),
+            'created_at': order.created_at.isoformat(),
+            'items': [
+                {
+                    'id': item.id,
+                    'menu_item_id': item.menu_item_id,
+                    'name': item.menu_item.name,
+                    'quantity': item.quantity,
+                    'price': str(item.price_at_moment),
+                    'line_total': str(item.price_at_moment * item.quantity),
+                }
+                for item in order.items.all()
+            ],
+        }
+        batch.append(order)
+        if len(batch) >= 500:
+            Order.objects.bulk_update(batch, ['summary'])
+            batch = []
+
+    if batch:
+        Order.objects.bulk_update(batch, ['summary'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='summary',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.RunPython(fill_order_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 6.0 on 2026-10-17 06:09
+
+from django.db import migrations, models
+
+
+def fill_updated_at(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    Order.objects.update(updated_at=models.F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_order_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.RunPython(fill_updated_at, migrations.RunPython.noop),
+    ]
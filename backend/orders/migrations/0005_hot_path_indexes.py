@@ -0,0 +1,35 @@
+# Generated by Django 6.0 on 2026-10-17 06:11
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # индексы на горячих таблицах строим без блокировки записи
+    atomic = False
+
+    dependencies = [
+        ('orders', '0004_order_updated_at'),
+        ('restaurants', '0004_menusection_menuitem_section'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='order',
+            index=models.Index(fields=['client', '-created_at', '-id'], name='order_client_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='order',
+            index=models.Index(fields=['client', 'updated_at', 'id'], name='order_client_updated_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='order',
+            index=models.Index(fields=['restaurant', '-created_at', '-id'], name='order_restaurant_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='order',
+            index=models.Index(fields=['-created_at', '-id'], name='order_created_idx'),
+        ),
+    ]
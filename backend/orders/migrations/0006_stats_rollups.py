@@ -0,0 +1,43 @@
+# Generated by Django 6.0
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_hot_path_indexes'),
+        ('restaurants', '0004_menusection_menuitem_section'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RestaurantDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('NEW', 'New'), ('COOKING', 'Cooking'), ('READY', 'Ready'), ('ON_DELIVERY', 'On delivery'), ('DELIVERED', 'Delivered'), ('CANCELLED', 'Cancelled')], max_length=15)),
+                ('orders_count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='restaurants.restaurant')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('restaurant', 'day', 'status'), name='uniq_restaurant_daily_stats')],
+            },
+        ),
+        migrations.CreateModel(
+            name='RestaurantItemDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('menu_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='restaurants.menuitem')),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='item_daily_stats', to='restaurants.restaurant')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('restaurant', 'day', 'menu_item'), name='uniq_restaurant_item_daily_stats')],
+            },
+        ),
+    ]
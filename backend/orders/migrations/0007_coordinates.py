@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-17 06:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0006_stats_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='delivery_lat',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='delivery_lon',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -11,6 +11,16 @@ class Order(models.Model):
         DELIVERED = 'DELIVERED', 'Delivered'
         CANCELLED = 'CANCELLED', 'Cancelled'
 
+    # Допустимые переходы статусов: из какого статуса в какие можно перейти
+    TRANSITIONS = {
+        Status.NEW: (Status.COOKING, Status.CANCELLED),
+        Status.COOKING: (Status.READY, Status.CANCELLED),
+        Status.READY: (Status.ON_DELIVERY, Status.CANCELLED),
+        Status.ON_DELIVERY: (Status.DELIVERED,),
+        Status.DELIVERED: (),
+        Status.CANCELLED: (),
+    }
+
     client = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
@@ -27,16 +37,73 @@ class Order(models.Model):
         default=Status.NEW,
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    # обновляется при любом изменении заказа; по нему работает ?since= и ETag
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     total_price = models.DecimalField(
         max_digits=10,
         decimal_places=2,
         default=0,
     )
     delivery_address = models.CharField(max_length=255)
+    delivery_lat = models.FloatField(null=True, blank=True)
+    delivery_lon = models.FloatField(null=True, blank=True)
+    # Денормализованный документ заказа для списка и детальной страницы.
+    # Пишется один раз при создании; статус хранится только в колонке status
+    # и подмешивается при чтении, поэтому смена статуса документ не трогает.
+    summary = models.JSONField(default=dict, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # список заказов клиента и курсорная пагинация по (created_at, id)
+            models.Index(
+                fields=['client', '-created_at', '-id'],
+                name='order_client_created_idx',
+            ),
+            # синхронизация клиента по водяному знаку (?since=)
+            models.Index(
+                fields=['client', 'updated_at', 'id'],
+                name='order_client_updated_idx',
+            ),
+            # заказы ресторана: список владельца и диапазон дат в статистике
+            models.Index(
+                fields=['restaurant', '-created_at', '-id'],
+                name='order_restaurant_created_idx',
+            ),
+            # список админа
+            models.Index(fields=['-created_at', '-id'], name='order_created_idx'),
+        ]
 
     def __str__(self):
         return f"Order #{self.id} ({self.status})"
 
+    @classmethod
+    def sources_for(cls, status: str) -> list[str]:
+        """Статусы, из которых разрешён переход в status."""
+        return [source for source, targets in cls.TRANSITIONS.items() if status in targets]
+
+    def build_summary(self, items) -> dict:
+        return {
+            'id': self.id,
+            'client_id': self.client_id,
+            'restaurant_id': self.restaurant_id,
+            'restaurant_name': self.restaurant.name,
+            'restaurant_address': self.restaurant.address,
+            'delivery_address': self.delivery_address,
+            'total_price': str(self.total_price),
+            'created_at': self.created_at.isoformat(),
+            'items': [
+                {
+                    'id': item.id,
+                    'menu_item_id': item.menu_item_id,
+                    'name': item.menu_item.name,
+                    'quantity': item.quantity,
+                    'price': str(item.price_at_moment),
+                    'line_total': str(item.get_total()),
+                }
+                for item in items
+            ],
+        }
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(
@@ -53,3 +120,57 @@ class OrderItem(models.Model):
 
     def get_total(self):
         return self.price_at_moment * self.quantity
+
+
+class RestaurantDailyStats(models.Model):
+    """
+    Дневной срез заказов ресторана по статусам: сколько заказов в статусе
+    и на какую сумму. Обновляется при создании заказа и смене статуса,
+    пересобирается командой rebuild_stats_rollups.
+    """
+    restaurant = models.ForeignKey(
+        Restaurant,
+        on_delete=models.CASCADE,
+        related_name='daily_stats',
+    )
+    day = models.DateField()
+    status = models.CharField(max_length=15, choices=Order.Status.choices)
+    orders_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['restaurant', 'day', 'status'],
+                name='uniq_restaurant_daily_stats',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.restaurant_id} {self.day} {self.status}: {self.orders_count}'
+
+
+class RestaurantItemDailyStats(models.Model):
+    """
+    Дневные продажи позиции меню по НЕ отменённым заказам.
+    """
+    restaurant = models.ForeignKey(
+        Restaurant,
+        on_delete=models.CASCADE,
+        related_name='item_daily_stats',
+    )
+    day = models.DateField()
+    menu_item = models.ForeignKey(MenuItem, on_delete=models.CASCADE, related_name='daily_stats')
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['restaurant', 'day', 'menu_item'],
+                name='uniq_restaurant_item_daily_stats',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.restaurant_id} {self.day} item {self.menu_item_id}: {self.quantity}'
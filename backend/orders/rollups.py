@@ -0,0 +1,278 @@
+"""
+Дневные агрегаты продаж ресторанов для статистики.
+
+RestaurantDailyStats — (ресторан, день, статус) -> кол-во заказов и сумма;
+RestaurantItemDailyStats — (ресторан, день, блюдо) -> продано штук и выручка
+по не отменённым заказам. День — дата создания заказа в текущей тайм-зоне.
+
+Агрегаты поддерживаются инкрементально в той же транзакции, что и сам заказ:
+INSERT ... ON CONFLICT DO UPDATE прибавляет дельту к счётчикам, поэтому
+параллельные заказы одного ресторана не теряют обновления. Полная пересборка
+из заказов — rebuild_rollups (команда rebuild_stats_rollups); на время
+пересборки запись в агрегаты блокируется.
+
+Суммы агрегатов за целые дни периода кешируются по (ресторан, период,
+текущий день) и сбрасываются после коммита любого изменения агрегатов
+ресторана; неполный первый день скользящего окна считается по заказам.
+"""
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from restaurants.models import Restaurant
+from .models import Order, OrderItem, RestaurantDailyStats, RestaurantItemDailyStats
+
+REBUILD_BATCH_SIZE = 1000
+
+STATS_PERIODS = ('today', '7d', '30d', 'all')
+# страхует от гонки «прочитали старое — сбросили — записали старое в кеш»
+STATS_CACHE_TTL = 300
+
+
+def stats_cache_key(restaurant_id: int, period: str, today) -> str:
+    return f'restaurant_stats:{restaurant_id}:{period}:{today.isoformat()}'
+
+
+def invalidate_stats(restaurant_ids):
+    """Сбрасывает закешированную статистику ресторанов после коммита."""
+    def delete():
+        today = timezone.localdate()
+        cache.delete_many([
+            stats_cache_key(restaurant_id, period, today)
+            for restaurant_id in restaurant_ids
+            for period in STATS_PERIODS
+        ])
+
+    restaurant_ids = list(restaurant_ids)
+    transaction.on_commit(delete)
+
+
+def _bump_daily(restaurant_id: int, day, deltas):
+    """deltas — [(status, delta_count, delta_revenue), ...]"""
+    table = RestaurantDailyStats._meta.db_table
+    values = ', '.join(['(%s, %s, %s, %s, %s)'] * len(deltas))
+    params = []
+    for status, count, revenue in deltas:
+        params += [restaurant_id, day, status, count, revenue]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} AS t (restaurant_id, day, status, orders_count, revenue) '
+            f'VALUES {values} '
+            f'ON CONFLICT (restaurant_id, day, status) DO UPDATE SET '
+            f'orders_count = t.orders_count + EXCLUDED.orders_count, '
+            f'revenue = t.revenue + EXCLUDED.revenue',
+            params,
+        )
+    invalidate_stats([restaurant_id])
+
+
+def _bump_items(restaurant_id: int, day, lines, sign: int):
+    """lines — [(menu_item_id, quantity, line_total), ...]"""
+    if not lines:
+        return
+    table = RestaurantItemDailyStats._meta.db_table
+    values = ', '.join(['(%s, %s, %s, %s, %s)'] * len(lines))
+    params = []
+    for menu_item_id, quantity, line_total in lines:
+        params += [restaurant_id, day, menu_item_id, sign * quantity, sign * line_total]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} AS t (restaurant_id, day, menu_item_id, quantity, revenue) '
+            f'VALUES {values} '
+            f'ON CONFLICT (restaurant_id, day, menu_item_id) DO UPDATE SET '
+            f'quantity = t.quantity + EXCLUDED.quantity, '
+            f'revenue = t.revenue + EXCLUDED.revenue',
+            params,
+        )
+
+
+def record_order_created(order: Order, items):
+    """Учитывает новый заказ. Вызывать в транзакции создания заказа."""
+    day = timezone.localdate(order.created_at)
+    _bump_daily(order.restaurant_id, day, [(order.status, 1, order.total_price)])
+
+    # одна строка на блюдо: в заказе одно блюдо может встречаться несколькими позициями
+    lines: dict[int, list] = {}
+    for item in items:
+        line = lines.setdefault(item.menu_item_id, [0, Decimal('0.00')])
+        line[0] += item.quantity
+        line[1] += item.price_at_moment * item.quantity
+    if order.status != Order.Status.CANCELLED:
+        _bump_items(
+            order.restaurant_id,
+            day,
+            [(menu_item_id, qty, total) for menu_item_id, (qty, total) in lines.items()],
+            sign=1,
+        )
+
+
+def record_status_change(
+    order_id: int,
+    restaurant_id: int,
+    created_at,
+    total_price: Decimal,
+    from_status: str,
+    to_status: str,
+):
+    """
+    Переносит заказ между статусными счётчиками своего дня.
+    При отмене вычитает позиции заказа из продаж блюд.
+    Вызывать в транзакции, применившей переход.
+    """
+    day = timezone.localdate(created_at)
+    _bump_daily(
+        restaurant_id,
+        day,
+        [(from_status, -1, -total_price), (to_status, 1, total_price)],
+    )
+
+    if to_status == Order.Status.CANCELLED:
+        lines = (
+            OrderItem.objects
+            .filter(order_id=order_id)
+            .values('menu_item_id')
+            .annotate(
+                total_quantity=Sum('quantity'),
+                total_revenue=Sum(F('price_at_moment') * F('quantity')),
+            )
+            .order_by()
+            .values_list('menu_item_id', 'total_quantity', 'total_revenue')
+        )
+        _bump_items(restaurant_id, day, list(lines), sign=-1)
+
+
+def record_orders_deleted(orders):
+    """
+    Вычитает заказы из агрегатов их дней. orders — QuerySet заказов;
+    вызывать в транзакции удаления до DELETE, пока позиции ещё на месте.
+    """
+    daily: dict[tuple, list] = {}
+    for row in (
+        orders
+        .annotate(day=TruncDate('created_at'))
+        .values('restaurant_id', 'day', 'status')
+        .annotate(orders_count=Count('id'), revenue=Sum('total_price'))
+        .order_by()
+    ):
+        daily.setdefault((row['restaurant_id'], row['day']), []).append(
+            (row['status'], -row['orders_count'], -(row['revenue'] or 0))
+        )
+    for (restaurant_id, day), deltas in daily.items():
+        _bump_daily(restaurant_id, day, deltas)
+
+    lines: dict[tuple, list] = {}
+    for row in (
+        OrderItem.objects
+        .filter(order__in=orders.values('pk'))
+        .exclude(order__status=Order.Status.CANCELLED)
+        .annotate(day=TruncDate('order__created_at'))
+        .values('order__restaurant_id', 'day', 'menu_item_id')
+        .annotate(
+            total_quantity=Sum('quantity'),
+            total_revenue=Sum(F('price_at_moment') * F('quantity')),
+        )
+        .order_by()
+    ):
+        lines.setdefault((row['order__restaurant_id'], row['day']), []).append(
+            (row['menu_item_id'], row['total_quantity'], row['total_revenue'] or 0)
+        )
+    for (restaurant_id, day), day_lines in lines.items():
+        _bump_items(restaurant_id, day, day_lines, sign=-1)
+
+
+def rebuild_rollups(restaurant_ids=None) -> tuple[int, int]:
+    """
+    Пересчитывает агрегаты из заказов с нуля (для всех ресторанов
+    или только для restaurant_ids). Возвращает (дневных строк, строк по блюдам).
+    """
+    orders = Order.objects.all()
+    items = OrderItem.objects.exclude(order__status=Order.Status.CANCELLED)
+    daily = RestaurantDailyStats.objects.all()
+    item_daily = RestaurantItemDailyStats.objects.all()
+    if restaurant_ids is not None:
+        orders = orders.filter(restaurant_id__in=restaurant_ids)
+        items = items.filter(order__restaurant_id__in=restaurant_ids)
+        daily = daily.filter(restaurant_id__in=restaurant_ids)
+        item_daily = item_daily.filter(restaurant_id__in=restaurant_ids)
+
+    daily_rows = (
+        orders
+        .annotate(day=TruncDate('created_at'))
+        .values('restaurant_id', 'day', 'status')
+        .annotate(orders_count=Count('id'), revenue=Sum('total_price'))
+        .order_by()
+    )
+    item_rows = (
+        items
+        .annotate(day=TruncDate('order__created_at'))
+        .values('order__restaurant_id', 'day', 'menu_item_id')
+        .annotate(
+            total_quantity=Sum('quantity'),
+            total_revenue=Sum(F('price_at_moment') * F('quantity')),
+        )
+        .order_by()
+    )
+
+    if restaurant_ids is None:
+        restaurant_ids = Restaurant.objects.values_list('id', flat=True)
+
+    with transaction.atomic():
+        # Живые заказы в это время добавляют дельты через INSERT ... ON CONFLICT:
+        # без блокировки их строки могли бы столкнуться со вставкой пересборки
+        # (unique violation) или попасть в агрегаты дважды — и дельтой, и пересчётом.
+        # EXCLUSIVE не мешает чтению статистики, но ждёт чужие записи в агрегаты
+        # и не пускает новые до конца пересборки; заказы читаются уже после неё.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'LOCK TABLE {RestaurantDailyStats._meta.db_table}, '
+                f'{RestaurantItemDailyStats._meta.db_table} IN EXCLUSIVE MODE'
+            )
+        invalidate_stats(restaurant_ids)
+        daily.delete()
+        item_daily.delete()
+        daily_count = _bulk_insert(
+            RestaurantDailyStats,
+            (
+                RestaurantDailyStats(
+                    restaurant_id=row['restaurant_id'],
+                    day=row['day'],
+                    status=row['status'],
+                    orders_count=row['orders_count'],
+                    revenue=row['revenue'] or 0,
+                )
+                for row in daily_rows.iterator()
+            ),
+        )
+        item_count = _bulk_insert(
+            RestaurantItemDailyStats,
+            (
+                RestaurantItemDailyStats(
+                    restaurant_id=row['order__restaurant_id'],
+                    day=row['day'],
+                    menu_item_id=row['menu_item_id'],
+                    quantity=row['total_quantity'],
+                    revenue=row['total_revenue'] or 0,
+                )
+                for row in item_rows.iterator()
+            ),
+        )
+    return daily_count, item_count
+
+
+def _bulk_insert(model, objects) -> int:
+    inserted = 0
+    batch = []
+    for obj in objects:
+        batch.append(obj)
+        if len(batch) >= REBUILD_BATCH_SIZE:
+            model.objects.bulk_create(batch)
+            inserted += len(batch)
+            batch = []
+    if batch:
+        model.objects.bulk_create(batch)
+        inserted += len(batch)
+    return inserted
@@ -0,0 +1,87 @@
+"""
+Смена статуса заказа как атомарный compare-and-set.
+
+Переход применяется одним условным UPDATE по (id, ожидаемый статус), который
+пишет только колонку status. Если заказ успели перевести другим запросом
+(кухня и курьер меняют статус параллельно), UPDATE не затронет ни одной
+строки и переход считается не выполненным — без потерянных обновлений.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from orders.models import Order
+from orders.rollups import record_status_change
+from delivery.geo import grid_cell
+from delivery.models import DeliveryTask
+from realtime.hub import publish_on_commit
+
+
+def transition_order(order_id: int, from_status: str, to_status: str, **filters) -> bool:
+    """
+    Переводит заказ из from_status в to_status, если он всё ещё в from_status.
+
+    filters — дополнительные условия для того же UPDATE
+    (например, restaurant_id__in для проверки владельца).
+    Возвращает True, если переход применён.
+    """
+    if to_status not in Order.TRANSITIONS.get(from_status, ()):
+        return False
+
+    with transaction.atomic():
+        updated = (
+            Order.objects
+            .filter(pk=order_id, status=from_status, **filters)
+            .update(status=to_status, updated_at=timezone.now())
+        )
+        if not updated:
+            return False
+
+        # при передаче заказа в доставку заводим задачу доставки в той же транзакции;
+        # если задача уже есть, оставляем её как есть и оффер заново не объявляем
+        if to_status == Order.Status.ON_DELIVERY:
+            pickup = (
+                Order.objects
+                .filter(pk=order_id)
+                .values_list('restaurant__lat', 'restaurant__lon')
+                .get()
+            )
+            cell_y, cell_x = grid_cell(*pickup)
+            task, created = DeliveryTask.objects.get_or_create(
+                order_id=order_id,
+                defaults={
+                    'status': DeliveryTask.Status.PENDING,
+                    'created_at': timezone.now(),
+                    'cell_y': cell_y,
+                    'cell_x': cell_x,
+                },
+            )
+            if created:
+                publish_on_commit(
+                    ['offers'],
+                    {'type': 'offer.created', 'order_id': order_id, 'task_id': task.id},
+                )
+
+        row = (
+            Order.objects
+            .filter(pk=order_id)
+            .values('restaurant_id', 'delivery_task__courier_id', 'created_at', 'total_price')
+            .get()
+        )
+        record_status_change(
+            order_id,
+            row['restaurant_id'],
+            row['created_at'],
+            row['total_price'],
+            from_status,
+            to_status,
+        )
+
+        channels = [f'order:{order_id}', f'restaurant:{row["restaurant_id"]}']
+        if row['delivery_task__courier_id'] is not None:
+            channels.append(f'courier:{row["delivery_task__courier_id"]}')
+        publish_on_commit(
+            channels,
+            {'type': 'order.status', 'order_id': order_id, 'status': to_status},
+        )
+
+    return True
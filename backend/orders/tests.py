@@ -1,3 +1,349 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+
+from django.core.cache import cache
+from django.test import AsyncClient, TestCase
+from django.utils import timezone
+
+from orders import idempotency
+from orders.rollups import rebuild_rollups
+
+from orders.models import Order, RestaurantDailyStats, RestaurantItemDailyStats
+from orders.status import transition_order
+from restaurants.models import MenuItem, Restaurant
+from users.models import User
+
+
+class OrderApiTestCase(TestCase):
+    """Ресторан с меню и клиент, который оформляет заказы через API."""
+
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='x', role=User.Roles.RESTAURANT)
+        self.client_user = User.objects.create_user('client', password='x', role=User.Roles.CLIENT)
+        self.restaurant = Restaurant.objects.create(owner=self.owner, name='R', address='A')
+        self.item = MenuItem.objects.create(restaurant=self.restaurant, name='Фо бо', price='10.50')
+        self.client.force_login(self.client_user)
+
+    def create_order(self, quantity: int = 1, **headers):
+        return self.client.post(
+            '/api/orders/',
+            json.dumps(
+                {
+                    'restaurant_id': self.restaurant.id,
+                    'delivery_address': 'addr',
+                    'items': [{'menu_item_id': self.item.id, 'quantity': quantity}],
+                }
+            ),
+            content_type='application/json',
+            **headers,
+        )
+
+
+class OrderStatusTransitionTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='x', role=User.Roles.RESTAURANT)
+        client = User.objects.create_user('client', password='x', role=User.Roles.CLIENT)
+        self.restaurant = Restaurant.objects.create(owner=self.owner, name='R', address='A')
+        self.order = Order.objects.create(
+            client=client,
+            restaurant=self.restaurant,
+            delivery_address='a',
+            total_price=1,
+        )
+        self.client.force_login(self.owner)
+
+    def change_status(self, **data):
+        return self.client.patch(
+            f'/api/orders/{self.order.id}/status/',
+            json.dumps(data),
+            content_type='application/json',
+        )
+
+    def test_transition_applies_only_from_expected_status(self):
+        self.assertTrue(
+            transition_order(self.order.id, Order.Status.NEW, Order.Status.COOKING)
+        )
+        # второй такой же переход уже не применяется
+        self.assertFalse(
+            transition_order(self.order.id, Order.Status.NEW, Order.Status.COOKING)
+        )
+        self.assertFalse(
+            transition_order(self.order.id, Order.Status.COOKING, Order.Status.DELIVERED)
+        )
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.Status.COOKING)
+
+    def test_endpoint_applies_transition(self):
+        response = self.change_status(status=Order.Status.COOKING)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], Order.Status.COOKING)
+
+    def test_stale_expected_status_conflicts(self):
+        Order.objects.filter(pk=self.order.id).update(status=Order.Status.CANCELLED)
+
+        response = self.change_status(
+            status=Order.Status.COOKING,
+            expected_status=Order.Status.NEW,
+        )
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['status'], Order.Status.CANCELLED)
+        self.assertEqual(response.json()['allowed'], [])
+
+    def test_disallowed_transition_lists_allowed(self):
+        response = self.change_status(status=Order.Status.DELIVERED)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(
+            response.json()['allowed'],
+            [Order.Status.COOKING, Order.Status.CANCELLED],
+        )
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.Status.NEW)
+
+
+class OrderListPaginationTests(OrderApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.order_ids = [self.create_order().json()['id'] for _ in range(5)]
+
+    def test_keyset_pages_cover_every_order_once(self):
+        seen = []
+        url = '/api/orders/?limit=2'
+        while url:
+            page = self.client.get(url).json()
+            seen += [order['id'] for order in page['results']]
+            url = f'/api/orders/?limit=2&cursor={page["next"]}' if page['next'] else None
+
+        self.assertEqual(seen, sorted(self.order_ids, reverse=True))
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/orders/?cursor=not-a-cursor')
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_stream_returns_full_list(self):
+        response = self.client.get('/api/orders/?stream=1')
+
+        self.assertTrue(response.streaming)
+        body = b''.join(response.streaming_content)
+        self.assertEqual(
+            [order['id'] for order in json.loads(body)],
+            sorted(self.order_ids, reverse=True),
+        )
+
+
+class OrderSyncTests(OrderApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.order_ids = [self.create_order().json()['id'] for _ in range(3)]
+        self.start = timezone.now() - timedelta(minutes=5)
+        for offset, order_id in enumerate(self.order_ids):
+            self.touch(order_id, self.start + timedelta(seconds=offset + 1))
+
+    def touch(self, order_id: int, updated_at):
+        Order.objects.filter(id=order_id).update(updated_at=updated_at)
+
+    def sync(self, since: str, etag: str | None = None):
+        headers = {'If-None-Match': etag} if etag else {}
+        return self.client.get('/api/orders/', {'since': since}, headers=headers)
+
+    def test_since_returns_only_changes_after_watermark(self):
+        first = self.sync(self.start.isoformat()).json()
+        self.assertEqual([order['id'] for order in first['results']], self.order_ids)
+        self.assertFalse(first['has_more'])
+
+        self.touch(self.order_ids[0], timezone.now() - timedelta(minutes=1))
+        second = self.sync(first['watermark']).json()
+
+        self.assertEqual([order['id'] for order in second['results']], [self.order_ids[0]])
+
+    def test_same_updated_at_is_not_lost_across_batches(self):
+        for order_id in self.order_ids:
+            self.touch(order_id, self.start + timedelta(seconds=1))
+
+        with mock.patch('orders.sync.SYNC_BATCH_MAX', 2):
+            first = self.sync(self.start.isoformat()).json()
+            second = self.sync(first['watermark']).json()
+
+        self.assertTrue(first['has_more'])
+        self.assertEqual(
+            [order['id'] for order in first['results'] + second['results']],
+            self.order_ids,
+        )
+
+    def test_recent_changes_wait_for_commit_lag(self):
+        watermark = self.sync(self.start.isoformat()).json()['watermark']
+        self.touch(self.order_ids[1], timezone.now())
+
+        # строка моложе задержки может быть обгоняющей незакоммиченную —
+        # её не отдаём и знак за неё не двигаем
+        held = self.sync(watermark)
+        self.assertEqual(held.json(), {'results': [], 'watermark': watermark, 'has_more': False})
+        # ETag ответа не учитывает придержанную строку, иначе после задержки пришёл бы 304
+        etag = held['ETag']
+
+        with mock.patch('orders.sync.SYNC_COMMIT_LAG', timedelta(0)):
+            released = self.sync(watermark, etag=etag)
+
+        self.assertEqual(released.status_code, 200)
+        self.assertEqual([order['id'] for order in released.json()['results']], [self.order_ids[1]])
+
+    def test_invalid_since(self):
+        self.assertEqual(self.sync('not-a-watermark').status_code, 400)
+
+    def test_etag_returns_not_modified_until_list_changes(self):
+        etag = self.client.get('/api/orders/')['ETag']
+
+        cached = self.client.get('/api/orders/', headers={'If-None-Match': etag})
+        self.assertEqual(cached.status_code, 304)
+
+        self.touch(self.order_ids[0], timezone.now())
+        changed = self.client.get('/api/orders/', headers={'If-None-Match': etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+
+
+class IdempotencyKeyTests(OrderApiTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_repeat_is_replayed_without_new_order(self):
+        first = self.create_order(HTTP_IDEMPOTENCY_KEY='k1')
+        second = self.create_order(HTTP_IDEMPOTENCY_KEY='k1')
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_same_key_with_different_body(self):
+        self.create_order(HTTP_IDEMPOTENCY_KEY='k1')
+        response = self.create_order(quantity=2, HTTP_IDEMPOTENCY_KEY='k1')
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_request_in_progress_conflicts(self):
+        with mock.patch.object(
+            idempotency.cache,
+            'get',
+            return_value={'state': idempotency._IN_PROGRESS, 'fingerprint': mock.ANY},
+        ), mock.patch.object(idempotency.cache, 'add', return_value=False):
+            response = self.create_order(HTTP_IDEMPOTENCY_KEY='k1')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_marker_is_retaken_if_key_vanishes(self):
+        # add() не удался, но к get() ключ уже истёк — handler без отметки не выполняется
+        with mock.patch.object(
+            idempotency.cache, 'add', side_effect=[False, True]
+        ) as add, mock.patch.object(idempotency.cache, 'get', return_value=None):
+            response = self.create_order(HTTP_IDEMPOTENCY_KEY='k1')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(add.call_count, 2)
+
+    def test_server_errors_are_not_remembered(self):
+        with mock.patch('orders.views._order_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.create_order(HTTP_IDEMPOTENCY_KEY='k1')
+
+        response = self.create_order(HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual(response.status_code, 201)
+
+
+class OrderStreamAsgiTests(OrderApiTestCase):
+    async def test_stream_is_served_asynchronously(self):
+        order_ids = []
+        for _ in range(3):
+            response = await sync_to_async(self.create_order)()
+            order_ids.append(response.json()['id'])
+        client = AsyncClient()
+        await client.aforce_login(self.client_user)
+
+        response = await client.get('/api/orders/?stream=1')
+
+        # синхронный итератор под ASGI был бы вычитан целиком до отправки
+        self.assertTrue(response.is_async)
+        body = b''.join([part async for part in response.streaming_content])
+        self.assertEqual([order['id'] for order in json.loads(body)], order_ids[::-1])
+
+
+class StatsRollupTests(OrderApiTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def rollup_rows(self):
+        return (
+            sorted(
+                RestaurantDailyStats.objects
+                .filter(orders_count__gt=0)
+                .values_list('day', 'status', 'orders_count', 'revenue')
+            ),
+            sorted(
+                RestaurantItemDailyStats.objects
+                .values_list('day', 'menu_item_id', 'quantity', 'revenue')
+            ),
+        )
+
+    def stats(self, period: str):
+        self.client.force_login(self.owner)
+        return self.client.get(f'/api/restaurants/{self.restaurant.id}/stats/', {'period': period}).json()
+
+    def test_deltas_match_full_rebuild(self):
+        kept = self.create_order(quantity=2).json()['id']
+        cancelled = self.create_order(quantity=3).json()['id']
+        transition_order(kept, Order.Status.NEW, Order.Status.COOKING)
+        transition_order(cancelled, Order.Status.NEW, Order.Status.CANCELLED)
+
+        daily, items = self.rollup_rows()
+        today = timezone.localdate()
+        self.assertEqual(
+            daily,
+            [
+                (today, Order.Status.CANCELLED, 1, Decimal('31.50')),
+                (today, Order.Status.COOKING, 1, Decimal('21.00')),
+            ],
+        )
+        # отменённый заказ вычтен из продаж блюда
+        self.assertEqual(items, [(today, self.item.id, 2, Decimal('21.00'))])
+
+        rebuild_rollups([self.restaurant.id])
+        self.assertEqual(self.rollup_rows(), (daily, items))
+
+    def test_status_change_invalidates_cached_stats(self):
+        order_id = self.create_order().json()['id']
+        self.assertEqual(self.stats('today')['status_counts'][Order.Status.NEW], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            transition_order(order_id, Order.Status.NEW, Order.Status.COOKING)
+
+        counts = self.stats('today')['status_counts']
+        self.assertEqual((counts[Order.Status.NEW], counts[Order.Status.COOKING]), (0, 1))
+
+    def test_rolling_window_cuts_the_first_day_by_time(self):
+        now = timezone.now()
+        self.create_order()
+        inside, outside, old = (self.create_order().json()['id'] for _ in range(3))
+        Order.objects.filter(id=inside).update(created_at=now - timedelta(days=7) + timedelta(minutes=5))
+        Order.objects.filter(id=outside).update(created_at=now - timedelta(days=7) - timedelta(minutes=5))
+        Order.objects.filter(id=old).update(created_at=now - timedelta(days=9))
+        rebuild_rollups([self.restaurant.id])
+
+        week = self.stats('7d')
+
+        self.assertEqual(week['totals']['orders_count'], 2)
+        self.assertEqual(week['top_items'][0]['quantity'], 2)
+        self.assertEqual(sum(day['orders_count'] for day in week['by_day']), 2)
+        self.assertEqual(self.stats('all')['totals']['orders_count'], 4)
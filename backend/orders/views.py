@@ -1,15 +1,25 @@
+import base64
 import json
+from datetime import datetime
 from decimal import Decimal
 
 from django.db import transaction
+from django.db.models import Q
 from django.http import JsonResponse, Http404
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
 
+from delivery.eta import estimate_delivery
+from food_delivery.streaming import streaming_response
+from delivery.geo import parse_point
+from delivery.locations import courier_position
 from users.models import User
+from orders.idempotency import run_idempotent
 from orders.models import Order, OrderItem
+from orders.rollups import record_order_created
+from orders.status import transition_order
+from orders.sync import changed_since, collection_etag, decode_watermark, not_modified, sync_cutoff
 from restaurants.models import Restaurant, MenuItem
-from delivery.models import DeliveryTask
 
 
 def _parse_json(request):
@@ -19,56 +29,162 @@ def _parse_json(request):
         return None
 
 
+ORDERS_PAGE_SIZE = 50
+ORDERS_PAGE_SIZE_MAX = 200
+ORDERS_STREAM_CHUNK_SIZE = 500
+
+
+def _encode_cursor(created_at: datetime, order_id: int) -> str:
+    raw = f'{created_at.isoformat()}|{order_id}'
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def _decode_cursor(cursor: str):
+    """
+    Курсор keyset-пагинации: позиция последнего отданного заказа (created_at, id).
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        created_at_raw, order_id = raw.rsplit('|', 1)
+        created_at = datetime.fromisoformat(created_at_raw)
+        return created_at, int(order_id)
+    except (ValueError, UnicodeError):
+        return None
+
+
+def _order_document(row: dict) -> dict:
+    """
+    Готовый документ заказа из Order.summary + актуальный статус из колонки.
+    """
+    return {**row['summary'], 'status': row['status']}
+
+
+def _stream_orders(qs):
+    """
+    Отдаёт JSON-массив заказов по мере чтения из серверного курсора,
+    не собирая весь список в памяти.
+    """
+    yield '['
+    for index, row in enumerate(qs.iterator(chunk_size=ORDERS_STREAM_CHUNK_SIZE)):
+        if index:
+            yield ','
+        yield json.dumps(_order_document(row), ensure_ascii=False)
+    yield ']'
+
+
 @csrf_exempt
 def order_list_or_create(request):
+    """
+    GET: список заказов текущего пользователя.
+
+    - без параметров — весь список (как раньше);
+    - ?limit=N и/или ?cursor=... — страница по (created_at, id) и курсор next;
+    - ?stream=1 — весь список потоком, без накопления в памяти;
+    - ?since=<watermark> — только изменённые заказы и новый водяной знак.
+
+    Ответ содержит ETag; при совпадении If-None-Match возвращается 304.
+
+    POST: создать заказ; поддерживает заголовок Idempotency-Key.
+    """
     user: User | None = request.user if request.user.is_authenticated else None
 
     if request.method == 'GET':
         if user is None:
             return JsonResponse({'detail': 'Authentication required'}, status=401)
 
-        qs = Order.objects.select_related('client', 'restaurant').prefetch_related('items__menu_item').all()
+        qs = Order.objects.all()
 
+        # рестораны и профиль курьера берём из request.access — без JOIN по владельцу
         if user.role == User.Roles.CLIENT:
             qs = qs.filter(client=user)
         elif user.role == User.Roles.RESTAURANT:
-            qs = qs.filter(restaurant__owner=user)
+            qs = qs.filter(restaurant_id__in=request.access.owned_restaurant_ids)
         elif user.role == User.Roles.COURIER:
-            qs = qs.filter(delivery_task__courier__user=user)
+            courier_id = request.access.courier_id
+            qs = qs.filter(delivery_task__courier_id=courier_id) if courier_id else qs.none()
         else:
             pass # Админ видит всё
 
-        data = []
-        for order in qs.order_by('-created_at'):
-            items_data = []
-            for item in order.items.all():
-                items_data.append(
-                    {
-                        'id': item.id,
-                        'menu_item_id': item.menu_item_id,
-                        'name': item.menu_item.name,
-                        'quantity': item.quantity,
-                        'price': str(item.price_at_moment),
-                        'line_total': str(item.get_total()),
-                    }
-                )
-            data.append(
+        since = request.GET.get('since')
+        # ?since= отдаёт только строки старше задержки коммита — ETag по ним же
+        cutoff = sync_cutoff() if since else None
+        etag = collection_etag(request, qs, cutoff)
+        not_modified_response = not_modified(request, etag)
+        if not_modified_response is not None:
+            return not_modified_response
+
+        qs = qs.values('id', 'created_at', 'updated_at', 'status', 'summary')
+
+        if since:
+            position = decode_watermark(since)
+            if position is None:
+                return JsonResponse({'detail': 'Invalid since'}, status=400)
+            rows, watermark, has_more = changed_since(qs, position, cutoff)
+            response = JsonResponse(
                 {
-                    'id': order.id,
-                    'status': order.status,
-                    'client_id': order.client_id,
-                    'restaurant_id': order.restaurant_id,
-                    'restaurant_name': order.restaurant.name,
-                    'delivery_address': order.delivery_address,
-                    'total_price': str(order.total_price),
-                    'created_at': order.created_at.isoformat(),
-                    'items': items_data,
-                }
+                    'results': [_order_document(row) for row in rows],
+                    'watermark': watermark,
+                    'has_more': has_more,
+                },
+                json_dumps_params={'ensure_ascii': False},
             )
-        return JsonResponse(data, safe=False, json_dumps_params={'ensure_ascii': False})
+            response['ETag'] = etag
+            return response
+
+        qs = qs.order_by('-created_at', '-id')
+
+        if request.GET.get('stream') == '1':
+            response = streaming_response(
+                request,
+                _stream_orders(qs),
+                content_type='application/json',
+            )
+            response['Cache-Control'] = 'no-cache'
+            response['ETag'] = etag
+            return response
+
+        if 'limit' not in request.GET and 'cursor' not in request.GET:
+            data = [_order_document(row) for row in qs]
+            response = JsonResponse(data, safe=False, json_dumps_params={'ensure_ascii': False})
+            response['ETag'] = etag
+            return response
+
+        try:
+            limit = int(request.GET.get('limit', ORDERS_PAGE_SIZE))
+        except ValueError:
+            return JsonResponse({'detail': 'Invalid limit'}, status=400)
+        limit = max(1, min(limit, ORDERS_PAGE_SIZE_MAX))
+
+        cursor = request.GET.get('cursor')
+        if cursor:
+            position = _decode_cursor(cursor)
+            if position is None:
+                return JsonResponse({'detail': 'Invalid cursor'}, status=400)
+            created_at, order_id = position
+            qs = qs.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=order_id)
+            )
+
+        # берём на одну запись больше, чтобы понять, есть ли следующая страница
+        page = list(qs[:limit + 1])
+        has_next = len(page) > limit
+        page = page[:limit]
+
+        response = JsonResponse(
+            {
+                'results': [_order_document(row) for row in page],
+                'next': (
+                    _encode_cursor(page[-1]['created_at'], page[-1]['id'])
+                    if has_next else None
+                ),
+            },
+            json_dumps_params={'ensure_ascii': False},
+        )
+        response['ETag'] = etag
+        return response
 
     if request.method == 'POST':
-        return _order_create(request, user)
+        return run_idempotent(request, user, 'orders', lambda: _order_create(request, user))
 
     return JsonResponse({'detail': 'Method not allowed'}, status=405)
 
@@ -96,81 +212,86 @@ def _order_create(request, user: User | None):
     if not isinstance(items_data, list) or not items_data:
         return JsonResponse({'detail': 'Items must be a non-empty list'}, status=400)
 
+    # координаты точки доставки необязательны, но если переданы — только обе
+    delivery_point = None
+    if data.get('delivery_lat') is not None or data.get('delivery_lon') is not None:
+        delivery_point = parse_point(data.get('delivery_lat'), data.get('delivery_lon'))
+        if delivery_point is None:
+            return JsonResponse({'detail': 'Invalid delivery_lat/delivery_lon'}, status=400)
+    delivery_lat, delivery_lon = delivery_point or (None, None)
+
+    # Сначала разбираем все строки корзины, без обращений к БД
+    lines = []
+    for item in items_data:
+        try:
+            menu_item_id = int(item['menu_item_id'])
+            quantity = int(item.get('quantity', 1))
+        except (KeyError, ValueError, TypeError, AttributeError):
+            return JsonResponse({'detail': 'Invalid item format'}, status=400)
+
+        if quantity <= 0:
+            return JsonResponse({'detail': 'Quantity must be positive'}, status=400)
+
+        lines.append((menu_item_id, quantity))
+
     try:
         restaurant = Restaurant.objects.get(pk=restaurant_id)
     except Restaurant.DoesNotExist:
         return JsonResponse({'detail': 'Restaurant not found'}, status=404)
 
+    # Все позиции корзины одним запросом, проверки наличия и принадлежности — в памяти
+    menu_items = MenuItem.objects.filter(restaurant=restaurant).in_bulk(
+        {menu_item_id for menu_item_id, _ in lines}
+    )
+
+    total_price = Decimal("0.00")
+    priced_lines = []
+    for menu_item_id, quantity in lines:
+        menu_item = menu_items.get(menu_item_id)
+        if menu_item is None:
+            return JsonResponse(
+                {'detail': f'Menu item {menu_item_id} not found for this restaurant'},
+                status=404
+            )
+        if not menu_item.is_available:
+            return JsonResponse(
+                {'detail': f'Menu item {menu_item_id} is not available'},
+                status=400
+            )
+
+        total_price += menu_item.price * quantity
+        priced_lines.append((menu_item, quantity))
+
     with transaction.atomic():
+        # заказ сразу пишется с итоговой суммой, позиции — одним bulk insert
         order = Order.objects.create(
             client=user,
             restaurant=restaurant,
             delivery_address=delivery_address,
+            delivery_lat=delivery_lat,
+            delivery_lon=delivery_lon,
             status=Order.Status.NEW,
-            total_price=Decimal("0.00"),
+            total_price=total_price,
         )
-
-        total_price = Decimal("0.00")
-        items_response = []
-
-        for item in items_data:
-            try:
-                menu_item_id = item['menu_item_id']
-                quantity = int(item.get('quantity', 1))
-            except (KeyError, ValueError, TypeError):
-                transaction.set_rollback(True)
-                return JsonResponse({'detail': 'Invalid item format'}, status=400)
-
-            if quantity <= 0:
-                transaction.set_rollback(True)
-                return JsonResponse({'detail': 'Quantity must be positive'}, status=400)
-
-            try:
-                menu_item = MenuItem.objects.get(pk=menu_item_id, restaurant=restaurant)
-            except MenuItem.DoesNotExist:
-                transaction.set_rollback(True)
-                return JsonResponse(
-                    {'detail': f'Menu item {menu_item_id} not found for this restaurant'},
-                    status=404
+        order_items = OrderItem.objects.bulk_create(
+            [
+                OrderItem(
+                    order=order,
+                    menu_item=menu_item,
+                    quantity=quantity,
+                    price_at_moment=menu_item.price,
                 )
+                for menu_item, quantity in priced_lines
+            ]
+        )
 
-            price = menu_item.price
-            line_total = price * quantity
-            total_price += line_total
-
-            order_item = OrderItem.objects.create(
-                order=order,
-                menu_item=menu_item,
-                quantity=quantity,
-                price_at_moment=price,
-            )
-
-            items_response.append(
-                {
-                    'id': order_item.id,
-                    'menu_item_id': menu_item.id,
-                    'name': menu_item.name,
-                    'quantity': quantity,
-                    'price': str(price),
-                    'line_total': str(line_total),
-                }
-            )
-
-        order.total_price = total_price
-        order.save()
+        # документ для чтения собирается сразу, пока всё нужное уже в памяти
+        summary = order.build_summary(order_items)
+        Order.objects.filter(pk=order.pk).update(summary=summary)
+        record_order_created(order, order_items)
 
     return JsonResponse(
-        {
-            'id': order.id,
-            'status': order.status,
-            'client_id': order.client.id,
-            'restaurant_id': order.restaurant.id,
-            'restaurant_name': order.restaurant.name,
-            'delivery_address': order.delivery_address,
-            'total_price': str(order.total_price),
-            'created_at': order.created_at.isoformat(),
-            'items': items_response,
-        },
+        {**summary, 'status': order.status},
         status=201,
         json_dumps_params={'ensure_ascii': False}
     )
@@ -181,65 +302,72 @@ def order_detail(request, order_id: int):
     if request.method != 'GET':
         return JsonResponse({'detail': 'Method not allowed'}, status=405)
 
-    try:
-        order = (
-            Order.objects
-            .select_related('client', 'restaurant')
-            .prefetch_related('items__menu_item')
-            .get(pk=order_id)
+    # одним запросом по первичному ключу: документ заказа + поля для проверки доступа
+    row = (
+        Order.objects
+        .filter(pk=order_id)
+        .values(
+            'status',
+            'summary',
+            'client_id',
+            'restaurant_id',
+            'delivery_task__courier_id',
+            'delivery_task__courier__vehicle_type',
+            'delivery_task__status',
+            'delivery_task__created_at',
+            'delivery_task__assigned_at',
+            'delivery_task__picked_up_at',
         )
-    except Order.DoesNotExist:
+        .first()
+    )
+    if row is None:
         raise Http404('Order not found')
 
     user: User = request.user
+    access = request.access
 
     # Админ видит всё
     if user.role != User.Roles.ADMIN:
-        if user.role == User.Roles.CLIENT and order.client_id != user.id:
+        if user.role == User.Roles.CLIENT and row['client_id'] != user.id:
             return JsonResponse({'detail': 'Forbidden'}, status=403)
 
-        if user.role == User.Roles.RESTAURANT and order.restaurant.owner_id != user.id:
+        owned = access.owned_restaurant_ids
+        if user.role == User.Roles.RESTAURANT and row['restaurant_id'] not in owned:
             return JsonResponse({'detail': 'Forbidden'}, status=403)
 
-        if user.role == User.Roles.COURIER:
-            # у заказа может не быть задачи доставки или курьера
-            if not hasattr(order, 'delivery_task') or order.delivery_task.courier is None:
-                return JsonResponse({'detail': 'Forbidden'}, status=403)
-            if order.delivery_task.courier.user_id != user.id:
-                return JsonResponse({'detail': 'Forbidden'}, status=403)
+        # у заказа может не быть задачи доставки или курьера
+        if user.role == User.Roles.COURIER and (
+            access.courier_id is None or row['delivery_task__courier_id'] != access.courier_id
+        ):
+            return JsonResponse({'detail': 'Forbidden'}, status=403)
 
-    items_response = []
-    for item in order.items.all():
-        items_response.append(
-            {
-                'id': item.id,
-                'menu_item_id': item.menu_item.id,
-                'name': item.menu_item.name,
-                'quantity': item.quantity,
-                'price': str(item.price_at_moment),
-                'line_total': str(item.get_total()),
-            }
+    document = _order_document(row)
+    # заказ в пути — отдаём последнюю позицию курьера и ожидаемое время доставки
+    if row['status'] == Order.Status.ON_DELIVERY and row['delivery_task__status'] is not None:
+        courier_id = row['delivery_task__courier_id']
+        if courier_id is not None:
+            document['courier_location'] = courier_position(courier_id)
+        document['eta'] = estimate_delivery(
+            row['restaurant_id'],
+            row['delivery_task__courier__vehicle_type'],
+            row['delivery_task__status'],
+            row['delivery_task__created_at'],
+            row['delivery_task__assigned_at'],
+            row['delivery_task__picked_up_at'],
         )
 
-    return JsonResponse(
-        {
-            'id': order.id,
-            'status': order.status,
-            'client_id': order.client.id,
-            'restaurant_id': order.restaurant.id,
-            'restaurant_name': order.restaurant.name,
-            'restaurant_address': order.restaurant.address,
-            'delivery_address': order.delivery_address,
-            'total_price': str(order.total_price),
-            'created_at': order.created_at.isoformat(),
-            'items': items_response,
-        },
-        json_dumps_params={'ensure_ascii': False}
-    )
+    return JsonResponse(document, json_dumps_params={'ensure_ascii': False})
 
 
 @csrf_exempt
 def order_change_status(request, order_id: int):
+    """
+    PATCH {"status": ..., "expected_status": ...}
+
+    Переход проверяется по Order.TRANSITIONS и применяется условным UPDATE
+    по (id, expected_status). expected_status можно не передавать: если в новый
+    статус ведёт единственный переход, он и ожидается, иначе берётся текущий.
+    """
     if request.method != 'PATCH':
         return JsonResponse({'detail': 'Method not allowed'}, status=405)
 
@@ -247,17 +375,9 @@ def order_change_status(request, order_id: int):
     if user is None:
         return JsonResponse({'detail': 'Authentication required'}, status=401)
 
-    try:
-        order = Order.objects.select_related('restaurant__owner').get(pk=order_id)
-    except Order.DoesNotExist:
-        raise Http404('Order not found')
-
     if user.role not in (User.Roles.RESTAURANT, User.Roles.ADMIN):
         return JsonResponse({'detail': 'Forbidden'}, status=403)
 
-    if user.role == User.Roles.RESTAURANT and order.restaurant.owner_id != user.id:
-        return JsonResponse({'detail': 'Forbidden'}, status=403)
-
     data = _parse_json(request)
     if data is None:
         return JsonResponse({'detail': 'Invalid JSON'}, status=400)
@@ -269,25 +389,56 @@ def order_change_status(request, order_id: int):
             status=400
         )
 
-    order.status = new_status
-    order.save()
+    owner_filter = {}
+    if user.role == User.Roles.RESTAURANT:
+        owner_filter['restaurant_id__in'] = request.access.owned_restaurant_ids
 
-    # === ключевое: при переводе заказа "в доставку" создаём DeliveryTask ===
-    if new_status == Order.Status.ON_DELIVERY:
-        # либо берём существующую задачу, либо создаём новую
-        task, created = DeliveryTask.objects.get_or_create(
-            order=order,
-            defaults={
-                "status": DeliveryTask.Status.PENDING,
+    expected_status = data.get('expected_status')
+    if expected_status is None:
+        sources = Order.sources_for(new_status)
+        if len(sources) == 1:
+            expected_status = sources[0]
+        else:
+            expected_status = (
+                Order.objects
+                .filter(pk=order_id)
+                .values_list('status', flat=True)
+                .first()
+            )
+    elif expected_status not in Order.Status.values:
+        return JsonResponse({'detail': 'Invalid expected_status'}, status=400)
+
+    if expected_status is not None and transition_order(
+        order_id, expected_status, new_status, **owner_filter
+    ):
+        return JsonResponse(
+            {
+                'id': order_id,
+                'status': new_status,
             },
+            json_dumps_params={'ensure_ascii': False}
         )
-        # если задача уже существовала, оставляем как есть (на всякий случай можно
-        # добавить логику обновления, но пока не трогаем)
+
+    # переход не применился — разбираемся почему
+    row = (
+        Order.objects
+        .filter(pk=order_id)
+        .values('status', 'restaurant_id')
+        .first()
+    )
+    if row is None:
+        raise Http404('Order not found')
+
+    owned = request.access.owned_restaurant_ids
+    if user.role == User.Roles.RESTAURANT and row['restaurant_id'] not in owned:
+        return JsonResponse({'detail': 'Forbidden'}, status=403)
 
     return JsonResponse(
         {
-            'id': order.id,
-            'status': order.status,
+            'detail': f'Cannot change status from {row["status"]} to {new_status}',
+            'status': row['status'],
+            'allowed': list(Order.TRANSITIONS[row['status']]),
         },
+        status=409,
         json_dumps_params={'ensure_ascii': False}
     )
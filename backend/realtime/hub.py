@@ -0,0 +1,195 @@
+"""
+Fan-out событий по каналам для push-уведомлений клиентам.
+
+Каналы — строки вида "order:<id>", "restaurant:<id>", "courier:<id>", "offers".
+Бэкенд выбирается настройкой REALTIME_BACKEND:
+
+- InProcessBackend (по умолчанию, только для разработки) — подписчики живут
+  в памяти процесса; события, опубликованные другими процессами (dispatcher,
+  stop_list и т.п.), до них не доходят;
+- PostgresNotifyBackend — публикация через NOTIFY, каждая нода слушает LISTEN
+  и раздаёт события своим подписчикам; масштабируется на несколько нод
+  без дополнительной инфраструктуры.
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIPTION_QUEUE_SIZE = 100
+
+
+class Subscription:
+    """
+    Очередь событий одного подключённого клиента.
+
+    Публикация может идти из любого потока (синхронные view работают в пуле
+    потоков), поэтому события кладутся в asyncio-очередь через event loop подписчика.
+    """
+
+    def __init__(self, channels, loop: asyncio.AbstractEventLoop):
+        self.channels = frozenset(channels)
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIPTION_QUEUE_SIZE)
+
+    def push(self, event: dict):
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # event loop подписчика уже закрыт — клиент отключился
+            pass
+
+    def _put(self, event: dict):
+        # медленный клиент не должен копить события бесконечно — выкидываем самое старое
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout: float):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class InProcessBackend:
+    def __init__(self):
+        self._subscribers: dict[str, set[Subscription]] = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channels) -> Subscription:
+        subscription = Subscription(channels, asyncio.get_running_loop())
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is None:
+                    continue
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[channel]
+
+    def publish(self, channels, event: dict):
+        self._dispatch(channels, event)
+
+    def _dispatch(self, channels, event: dict):
+        with self._lock:
+            targets = set()
+            for channel in channels:
+                targets.update(self._subscribers.get(channel, ()))
+        for subscription in targets:
+            subscription.push(event)
+
+
+class PostgresNotifyBackend(InProcessBackend):
+    """
+    Публикует события через pg_notify, а фоновый поток каждой ноды
+    слушает канал и раздаёт их локальным подписчикам.
+
+    Рассчитан на psycopg2 (см. requirements.txt). Размер NOTIFY ограничен
+    ~8000 байт, поэтому в событиях передаются идентификаторы, а не документы.
+    """
+
+    pg_channel = 'realtime_events'
+    poll_interval = 5
+
+    def __init__(self):
+        super().__init__()
+        self._listener: threading.Thread | None = None
+        self._listener_lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def subscribe(self, channels) -> Subscription:
+        self._ensure_listener()
+        return super().subscribe(channels)
+
+    def publish(self, channels, event: dict):
+        payload = json.dumps({'channels': list(channels), 'event': event})
+        with connections['default'].cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [self.pg_channel, payload])
+
+    def _ensure_listener(self):
+        with self._listener_lock:
+            if self._listener is not None and self._listener.is_alive():
+                return
+            self._listener = threading.Thread(
+                target=self._listen,
+                name='realtime-pg-listener',
+                daemon=True,
+            )
+            self._listener.start()
+
+    def close(self):
+        """Останавливает поток-слушатель и закрывает его соединение."""
+        self._stopped.set()
+        with self._listener_lock:
+            if self._listener is not None:
+                self._listener.join()
+                self._listener = None
+
+    def _listen(self):
+        # отдельное соединение: LISTEN живёт, пока открыто соединение
+        wrapper = connections.create_connection('default')
+        wrapper.ensure_connection()
+        raw = wrapper.connection
+        with raw.cursor() as cursor:
+            cursor.execute(f'LISTEN {self.pg_channel}')
+
+        try:
+            while not self._stopped.is_set():
+                readable, _, _ = select.select([raw], [], [], self.poll_interval)
+                if not readable:
+                    continue
+                raw.poll()
+                while raw.notifies:
+                    notify = raw.notifies.pop(0)
+                    try:
+                        message = json.loads(notify.payload)
+                    except ValueError:
+                        logger.warning('Malformed realtime payload: %r', notify.payload)
+                        continue
+                    self._dispatch(message['channels'], message['event'])
+        except Exception:
+            logger.exception('Realtime listener stopped')
+        finally:
+            wrapper.close()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                backend_path = getattr(
+                    settings,
+                    'REALTIME_BACKEND',
+                    'realtime.hub.InProcessBackend',
+                )
+                _backend = import_string(backend_path)()
+    return _backend
+
+
+def publish_on_commit(channels, event: dict):
+    """
+    Отправляет событие подписчикам после коммита текущей транзакции
+    (или сразу, если транзакции нет).
+    """
+    channels = list(channels)
+    transaction.on_commit(lambda: get_backend().publish(channels, event))
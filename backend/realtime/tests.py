@@ -0,0 +1,61 @@
+import subprocess
+import sys
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.test import TransactionTestCase
+
+from realtime.hub import PostgresNotifyBackend
+
+# отдельный процесс, как dispatcher или stop_list в docker-compose
+PUBLISH_SCRIPT = """
+import sys
+
+import django
+
+django.setup()
+
+from django.conf import settings
+
+settings.DATABASES['default']['NAME'] = sys.argv[1]
+
+from realtime.hub import PostgresNotifyBackend
+
+PostgresNotifyBackend().publish(['order:1'], {'type': 'order.status', 'order_id': 1})
+"""
+
+
+def publish_from_other_process(database_name: str):
+    subprocess.run(
+        [sys.executable, '-c', PUBLISH_SCRIPT, database_name],
+        cwd=settings.BASE_DIR,
+        check=True,
+        timeout=30,
+    )
+
+
+class PostgresNotifyBackendTests(TransactionTestCase):
+    def setUp(self):
+        self.backend = PostgresNotifyBackend()
+        self.backend.poll_interval = 0.2
+        self.addCleanup(self.backend.close)
+
+    async def test_event_from_another_process_wakes_subscriber(self):
+        subscription = self.backend.subscribe(['order:1'])
+        other = self.backend.subscribe(['order:2'])
+        self.addCleanup(self.backend.unsubscribe, subscription)
+        self.addCleanup(self.backend.unsubscribe, other)
+
+        event = None
+        # LISTEN выполняется в фоновом потоке — публикуем, пока он не поднимется
+        for _ in range(10):
+            await sync_to_async(publish_from_other_process, thread_sensitive=False)(
+                connection.settings_dict['NAME'],
+            )
+            event = await subscription.get(timeout=1)
+            if event is not None:
+                break
+
+        self.assertEqual(event, {'type': 'order.status', 'order_id': 1})
+        self.assertTrue(other.queue.empty())
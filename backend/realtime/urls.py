@@ -0,0 +1,6 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('events/', views.event_stream, name='event_stream'),
+]
@@ -0,0 +1,123 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+
+from orders.models import Order
+from users.models import User
+from .hub import get_backend
+
+# как часто слать комментарий-пинг, чтобы прокси не закрывали соединение
+KEEPALIVE_INTERVAL = 15
+
+
+class _Forbidden(Exception):
+    pass
+
+
+def _resolve_channels(user: User, access, params) -> list[str]:
+    """
+    Проверяет доступ к запрошенным каналам и возвращает их имена.
+
+    ?order=<id>       — статус конкретного заказа (клиент, ресторан, курьер заказа);
+    ?restaurant=<id>  — все заказы ресторана (владелец);
+    ?courier=me       — свои задачи доставки и новые офферы (курьер);
+    админ может подписаться на любой канал, в т.ч. ?courier=<id>.
+    """
+    channels = []
+    is_admin = user.role == User.Roles.ADMIN
+
+    for raw_id in params.getlist('order'):
+        try:
+            order_id = int(raw_id)
+        except ValueError:
+            raise _Forbidden
+        if not is_admin:
+            row = (
+                Order.objects
+                .filter(pk=order_id)
+                .values('client_id', 'restaurant_id', 'delivery_task__courier_id')
+                .first()
+            )
+            if row is None or not (
+                row['client_id'] == user.id
+                or row['restaurant_id'] in access.owned_restaurant_ids
+                or (
+                    access.courier_id is not None
+                    and row['delivery_task__courier_id'] == access.courier_id
+                )
+            ):
+                raise _Forbidden
+        channels.append(f'order:{order_id}')
+
+    for raw_id in params.getlist('restaurant'):
+        try:
+            restaurant_id = int(raw_id)
+        except ValueError:
+            raise _Forbidden
+        if not is_admin and restaurant_id not in access.owned_restaurant_ids:
+            raise _Forbidden
+        channels.append(f'restaurant:{restaurant_id}')
+
+    courier = params.get('courier')
+    if courier is not None:
+        if courier == 'me':
+            courier_id = access.courier_id
+        elif is_admin and courier.isdigit():
+            courier_id = int(courier)
+        else:
+            courier_id = None
+        if courier_id is None:
+            raise _Forbidden
+        channels += [f'courier:{courier_id}', 'offers']
+
+    return channels
+
+
+def _format_event(event: dict) -> str:
+    data = json.dumps(event, ensure_ascii=False)
+    return f"event: {event['type']}\ndata: {data}\n\n"
+
+
+async def event_stream(request):
+    """
+    Server-Sent Events: поток изменений статусов заказов и задач доставки.
+
+    Рассчитан на запуск под ASGI (food_delivery.asgi), где каждое
+    подключение — это корутина, а не занятый поток.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'detail': 'Method not allowed'}, status=405)
+
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({'detail': 'Authentication required'}, status=401)
+
+    try:
+        channels = await sync_to_async(_resolve_channels)(user, request.access, request.GET)
+    except _Forbidden:
+        return JsonResponse({'detail': 'Forbidden'}, status=403)
+
+    if not channels:
+        return JsonResponse({'detail': 'No channels requested'}, status=400)
+
+    backend = get_backend()
+
+    async def stream():
+        subscription = backend.subscribe(channels)
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                event = await subscription.get(KEEPALIVE_INTERVAL)
+                if event is None:
+                    yield ': keep-alive\n\n'
+                else:
+                    yield _format_event(event)
+        finally:
+            backend.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # nginx не должен буферизовать поток событий
+    response['X-Accel-Buffering'] = 'no'
+    return response
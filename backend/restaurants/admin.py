@@ -1,19 +1,61 @@
 from django.contrib import admin
+from delivery.geo import refresh_open_offer_cells
+from users.access import invalidate_access
+from .menu_cache import bump_menu_version
 from .models import Restaurant, MenuItem, MenuSection, RestaurantApplication
 
+
+class MenuVersionAdminMixin:
+    """Правки меню через админку тоже должны сбрасывать кеш меню ресторана."""
+
+    def _menu_restaurant_id(self, obj):
+        return obj.pk if isinstance(obj, Restaurant) else obj.restaurant_id
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        bump_menu_version(self._menu_restaurant_id(form.instance))
+
+    def delete_model(self, request, obj):
+        restaurant_id = self._menu_restaurant_id(obj)
+        super().delete_model(request, obj)
+        bump_menu_version(restaurant_id)
+
+    def delete_queryset(self, request, queryset):
+        restaurant_ids = {self._menu_restaurant_id(obj) for obj in queryset}
+        super().delete_queryset(request, queryset)
+        for restaurant_id in restaurant_ids:
+            bump_menu_version(restaurant_id)
+
+
 class MenuItemInline(admin.TabularInline):
     model = MenuItem
     extra = 0
 
 
 @admin.register(Restaurant)
-class RestaurantAdmin(admin.ModelAdmin):
-    list_display = ('name', 'owner', 'address')
+class RestaurantAdmin(MenuVersionAdminMixin, admin.ModelAdmin):
+    list_display = ('name', 'owner', 'address', 'lat', 'lon')
     search_fields = ('name', 'address')
 
+    # владельцы ресторанов кешируются в users.access — сбрасываем при смене
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        invalidate_access(obj.owner_id, form.initial.get('owner'))
+        if change and {'lat', 'lon'} & set(form.changed_data):
+            refresh_open_offer_cells(obj.id, obj.lat, obj.lon)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        invalidate_access(obj.owner_id)
+
+    def delete_queryset(self, request, queryset):
+        owner_ids = set(queryset.values_list('owner_id', flat=True))
+        super().delete_queryset(request, queryset)
+        invalidate_access(*owner_ids)
+
 
 @admin.register(MenuItem)
-class MenuItemAdmin(admin.ModelAdmin):
+class MenuItemAdmin(MenuVersionAdminMixin, admin.ModelAdmin):
     list_display = ('name', 'restaurant', 'price', 'is_available')
     list_filter = ('restaurant', 'is_available')
     search_fields = ('name',)
@@ -28,7 +70,7 @@ class RestaurantApplicationAdmin(admin.ModelAdmin):
 
 
 @admin.register(MenuSection)
-class MenuSectionAdmin(admin.ModelAdmin):
+class MenuSectionAdmin(MenuVersionAdminMixin, admin.ModelAdmin):
     list_display = ("id", "name", "restaurant", "ordering")
     list_filter = ("restaurant",)
     search_fields = ("name", "restaurant__name")
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from restaurants.stop_list import release_expired
+
+
+class Command(BaseCommand):
+    help = (
+        'Возвращает в меню позиции, у которых истёк срок стоп-листа. '
+        'Запускается по расписанию или, с --interval, как постоянный процесс.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=0,
+            help='Повторять каждые N секунд (по умолчанию — один проход)',
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        while True:
+            released = release_expired()
+            if released or options['verbosity'] > 1:
+                self.stdout.write(f'Released {released} menu items')
+            if interval <= 0:
+                return
+            time.sleep(interval)
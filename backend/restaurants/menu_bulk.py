@@ -0,0 +1,343 @@
+"""
+Массовый импорт и экспорт меню ресторана.
+
+Документ меню (JSON):
+
+    {
+        "sections": [{"name": "Супы", "ordering": 1}, ...],
+        "items": [
+            {"id": 12, "section": "Супы", "name": "Фо бо", "description": "...",
+             "price": "450.00", "is_available": true},
+            ...
+        ]
+    }
+
+CSV — те же позиции, по строке на блюдо, с заголовком
+id,section,name,description,price,is_available; порядок существующих
+разделов не меняется, новые добавляются в конец в порядке упоминания.
+
+Позиция с id обновляет блюдо ресторана с этим id, без id — блюдо
+с тем же названием, если оно есть, иначе создаётся новое. Блюда,
+которых нет в документе, не трогаются.
+"""
+import csv
+import io
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from .models import MenuItem, MenuSection, Restaurant
+
+MENU_IMPORT_MAX_ITEMS = 2000
+MENU_EXPORT_CHUNK_SIZE = 500
+
+CSV_COLUMNS = ('id', 'section', 'name', 'description', 'price', 'is_available')
+ITEM_FIELDS = ('section_id', 'name', 'description', 'price', 'is_available', 'unavailable_until')
+
+_TRUE_VALUES = {'1', 'true', 'yes', 'y', 'да'}
+_FALSE_VALUES = {'0', 'false', 'no', 'n', 'нет', ''}
+
+
+class MenuImportError(Exception):
+    def __init__(self, errors):
+        super().__init__('Invalid menu document')
+        self.errors = errors
+
+
+def parse_menu_json(raw: bytes) -> dict:
+    try:
+        document = json.loads(raw.decode('utf-8'))
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        raise MenuImportError(['Invalid JSON'])
+    if not isinstance(document, dict) or not isinstance(document.get('items'), list):
+        raise MenuImportError(['Ожидается объект с массивом items'])
+    if not isinstance(document.get('sections', []), list):
+        raise MenuImportError(['sections должен быть массивом'])
+    return document
+
+
+def parse_menu_csv(raw: bytes) -> dict:
+    try:
+        text = raw.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise MenuImportError(['CSV должен быть в UTF-8'])
+
+    reader = csv.DictReader(io.StringIO(text))
+    missing = {'name', 'price'} - set(reader.fieldnames or ())
+    if missing:
+        raise MenuImportError([f'В CSV нет колонок: {", ".join(sorted(missing))}'])
+
+    sections = []
+    items = []
+    for row in reader:
+        section = (row.get('section') or '').strip() or None
+        if section is not None and section not in sections:
+            sections.append(section)
+        items.append(
+            {
+                'id': (row.get('id') or '').strip() or None,
+                'section': section,
+                'name': row.get('name'),
+                'description': row.get('description') or '',
+                'price': row.get('price'),
+                'is_available': row.get('is_available', '1'),
+            }
+        )
+
+    return {
+        'sections': [{'name': name} for name in sections],
+        'items': items,
+    }
+
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    normalized = str(value).strip().lower()
+    if normalized in _TRUE_VALUES:
+        return True
+    if normalized in _FALSE_VALUES:
+        return False
+    raise ValueError(value)
+
+
+def _parse_price(value) -> Decimal:
+    price = Decimal(str(value).strip())
+    if not price.is_finite() or price < 0 or price != price.quantize(Decimal('0.01')):
+        raise InvalidOperation(value)
+    # max_digits=8, decimal_places=2
+    if price >= Decimal('1000000'):
+        raise InvalidOperation(value)
+    return price
+
+
+def _validate(document, existing_sections, existing_items):
+    """
+    Проверяет документ целиком и собирает все ошибки сразу.
+    Возвращает (разделы {имя: ordering}, позиции [(id или None, поля)]).
+    """
+    errors = []
+
+    sections: dict[str, int | None] = {}
+    for index, raw in enumerate(document.get('sections', [])):
+        if not isinstance(raw, dict):
+            errors.append(f'sections[{index}]: ожидается объект')
+            continue
+        name = str(raw.get('name') or '').strip()
+        if not name:
+            errors.append(f'sections[{index}]: name обязателен')
+            continue
+        ordering = raw.get('ordering')
+        if ordering is not None:
+            try:
+                ordering = int(ordering)
+                if ordering < 0:
+                    raise ValueError
+            except (TypeError, ValueError):
+                errors.append(f'sections[{index}]: некорректный ordering')
+                continue
+        sections[name] = ordering
+
+    items = document['items']
+    if len(items) > MENU_IMPORT_MAX_ITEMS:
+        raise MenuImportError([f'Не больше {MENU_IMPORT_MAX_ITEMS} позиций за раз'])
+
+    items_by_name: dict[str, list[int]] = {}
+    for item_id, item in existing_items.items():
+        items_by_name.setdefault(item.name, []).append(item_id)
+
+    parsed = []
+    seen_ids = set()
+    seen_names = set()
+    for index, raw in enumerate(items):
+        prefix = f'items[{index}]'
+        if not isinstance(raw, dict):
+            errors.append(f'{prefix}: ожидается объект')
+            continue
+
+        name = str(raw.get('name') or '').strip()
+        if not name:
+            errors.append(f'{prefix}: name обязателен')
+            continue
+
+        try:
+            price = _parse_price(raw.get('price'))
+        except (InvalidOperation, ValueError):
+            errors.append(f'{prefix}: некорректная цена')
+            continue
+
+        try:
+            is_available = _parse_bool(raw.get('is_available', True))
+        except ValueError:
+            errors.append(f'{prefix}: некорректный is_available')
+            continue
+
+        section = raw.get('section')
+        section = section.strip() if isinstance(section, str) and section.strip() else None
+        if section is not None and section not in sections and section not in existing_sections:
+            errors.append(f'{prefix}: неизвестный раздел "{section}"')
+            continue
+
+        item_id = raw.get('id')
+        if item_id is not None:
+            try:
+                item_id = int(item_id)
+            except (TypeError, ValueError):
+                errors.append(f'{prefix}: некорректный id')
+                continue
+            if item_id not in existing_items:
+                errors.append(f'{prefix}: позиция {item_id} не найдена в меню ресторана')
+                continue
+        else:
+            matches = items_by_name.get(name, [])
+            if len(matches) > 1:
+                errors.append(f'{prefix}: несколько позиций "{name}", укажите id')
+                continue
+            item_id = matches[0] if matches else None
+
+        if item_id is not None:
+            if item_id in seen_ids:
+                errors.append(f'{prefix}: позиция {item_id} встречается дважды')
+                continue
+            seen_ids.add(item_id)
+        elif name in seen_names:
+            errors.append(f'{prefix}: новая позиция "{name}" встречается дважды')
+            continue
+        seen_names.add(name)
+
+        parsed.append(
+            (
+                item_id,
+                {
+                    'section': section,
+                    'name': name,
+                    'description': str(raw.get('description') or '').strip(),
+                    'price': price,
+                    'is_available': is_available,
+                },
+            )
+        )
+
+    if errors:
+        raise MenuImportError(errors)
+    return sections, parsed
+
+
+def import_menu(restaurant_id: int, document: dict) -> dict:
+    """
+    Применяет документ меню одной транзакцией. Бросает MenuImportError,
+    если документ невалиден — тогда в меню ничего не меняется.
+    """
+    with transaction.atomic():
+        # параллельный импорт в то же меню ждёт завершения этого
+        Restaurant.objects.select_for_update().filter(pk=restaurant_id).exists()
+
+        existing_sections = {
+            section.name: section
+            for section in MenuSection.objects.filter(restaurant_id=restaurant_id)
+        }
+        existing_items = (
+            MenuItem.objects
+            .filter(restaurant_id=restaurant_id)
+            .defer('search_vector')
+            .in_bulk()
+        )
+
+        sections, items = _validate(document, existing_sections, existing_items)
+
+        # ----- разделы -----
+        # разделы без ordering встают после уже существующих
+        next_ordering = max((s.ordering for s in existing_sections.values()), default=0) + 1
+        new_sections = []
+        changed_sections = []
+        for name, ordering in sections.items():
+            section = existing_sections.get(name)
+            if section is None:
+                if ordering is None:
+                    ordering = next_ordering
+                    next_ordering += 1
+                new_sections.append(
+                    MenuSection(restaurant_id=restaurant_id, name=name, ordering=ordering)
+                )
+            elif ordering is not None and section.ordering != ordering:
+                section.ordering = ordering
+                changed_sections.append(section)
+        for section in MenuSection.objects.bulk_create(new_sections):
+            existing_sections[section.name] = section
+        MenuSection.objects.bulk_update(changed_sections, ['ordering'])
+
+        # ----- позиции -----
+        to_create = []
+        to_update = []
+        for item_id, fields in items:
+            section_name = fields.pop('section')
+            section = existing_sections[section_name] if section_name else None
+            # документ задаёт is_available явно — как и ручное переключение,
+            # это отменяет автоматический возврат из стоп-листа
+            values = {
+                **fields,
+                'section_id': section.id if section else None,
+                'unavailable_until': None,
+            }
+            if item_id is None:
+                to_create.append(MenuItem(restaurant_id=restaurant_id, **values))
+                continue
+            item = existing_items[item_id]
+            if any(getattr(item, field) != value for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(item, field, value)
+                to_update.append(item)
+
+        MenuItem.objects.bulk_create(to_create)
+        MenuItem.objects.bulk_update(to_update, ITEM_FIELDS)
+
+    return {
+        'sections_created': len(new_sections),
+        'sections_updated': len(changed_sections),
+        'items_created': len(to_create),
+        'items_updated': len(to_update),
+    }
+
+
+def _export_items(restaurant_id: int):
+    return (
+        MenuItem.objects
+        .filter(restaurant_id=restaurant_id)
+        .order_by('section__ordering', 'section_id', 'id')
+        .values_list('id', 'section__name', 'name', 'description', 'price', 'is_available')
+        .iterator(chunk_size=MENU_EXPORT_CHUNK_SIZE)
+    )
+
+
+def stream_menu_json(restaurant_id: int):
+    """Документ меню в формате импорта, по мере чтения из БД."""
+    sections = list(
+        MenuSection.objects
+        .filter(restaurant_id=restaurant_id)
+        .values('name', 'ordering')
+    )
+    yield '{"sections": ' + json.dumps(sections, ensure_ascii=False) + ', "items": ['
+    for index, row in enumerate(_export_items(restaurant_id)):
+        item = dict(zip(CSV_COLUMNS, row))
+        item['price'] = str(item['price'])
+        if index:
+            yield ','
+        yield json.dumps(item, ensure_ascii=False)
+    yield ']}'
+
+
+class _Echo:
+    """Псевдо-файл для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def stream_menu_csv(restaurant_id: int):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for item_id, section, name, description, price, is_available in _export_items(restaurant_id):
+        yield writer.writerow(
+            [item_id, section or '', name, description, price, '1' if is_available else '0']
+        )
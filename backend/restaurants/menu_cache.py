@@ -0,0 +1,133 @@
+"""
+Кеш публичного меню ресторана.
+
+У каждого ресторана есть счётчик версии меню в кеше; любая запись в меню
+(позиции, разделы, данные ресторана) увеличивает его после коммита.
+Сериализованный JSON меню кешируется под ключом с версией, поэтому старые
+тела не нужно искать и удалять — они просто перестают читаться и истекают.
+Версия же служит сильным ETag ответа.
+"""
+import hashlib
+import json
+import time
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import F
+from django.utils.cache import quote_etag
+
+from .models import MenuItem, Restaurant
+
+MENU_BODY_TTL = 24 * 60 * 60
+# версия истекает, как и тела: ключ заводится для любого id из URL, в т.ч.
+# несуществующего, и не должен жить вечно; после истечения выдаётся новая версия
+MENU_VERSION_TTL = MENU_BODY_TTL
+
+
+def _version_key(restaurant_id: int) -> str:
+    return f'menu:version:{restaurant_id}'
+
+
+def _initial_version() -> int:
+    # если счётчик вытеснен из кеша, новая версия не должна совпасть ни с одной
+    # из уже выданных клиентам, поэтому начинаем не с нуля, а со времени
+    return time.time_ns()
+
+
+def menu_version(restaurant_id: int) -> int:
+    key = _version_key(restaurant_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), timeout=MENU_VERSION_TTL)
+        version = cache.get(key)
+    return version
+
+
+def bump_menu_version(restaurant_id: int):
+    """Инвалидирует меню ресторана после коммита текущей транзакции."""
+    def bump():
+        key = _version_key(restaurant_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _initial_version(), timeout=MENU_VERSION_TTL)
+
+    transaction.on_commit(bump)
+
+
+MENU_ITEM_FIELDS = ('id', 'name', 'description', 'price', 'section_id', 'is_available')
+
+
+def _group_by_section(rows) -> list[dict]:
+    """
+    Строки позиций, уже отсортированные по (ordering раздела, id раздела, id),
+    сворачиваются в разделы; позиции без раздела — последней группой.
+    """
+    sections = []
+    current = None
+    for row in rows:
+        section_id = row['section_id']
+        if current is None or current['id'] != section_id:
+            current = {
+                'id': section_id,
+                'name': row['section__name'],
+                'ordering': row['section__ordering'],
+                'items': [],
+            }
+            sections.append(current)
+        current['items'].append({field: row[field] for field in MENU_ITEM_FIELDS})
+    return sections
+
+
+def _build_menu(restaurant_id: int, grouped: bool):
+    restaurant = (
+        Restaurant.objects
+        .filter(pk=restaurant_id)
+        .values('id', 'name', 'address')
+        .first()
+    )
+    if restaurant is None:
+        return None
+
+    items = MenuItem.objects.filter(restaurant_id=restaurant_id)
+    if not grouped:
+        return {'restaurant': restaurant, 'menu': list(items.values(*MENU_ITEM_FIELDS))}
+
+    # разделы приходят тем же запросом через JOIN, порядок задаёт БД
+    rows = (
+        items
+        .order_by(
+            F('section__ordering').asc(nulls_last=True),
+            F('section_id').asc(nulls_last=True),
+            'id',
+        )
+        .values(*MENU_ITEM_FIELDS, 'section__name', 'section__ordering')
+    )
+    return {'restaurant': restaurant, 'sections': _group_by_section(rows)}
+
+
+def get_menu(restaurant_id: int, grouped: bool = False):
+    """
+    Возвращает (тело JSON в байтах, ETag) или None, если ресторана нет.
+    grouped — меню, сгруппированное по разделам, вместо плоского списка.
+
+    Версия читается ДО запроса в БД: если меню изменят, пока мы его собираем,
+    свежие данные лягут под старую версию, а новая версия будет собрана заново.
+    """
+    version = menu_version(restaurant_id)
+    view = 'grouped' if grouped else 'flat'
+    etag = quote_etag(
+        hashlib.sha1(f'{restaurant_id}:{version}:{view}'.encode('ascii')).hexdigest()
+    )
+    body_key = f'menu:body:{restaurant_id}:{version}:{view}'
+
+    body = cache.get(body_key)
+    if body is None:
+        menu = _build_menu(restaurant_id, grouped)
+        if menu is None:
+            return None
+        body = json.dumps(menu, cls=DjangoJSONEncoder, ensure_ascii=False).encode('utf-8')
+        cache.set(body_key, body, MENU_BODY_TTL)
+
+    return body, etag
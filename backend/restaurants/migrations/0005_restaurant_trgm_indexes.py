@@ -0,0 +1,32 @@
+# Generated by Django 6.0
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0004_menusection_menuitem_section'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # gin_trgm_ops живёт в расширении pg_trgm
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('name'), name='gin_trgm_ops'), name='restaurant_name_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('address'), name='gin_trgm_ops'), name='restaurant_address_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('description'), name='gin_trgm_ops'), name='restaurant_descr_trgm_idx'),
+        ),
+    ]
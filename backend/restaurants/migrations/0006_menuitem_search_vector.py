@@ -0,0 +1,24 @@
+# Generated by Django 6.0
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0005_restaurant_trgm_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='menuitem',
+            name='search_vector',
+            field=models.GeneratedField(db_persist=True, expression=django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.SearchVector('name', config='simple', weight='A'), '||', django.contrib.postgres.search.SearchVector('description', config='simple', weight='B'), django.contrib.postgres.search.SearchConfig('simple')), output_field=django.contrib.postgres.search.SearchVectorField()),
+        ),
+        migrations.AddIndex(
+            model_name='menuitem',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='menuitem_search_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 6.0
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0006_menuitem_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='menuitem',
+            name='unavailable_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='menuitem',
+            index=models.Index(condition=models.Q(('unavailable_until__isnull', False)), fields=['unavailable_until'], name='menuitem_stop_until_idx'),
+        ),
+    ]
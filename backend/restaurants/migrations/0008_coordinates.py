@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-17 06:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0007_menuitem_unavailable_until'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='lat',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='lon',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -1,5 +1,8 @@
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
+from django.db.models.functions import Upper
 
 class Restaurant(models.Model):
     owner = models.ForeignKey(
@@ -10,6 +13,27 @@ class Restaurant(models.Model):
     name = models.CharField(max_length=255)
     address = models.CharField(max_length=255)
     description = models.TextField(blank=True)
+    # точка забора заказов курьерами
+    lat = models.FloatField(null=True, blank=True)
+    lon = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        # icontains в PostgreSQL — это UPPER(col) LIKE UPPER('%q%'),
+        # поэтому триграммные индексы строятся по тому же выражению
+        indexes = [
+            GinIndex(
+                OpClass(Upper('name'), name='gin_trgm_ops'),
+                name='restaurant_name_trgm_idx',
+            ),
+            GinIndex(
+                OpClass(Upper('address'), name='gin_trgm_ops'),
+                name='restaurant_address_trgm_idx',
+            ),
+            GinIndex(
+                OpClass(Upper('description'), name='gin_trgm_ops'),
+                name='restaurant_descr_trgm_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -49,6 +73,29 @@ class MenuItem(models.Model):
     description = models.TextField(blank=True)
     price = models.DecimalField(max_digits=8, decimal_places=2)
     is_available = models.BooleanField(default=True)
+    # стоп-лист с автоматическим возвратом: когда время пройдёт,
+    # команда release_stop_list снова включит позицию
+    unavailable_until = models.DateTimeField(null=True, blank=True)
+    # поисковый вектор считает сама БД при каждой записи строки;
+    # конфигурация 'simple' — названия блюд часто не по-русски ("pho", "margherita")
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector('name', weight='A', config='simple')
+            + SearchVector('description', weight='B', config='simple')
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='menuitem_search_idx'),
+            models.Index(
+                fields=['unavailable_until'],
+                name='menuitem_stop_until_idx',
+                condition=models.Q(unavailable_until__isnull=False),
+            ),
+        ]
 
     def __str__(self):
         return f'{self.name} ({self.restaurant.name})'
@@ -0,0 +1,58 @@
+"""
+Стоп-лист: массовое выключение и включение позиций меню.
+
+Позиции выключаются одним UPDATE по списку id или по разделу меню;
+если указано время возврата, позиция получает unavailable_until и
+release_expired (команда release_stop_list) включит её обратно.
+"""
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .menu_cache import bump_menu_version
+from .models import MenuItem
+
+
+def set_availability(restaurant_id: int, item_ids, section_id, is_available: bool, until=None) -> int:
+    """
+    Меняет доступность позиций ресторана одним UPDATE.
+    Возвращает число изменённых позиций; кеш меню сбрасывается один раз на пачку.
+    """
+    condition = Q()
+    if item_ids:
+        condition |= Q(id__in=item_ids)
+    if section_id is not None:
+        condition |= Q(section_id=section_id)
+
+    updated = (
+        MenuItem.objects
+        .filter(condition, restaurant_id=restaurant_id)
+        .update(
+            is_available=is_available,
+            unavailable_until=None if is_available else until,
+        )
+    )
+    if updated:
+        bump_menu_version(restaurant_id)
+    return updated
+
+
+def release_expired(now=None) -> int:
+    """
+    Включает позиции, у которых истёк срок стоп-листа.
+    Возвращает число включённых позиций.
+    """
+    now = now or timezone.now()
+    table = MenuItem._meta.db_table
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {table} SET is_available = TRUE, unavailable_until = NULL '
+                f'WHERE unavailable_until IS NOT NULL AND unavailable_until <= %s '
+                f'RETURNING restaurant_id',
+                [now],
+            )
+            restaurant_ids = [row[0] for row in cursor.fetchall()]
+        for restaurant_id in set(restaurant_ids):
+            bump_menu_version(restaurant_id)
+    return len(restaurant_ids)
@@ -1,3 +1,465 @@
+import json
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
 from django.test import TestCase
+from django.utils import timezone
+
+from orders.models import Order
+from orders.rollups import record_order_created
+from orders.status import transition_order
+from restaurants import views
+from restaurants.models import MenuItem, MenuSection, Restaurant
+from restaurants.stop_list import release_expired
+from users.models import User
+
+
+class MenuBulkImportTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='x', role=User.Roles.RESTAURANT)
+        self.restaurant = Restaurant.objects.create(owner=self.owner, name='R', address='A')
+        self.section = MenuSection.objects.create(restaurant=self.restaurant, name='Супы', ordering=1)
+        self.item = MenuItem.objects.create(
+            restaurant=self.restaurant,
+            section=self.section,
+            name='Фо бо',
+            price='450.00',
+        )
+        self.client.force_login(self.owner)
+
+    def post_json(self, document):
+        return self.client.post(
+            f'/api/restaurants/{self.restaurant.id}/menu/bulk/',
+            json.dumps(document),
+            content_type='application/json',
+        )
+
+    def test_invalid_document_collects_all_errors_and_changes_nothing(self):
+        response = self.post_json(
+            {
+                'items': [
+                    {'id': self.item.id, 'name': 'Фо бо', 'price': '500.00'},
+                    {'name': '', 'price': '1.00'},
+                    {'name': 'Бургер', 'price': '-1'},
+                    {'name': 'Салат', 'price': '1.005'},
+                    {'name': 'Чай', 'price': '1.00', 'section': 'Напитки'},
+                    {'name': 'Кофе', 'price': '1.00', 'is_available': 'maybe'},
+                    {'id': 999999, 'name': 'Нет такого', 'price': '1.00'},
+                ],
+            }
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            [error.split(':')[0] for error in response.json()['errors']],
+            [f'items[{index}]' for index in range(1, 7)],
+        )
+        self.item.refresh_from_db()
+        self.assertEqual(str(self.item.price), '450.00')
+        self.assertEqual(MenuItem.objects.filter(restaurant=self.restaurant).count(), 1)
+
+    def test_duplicates_are_rejected(self):
+        response = self.post_json(
+            {
+                'items': [
+                    {'id': self.item.id, 'name': 'Фо бо', 'price': '1.00'},
+                    {'id': self.item.id, 'name': 'Фо бо', 'price': '2.00'},
+                    {'name': 'Бургер', 'price': '1.00'},
+                    {'name': 'Бургер', 'price': '2.00'},
+                ],
+            }
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.json()['errors']), 2)
+
+    def test_malformed_json(self):
+        response = self.client.post(
+            f'/api/restaurants/{self.restaurant.id}/menu/bulk/',
+            b'{not json',
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], ['Invalid JSON'])
+
+    def test_valid_document_is_applied(self):
+        response = self.post_json(
+            {
+                'sections': [{'name': 'Напитки'}],
+                'items': [
+                    {'id': self.item.id, 'name': 'Фо бо', 'price': '500.00', 'section': 'Супы'},
+                    {'name': 'Чай', 'price': '100.00', 'section': 'Напитки'},
+                ],
+            }
+        )
+
+        self.assertEqual(response.status_code, 200, response.content)
+        self.item.refresh_from_db()
+        self.assertEqual(str(self.item.price), '500.00')
+        tea = MenuItem.objects.get(restaurant=self.restaurant, name='Чай')
+        self.assertEqual(tea.section.name, 'Напитки')
+
+    def test_other_owner_is_forbidden(self):
+        other = User.objects.create_user('other', password='x', role=User.Roles.RESTAURANT)
+        self.client.force_login(other)
+
+        response = self.post_json({'items': []})
+
+        self.assertEqual(response.status_code, 403)
+
+
+class RestaurantStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='x', role=User.Roles.RESTAURANT)
+        self.client_user = User.objects.create_user('client', password='x', role=User.Roles.CLIENT)
+        self.restaurant = Restaurant.objects.create(owner=self.owner, name='R', address='A')
+        self.client.force_login(self.owner)
+
+    def add_order(self, total_price: str, status=Order.Status.NEW):
+        order = Order.objects.create(
+            client=self.client_user,
+            restaurant=self.restaurant,
+            delivery_address='a',
+            total_price=total_price,
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            record_order_created(order, [])
+            if status != Order.Status.NEW:
+                transition_order(order.id, Order.Status.NEW, status)
+        return order
+
+    def stats(self):
+        return self.client.get(f'/api/restaurants/{self.restaurant.id}/stats/', {'period': 'today'})
+
+    def test_totals(self):
+        self.add_order('10.00')
+        self.add_order('30.00', Order.Status.COOKING)
+        self.add_order('99.00', Order.Status.CANCELLED)
+
+        data = self.stats().json()
+
+        self.assertEqual(
+            data['totals'],
+            {
+                'orders_count': 3,
+                'delivered_count': 0,
+                'cancelled_count': 1,
+                'revenue': '40.00',
+                'avg_check': '20.00',
+            },
+        )
+        self.assertEqual(data['status_counts'][Order.Status.COOKING], 1)
+
+    def test_repeated_request_is_served_from_cache(self):
+        self.add_order('10.00')
+        with mock.patch.object(views, '_rollup_stats_sums', wraps=views._rollup_stats_sums) as build:
+            first = self.stats().json()
+            second = self.stats().json()
+
+        self.assertEqual(build.call_count, 1)
+        self.assertEqual(first['totals'], second['totals'])
+
+    def test_new_order_invalidates_cache(self):
+        self.add_order('10.00')
+        self.stats()
+
+        self.add_order('20.00')
+
+        self.assertEqual(self.stats().json()['totals']['revenue'], '30.00')
+
+    def test_other_owner_is_forbidden(self):
+        other = User.objects.create_user('other', password='x', role=User.Roles.RESTAURANT)
+        self.client.force_login(other)
+
+        self.assertEqual(self.stats().status_code, 403)
+
+
+class MenuCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='x', role=User.Roles.RESTAURANT)
+        self.restaurant = Restaurant.objects.create(owner=self.owner, name='R', address='A')
+        self.item = MenuItem.objects.create(restaurant=self.restaurant, name='Фо бо', price='450.00')
+        self.url = f'/api/restaurants/{self.restaurant.id}/menu/'
+
+    def test_cached_menu_is_served_without_queries(self):
+        first = self.client.get(self.url)
+
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_matching_etag_returns_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.get(self.url, headers={'If-None-Match': etag})
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_owner_write_changes_version(self):
+        etag = self.client.get(self.url)['ETag']
+        self.client.force_login(self.owner)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                f'/api/restaurants/{self.restaurant.id}/menu/manage/{self.item.id}/',
+                json.dumps({'price': '500.00'}),
+                content_type='application/json',
+            )
+
+        response = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['menu'][0]['price'], '500.00')
+
+    def test_unknown_restaurant(self):
+        self.assertEqual(self.client.get('/api/restaurants/999999/menu/').status_code, 404)
+
+
+class RestaurantCatalogueTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user('owner', password='x', role=User.Roles.RESTAURANT)
+        self.restaurants = [
+            Restaurant.objects.create(owner=owner, name='Pho House', address='Lenina 1', description='Суп фо ' * 100),
+            Restaurant.objects.create(owner=owner, name='Pizza', address='Mira 2', description='Неаполитанская пицца'),
+            Restaurant.objects.create(owner=owner, name='Sushi', address='Lenina 5', description=''),
+        ]
+
+    def test_pages_cover_catalogue_once(self):
+        seen = []
+        params = {'limit': 2}
+        while True:
+            page = self.client.get('/api/restaurants/', params).json()
+            seen += [row['id'] for row in page['results']]
+            if page['next'] is None:
+                break
+            params = {'limit': 2, 'cursor': page['next']}
+
+        self.assertEqual(seen, [restaurant.id for restaurant in self.restaurants])
+
+    def test_page_carries_description_excerpt(self):
+        row = self.client.get('/api/restaurants/', {'limit': 1}).json()['results'][0]
+
+        self.assertEqual(len(row['description']), views.RESTAURANT_EXCERPT_LENGTH)
+
+    def test_search_matches_name_address_and_description(self):
+        def search(query):
+            results = self.client.get('/api/restaurants/', {'q': query}).json()['results']
+            return [row['id'] for row in results]
+
+        pho, pizza, sushi = (restaurant.id for restaurant in self.restaurants)
+        self.assertEqual(search('pizza'), [pizza])
+        self.assertEqual(search('lenina'), [pho, sushi])
+        self.assertEqual(search('неаполитан'), [pizza])
+
+    def test_without_parameters_returns_full_list(self):
+        data = {row['id']: row for row in self.client.get('/api/restaurants/').json()}
+
+        self.assertEqual(len(data), 3)
+        self.assertEqual(data[self.restaurants[0].id]['description'], self.restaurants[0].description)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/restaurants/', {'cursor': 'x'}).status_code, 400)
+
+
+class DishSearchTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user('owner', password='x', role=User.Roles.RESTAURANT)
+        self.first = Restaurant.objects.create(owner=owner, name='Pho House', address='A')
+        self.second = Restaurant.objects.create(owner=owner, name='Noodles', address='B')
+        self.pho = MenuItem.objects.create(restaurant=self.first, name='Pho bo', price='10.00')
+        self.pho_ga = MenuItem.objects.create(
+            restaurant=self.second,
+            name='Pho ga',
+            description='Куриный суп',
+            price='9.00',
+        )
+        self.hidden = MenuItem.objects.create(
+            restaurant=self.second,
+            name='Pho chay',
+            price='8.00',
+            is_available=False,
+        )
+        MenuItem.objects.create(restaurant=self.first, name='Margherita', price='12.00')
+
+    def search(self, **params):
+        return self.client.get('/api/restaurants/dishes/search/', params)
+
+    def test_results_are_grouped_by_restaurant_without_unavailable_items(self):
+        results = self.search(q='pho').json()['results']
+
+        self.assertEqual(
+            sorted((group['restaurant']['id'], [item['id'] for item in group['items']]) for group in results),
+            sorted([(self.first.id, [self.pho.id]), (self.second.id, [self.pho_ga.id])]),
+        )
+
+    def test_prefix_and_description_match(self):
+        self.assertEqual(self.search(q='marg').json()['results'][0]['items'][0]['name'], 'Margherita')
+        self.assertEqual(self.search(q='курин').json()['results'][0]['items'][0]['id'], self.pho_ga.id)
+
+    def test_edited_item_is_found_by_new_name(self):
+        self.pho.name = 'Bun bo'
+        self.pho.save()
+
+        results = self.search(q='bun').json()['results']
+
+        self.assertEqual(results[0]['items'][0]['id'], self.pho.id)
+
+    def test_pages_cover_matches_once(self):
+        first = self.search(q='pho', limit=1).json()
+        second = self.search(q='pho', limit=1, cursor=first['next']).json()
+
+        ids = [item['id'] for page in (first, second) for group in page['results'] for item in group['items']]
+        self.assertEqual(sorted(ids), sorted([self.pho.id, self.pho_ga.id]))
+        self.assertIsNone(second['next'])
+
+    def test_query_is_required(self):
+        self.assertEqual(self.search(q='  ').status_code, 400)
+
+
+class StopListTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='x', role=User.Roles.RESTAURANT)
+        self.restaurant = Restaurant.objects.create(owner=self.owner, name='R', address='A')
+        self.section = MenuSection.objects.create(restaurant=self.restaurant, name='Супы', ordering=1)
+        self.soups = [
+            MenuItem.objects.create(restaurant=self.restaurant, section=self.section, name=name, price='1.00')
+            for name in ('Фо бо', 'Фо га')
+        ]
+        self.tea = MenuItem.objects.create(restaurant=self.restaurant, name='Чай', price='1.00')
+        self.client.force_login(self.owner)
+
+    def post(self, document):
+        return self.client.post(
+            f'/api/restaurants/{self.restaurant.id}/menu/stop-list/',
+            json.dumps(document),
+            content_type='application/json',
+        )
+
+    def available(self):
+        return dict(MenuItem.objects.values_list('name', 'is_available'))
+
+    def test_section_and_items_are_switched_in_one_batch(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.post({'item_ids': [self.tea.id], 'section_id': self.section.id})
+
+        self.assertEqual(response.json(), {'updated': 3})
+        self.assertFalse(any(self.available().values()))
+        # кеш меню сбрасывается один раз на пачку
+        self.assertEqual(len(callbacks), 1)
+
+    def test_items_return_after_until(self):
+        until = timezone.now() + timedelta(hours=1)
+        self.post({'item_ids': [self.tea.id], 'until': until.isoformat()})
+        self.assertEqual(self.client.get(f'/api/restaurants/{self.restaurant.id}/menu/stop-list/').json()[0]['id'], self.tea.id)
+
+        self.assertEqual(release_expired(now=until - timedelta(minutes=1)), 0)
+        self.assertEqual(release_expired(now=until), 1)
+
+        self.tea.refresh_from_db()
+        self.assertTrue(self.tea.is_available)
+        self.assertIsNone(self.tea.unavailable_until)
+
+    def test_manual_switch_cancels_timed_return(self):
+        self.post({'item_ids': [self.tea.id], 'until': (timezone.now() + timedelta(hours=1)).isoformat()})
+
+        self.post({'item_ids': [self.tea.id], 'is_available': True})
+
+        self.tea.refresh_from_db()
+        self.assertIsNone(self.tea.unavailable_until)
+
+    def test_menu_import_cancels_timed_return(self):
+        until = timezone.now() + timedelta(hours=1)
+        self.post({'item_ids': [self.tea.id], 'until': until.isoformat()})
+
+        self.client.post(
+            f'/api/restaurants/{self.restaurant.id}/menu/bulk/',
+            json.dumps({'items': [{'id': self.tea.id, 'name': 'Чай', 'price': '1.00', 'is_available': False}]}),
+            content_type='application/json',
+        )
+
+        # позиция выключена импортом насовсем — фоновый возврат её не включит
+        self.assertEqual(release_expired(now=until), 0)
+        self.tea.refresh_from_db()
+        self.assertFalse(self.tea.is_available)
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.post({'item_ids': [self.tea.id], 'is_available': 'no'}).status_code, 400)
+        self.assertEqual(self.post({'is_available': False}).status_code, 400)
+        past = (timezone.now() - timedelta(minutes=1)).isoformat()
+        self.assertEqual(self.post({'item_ids': [self.tea.id], 'until': past}).status_code, 400)
+
+    def test_other_restaurant_items_are_untouched(self):
+        other = Restaurant.objects.create(owner=self.owner, name='R2', address='B')
+        foreign = MenuItem.objects.create(restaurant=other, name='Чужое', price='1.00')
+
+        self.assertEqual(self.post({'item_ids': [foreign.id]}).json(), {'updated': 0})
+        foreign.refresh_from_db()
+        self.assertTrue(foreign.is_available)
+
+
+class GroupedMenuTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='x', role=User.Roles.RESTAURANT)
+        self.restaurant = Restaurant.objects.create(owner=self.owner, name='R', address='A')
+        self.drinks = MenuSection.objects.create(restaurant=self.restaurant, name='Напитки', ordering=2)
+        self.soups = MenuSection.objects.create(restaurant=self.restaurant, name='Супы', ordering=1)
+        self.tea = MenuItem.objects.create(restaurant=self.restaurant, section=self.drinks, name='Чай', price='1.00')
+        self.pho = MenuItem.objects.create(restaurant=self.restaurant, section=self.soups, name='Фо бо', price='1.00')
+        self.bread = MenuItem.objects.create(restaurant=self.restaurant, name='Хлеб', price='1.00')
+        self.url = f'/api/restaurants/{self.restaurant.id}/menu/'
+
+    def grouped(self):
+        sections = self.client.get(self.url, {'grouped': '1'}).json()['sections']
+        return [(section['id'], [item['id'] for item in section['items']]) for section in sections]
+
+    def reorder(self, order):
+        return self.client.patch(
+            f'/api/restaurants/{self.restaurant.id}/sections/',
+            json.dumps({'order': order}),
+            content_type='application/json',
+        )
+
+    def test_sections_follow_ordering_with_unsectioned_last(self):
+        # ресторан и позиции вместе с разделами одним JOIN
+        with self.assertNumQueries(2):
+            grouped = self.grouped()
+
+        self.assertEqual(
+            grouped,
+            [(self.soups.id, [self.pho.id]), (self.drinks.id, [self.tea.id]), (None, [self.bread.id])],
+        )
+
+    def test_grouped_and_flat_menus_have_different_etags(self):
+        flat = self.client.get(self.url)
+        grouped = self.client.get(self.url, {'grouped': '1'})
+
+        self.assertNotEqual(flat['ETag'], grouped['ETag'])
+
+    def test_reorder_rewrites_every_section_in_one_update(self):
+        self.client.force_login(self.owner)
+        self.grouped()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.reorder([self.drinks.id, self.soups.id])
+
+        self.assertEqual(
+            {row['id']: row['ordering'] for row in response.json()},
+            {self.drinks.id: 1, self.soups.id: 2},
+        )
+        self.assertEqual([section_id for section_id, _ in self.grouped()], [self.drinks.id, self.soups.id, None])
+
+    def test_reorder_with_foreign_section_changes_nothing(self):
+        self.client.force_login(self.owner)
+        other = Restaurant.objects.create(owner=self.owner, name='R2', address='B')
+        foreign = MenuSection.objects.create(restaurant=other, name='Чужой', ordering=1)
 
-# Create your tests here.
+        self.assertEqual(self.reorder([self.drinks.id, foreign.id]).status_code, 404)
+        self.drinks.refresh_from_db()
+        self.assertEqual(self.drinks.ordering, 2)
+        self.assertEqual(self.reorder([self.drinks.id, self.drinks.id]).status_code, 400)
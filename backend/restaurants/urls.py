@@ -5,6 +5,7 @@ urlpatterns = [
     path('restaurants/', views.restaurant_list, name='restaurant_list'),
     path('restaurants/my/', views.my_restaurants, name='my_restaurants'),
     path('restaurants/<int:restaurant_id>/menu/', views.restaurant_menu, name='restaurant_menu'),
+    path('restaurants/dishes/search/', views.dish_search, name='dish_search'),
     path('restaurants/apply/', views.restaurant_application_create, name='restaurant_apply'),
 
     path(
@@ -12,6 +13,16 @@ urlpatterns = [
         views.restaurant_menu_manage,
         name='restaurant_menu_manage',
     ),
+    path(
+        'restaurants/<int:restaurant_id>/menu/bulk/',
+        views.restaurant_menu_bulk,
+        name='restaurant_menu_bulk',
+    ),
+    path(
+        'restaurants/<int:restaurant_id>/menu/stop-list/',
+        views.restaurant_stop_list,
+        name='restaurant_stop_list',
+    ),
     path(
         'restaurants/<int:restaurant_id>/menu/manage/<int:item_id>/',
         views.restaurant_menu_item_manage,
@@ -1,19 +1,45 @@
+import base64
 import json
+import re
 from decimal import Decimal
-from datetime import timedelta, date
+from datetime import date, datetime, time, timedelta
 
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse, Http404
+from django.http import HttpResponse, JsonResponse, Http404
 from django.utils import timezone
-from django.db.models import Count, Sum, F, DecimalField, ExpressionWrapper
-from django.db.models.functions import TruncDate, ExtractWeekDay
-
+from django.utils.cache import get_conditional_response
+from django.core.cache import cache
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import Cast, Left
+
+from .menu_bulk import (
+    MenuImportError,
+    import_menu,
+    parse_menu_csv,
+    parse_menu_json,
+    stream_menu_csv,
+    stream_menu_json,
+)
+from .menu_cache import bump_menu_version, get_menu
+from .stop_list import set_availability
 from .models import Restaurant, MenuItem, MenuSection, RestaurantApplication
-from orders.models import Order, OrderItem
+from orders.models import Order, OrderItem, RestaurantDailyStats, RestaurantItemDailyStats
+from orders.rollups import STATS_CACHE_TTL, STATS_PERIODS, stats_cache_key
+from food_delivery.streaming import streaming_response
+from users.access import restaurant_manager_required
 from users.models import User
 
 
+RESTAURANTS_PAGE_SIZE = 20
+RESTAURANTS_PAGE_SIZE_MAX = 100
+RESTAURANT_EXCERPT_LENGTH = 160
+DISH_SEARCH_PAGE_SIZE = 20
+DISH_SEARCH_PAGE_SIZE_MAX = 100
+
+
 def _parse_json(request):
     try:
         return json.loads(request.body.decode("utf-8"))
@@ -22,37 +48,186 @@ def _parse_json(request):
 
 
 def restaurant_list(request):
+    """
+    Каталог ресторанов.
+
+    Без параметров — полный список, как раньше. С ?limit=, ?cursor= или ?q=
+    отдаётся страница {results, next} в компактном виде: описание обрезается
+    до RESTAURANT_EXCERPT_LENGTH символов. ?q= ищет подстроку в названии,
+    адресе и описании (триграммные GIN-индексы, см. Restaurant.Meta).
+    """
     if request.method != 'GET':
         return JsonResponse({'detail': 'Method not allowed'}, status=405)
 
-    restaurants = Restaurant.objects.all().values('id', 'name', 'address', 'description')
-    return JsonResponse(list(restaurants), safe=False, json_dumps_params={'ensure_ascii': False})
+    params = request.GET
+    if not any(key in params for key in ('limit', 'cursor', 'q')):
+        restaurants = Restaurant.objects.all().values('id', 'name', 'address', 'description')
+        return JsonResponse(list(restaurants), safe=False, json_dumps_params={'ensure_ascii': False})
+
+    try:
+        limit = int(params.get('limit', RESTAURANTS_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({'detail': 'Invalid limit'}, status=400)
+    limit = max(1, min(limit, RESTAURANTS_PAGE_SIZE_MAX))
+
+    qs = Restaurant.objects.order_by('id')
+
+    query = (params.get('q') or '').strip()
+    if query:
+        qs = qs.filter(
+            Q(name__icontains=query)
+            | Q(address__icontains=query)
+            | Q(description__icontains=query)
+        )
+
+    cursor = params.get('cursor')
+    if cursor:
+        try:
+            qs = qs.filter(id__gt=int(cursor))
+        except ValueError:
+            return JsonResponse({'detail': 'Invalid cursor'}, status=400)
+
+    # берём на одну запись больше, чтобы понять, есть ли следующая страница
+    page = list(
+        qs.values('id', 'name', 'address')
+        .annotate(excerpt=Left('description', RESTAURANT_EXCERPT_LENGTH))[:limit + 1]
+    )
+    has_next = len(page) > limit
+    page = page[:limit]
+    for row in page:
+        row['description'] = row.pop('excerpt')
+
+    return JsonResponse(
+        {
+            'results': page,
+            'next': str(page[-1]['id']) if has_next else None,
+        },
+        json_dumps_params={'ensure_ascii': False},
+    )
 
 
 def restaurant_menu(request, restaurant_id):
+    """
+    Публичное меню ресторана: плоский список позиций или,
+    с ?grouped=1, позиции по разделам в порядке ordering.
+    """
     if request.method != 'GET':
         return JsonResponse({'detail': 'Method not allowed'}, status=405)
 
-    try:
-        restaurant = Restaurant.objects.get(pk=restaurant_id)
-    except Restaurant.DoesNotExist:
+    # меню отдаётся из кеша по версии, без запросов в БД (см. menu_cache)
+    cached = get_menu(restaurant_id, grouped=request.GET.get('grouped') == '1')
+    if cached is None:
         raise Http404('Restaurant not found')
+    body, etag = cached
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    return response
+
 
-    items = restaurant.menu_items.all().values(
-        'id', 'name', 'description', 'price', 'section_id', 'is_available'
+def _encode_search_cursor(rank: float, item_id: int) -> str:
+    raw = f'{rank!r}|{item_id}'
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def _decode_search_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        rank, item_id = raw.rsplit('|', 1)
+        return float(rank), int(item_id)
+    except (ValueError, UnicodeError):
+        return None
+
+
+def dish_search(request):
+    """
+    Поиск доступных блюд по всем ресторанам: ?q=<запрос>&limit=&cursor=.
+
+    Ищет по MenuItem.search_vector (GIN-индекс), сортирует по релевантности
+    и отдаёт страницу блюд, сгруппированную по ресторанам:
+    {results: [{restaurant, items}], next}.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'detail': 'Method not allowed'}, status=405)
+
+    # каждое слово ищем как префикс ("марг" найдёт "маргарита"), слова — через AND
+    words = re.findall(r'\w+', request.GET.get('q') or '')
+    if not words:
+        return JsonResponse({'detail': 'q обязателен'}, status=400)
+
+    try:
+        limit = int(request.GET.get('limit', DISH_SEARCH_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({'detail': 'Invalid limit'}, status=400)
+    limit = max(1, min(limit, DISH_SEARCH_PAGE_SIZE_MAX))
+
+    query = SearchQuery(
+        ' & '.join(f'{word}:*' for word in words),
+        config='simple',
+        search_type='raw',
+    )
+    qs = (
+        MenuItem.objects
+        .filter(is_available=True, search_vector=query)
+        # ts_rank возвращает real; приводим к double precision, чтобы ранг
+        # из курсора точно совпадал при сравнении на следующей странице
+        .annotate(rank=Cast(SearchRank(F('search_vector'), query), FloatField()))
+        .order_by('-rank', 'id')
     )
 
+    cursor = request.GET.get('cursor')
+    if cursor:
+        position = _decode_search_cursor(cursor)
+        if position is None:
+            return JsonResponse({'detail': 'Invalid cursor'}, status=400)
+        rank, item_id = position
+        qs = qs.filter(Q(rank__lt=rank) | Q(rank=rank, id__gt=item_id))
+
+    # берём на одну запись больше, чтобы понять, есть ли следующая страница
+    page = list(
+        qs.values(
+            'id', 'name', 'description', 'price', 'section_id', 'rank',
+            'restaurant_id', 'restaurant__name', 'restaurant__address',
+        )[:limit + 1]
+    )
+    has_next = len(page) > limit
+    page = page[:limit]
+
+    # группы идут в порядке лучшего блюда ресторана на странице
+    groups: dict[int, dict] = {}
+    for row in page:
+        group = groups.get(row['restaurant_id'])
+        if group is None:
+            group = groups[row['restaurant_id']] = {
+                'restaurant': {
+                    'id': row['restaurant_id'],
+                    'name': row['restaurant__name'],
+                    'address': row['restaurant__address'],
+                },
+                'items': [],
+            }
+        group['items'].append(
+            {
+                'id': row['id'],
+                'name': row['name'],
+                'description': row['description'],
+                'price': str(row['price']),
+                'section_id': row['section_id'],
+                'rank': row['rank'],
+            }
+        )
+
     return JsonResponse(
         {
-            'restaurant': {
-                'id': restaurant.id,
-                'name': restaurant.name,
-                'address': restaurant.address,
-            },
-            'menu': list(items),
+            'results': list(groups.values()),
+            'next': (
+                _encode_search_cursor(page[-1]['rank'], page[-1]['id'])
+                if has_next else None
+            ),
         },
-        safe=False,
-        json_dumps_params={'ensure_ascii': False}
+        json_dumps_params={'ensure_ascii': False},
     )
 
 
@@ -123,23 +298,11 @@ def my_restaurants(request):
 
 @login_required
 @csrf_exempt
+@restaurant_manager_required
 def restaurant_menu_manage(request, restaurant_id: int):
     """
     POST: создать позицию меню для ресторана владельца.
     """
-    user: User = request.user  # type: ignore
-
-    if user.role not in (User.Roles.RESTAURANT, User.Roles.ADMIN):
-        return JsonResponse({'detail': 'Forbidden'}, status=403)
-
-    try:
-        restaurant = Restaurant.objects.get(pk=restaurant_id)
-    except Restaurant.DoesNotExist:
-        return JsonResponse({'detail': 'Restaurant not found'}, status=404)
-
-    if user.role == User.Roles.RESTAURANT and restaurant.owner_id != user.id:
-        return JsonResponse({'detail': 'Forbidden'}, status=403)
-
     if request.method != 'POST':
         return JsonResponse({'detail': 'Method not allowed'}, status=405)
 
@@ -164,18 +327,19 @@ def restaurant_menu_manage(request, restaurant_id: int):
     section = None
     if section_id is not None:
         try:
-            section = MenuSection.objects.get(pk=section_id, restaurant=restaurant)
+            section = MenuSection.objects.get(pk=section_id, restaurant_id=restaurant_id)
         except MenuSection.DoesNotExist:
             return JsonResponse({'detail': 'Section not found'}, status=404)
 
     item = MenuItem.objects.create(
-        restaurant=restaurant,
+        restaurant_id=restaurant_id,
         section=section,
         name=name,
         description=description,
         price=price,
         is_available=is_available,
     )
+    bump_menu_version(restaurant_id)
 
     return JsonResponse(
         {
@@ -193,31 +357,120 @@ def restaurant_menu_manage(request, restaurant_id: int):
 
 @login_required
 @csrf_exempt
-def restaurant_menu_item_manage(request, restaurant_id: int, item_id: int):
+@restaurant_manager_required
+def restaurant_menu_bulk(request, restaurant_id: int):
     """
-    PATCH: обновить (например, доступность, цену, описание)
-    DELETE: удалить позицию меню
+    GET: выгрузить меню целиком (?format=csv — CSV, иначе JSON), потоком.
+    POST: загрузить меню документом JSON или CSV (Content-Type: text/csv)
+    одной транзакцией; формат — см. restaurants.menu_bulk.
     """
-    user: User = request.user  # type: ignore
+    if request.method == 'GET':
+        if request.GET.get('format') == 'csv':
+            response = streaming_response(
+                request,
+                stream_menu_csv(restaurant_id),
+                content_type='text/csv; charset=utf-8',
+            )
+            response['Content-Disposition'] = f'attachment; filename="menu-{restaurant_id}.csv"'
+            return response
+        return streaming_response(
+            request,
+            stream_menu_json(restaurant_id),
+            content_type='application/json',
+        )
 
-    if user.role not in (User.Roles.RESTAURANT, User.Roles.ADMIN):
-        return JsonResponse({'detail': 'Forbidden'}, status=403)
+    if request.method != 'POST':
+        return JsonResponse({'detail': 'Method not allowed'}, status=405)
 
     try:
-        restaurant = Restaurant.objects.get(pk=restaurant_id)
-    except Restaurant.DoesNotExist:
-        return JsonResponse({'detail': 'Restaurant not found'}, status=404)
+        if request.content_type == 'text/csv':
+            document = parse_menu_csv(request.body)
+        else:
+            document = parse_menu_json(request.body)
+        result = import_menu(restaurant_id, document)
+    except MenuImportError as exc:
+        return JsonResponse(
+            {'detail': 'Invalid menu document', 'errors': exc.errors},
+            status=400,
+            json_dumps_params={'ensure_ascii': False},
+        )
 
-    if user.role == User.Roles.RESTAURANT and restaurant.owner_id != user.id:
-        return JsonResponse({'detail': 'Forbidden'}, status=403)
+    bump_menu_version(restaurant_id)
+    return JsonResponse(result)
 
+
+@login_required
+@csrf_exempt
+@restaurant_manager_required
+def restaurant_stop_list(request, restaurant_id: int):
+    """
+    GET: текущий стоп-лист (недоступные позиции).
+    POST: выключить или включить пачку позиций одним запросом:
+        {"item_ids": [..], "section_id": ..., "is_available": false,
+         "until": "2025-01-01T18:00:00+03:00"}
+    item_ids и/или section_id; until — когда вернуть позиции в меню (необязательно).
+    """
+    if request.method == 'GET':
+        items = (
+            MenuItem.objects
+            .filter(restaurant_id=restaurant_id, is_available=False)
+            .values('id', 'name', 'section_id', 'unavailable_until')
+        )
+        return JsonResponse(list(items), safe=False, json_dumps_params={'ensure_ascii': False})
+
+    if request.method != 'POST':
+        return JsonResponse({'detail': 'Method not allowed'}, status=405)
+
+    data = _parse_json(request)
+    if data is None:
+        return JsonResponse({'detail': 'Invalid JSON'}, status=400)
+
+    item_ids = data.get('item_ids') or []
+    section_id = data.get('section_id')
+    if not isinstance(item_ids, list) or not all(isinstance(i, int) for i in item_ids):
+        return JsonResponse({'detail': 'item_ids должен быть списком id'}, status=400)
+    if section_id is not None and not isinstance(section_id, int):
+        return JsonResponse({'detail': 'Некорректный section_id'}, status=400)
+    if not item_ids and section_id is None:
+        return JsonResponse({'detail': 'Нужны item_ids или section_id'}, status=400)
+
+    is_available = data.get('is_available', False)
+    if not isinstance(is_available, bool):
+        return JsonResponse({'detail': 'is_available должен быть true или false'}, status=400)
+
+    until = None
+    if data.get('until') is not None:
+        if is_available:
+            return JsonResponse({'detail': 'until задаётся только при выключении'}, status=400)
+        try:
+            until = datetime.fromisoformat(str(data['until']))
+        except ValueError:
+            return JsonResponse({'detail': 'Некорректный until'}, status=400)
+        if timezone.is_naive(until):
+            until = timezone.make_aware(until)
+        if until <= timezone.now():
+            return JsonResponse({'detail': 'until должен быть в будущем'}, status=400)
+
+    updated = set_availability(restaurant_id, item_ids, section_id, is_available, until)
+    return JsonResponse({'updated': updated})
+
+
+@login_required
+@csrf_exempt
+@restaurant_manager_required
+def restaurant_menu_item_manage(request, restaurant_id: int, item_id: int):
+    """
+    PATCH: обновить (например, доступность, цену, описание)
+    DELETE: удалить позицию меню
+    """
     try:
-        item = MenuItem.objects.get(pk=item_id, restaurant=restaurant)
+        item = MenuItem.objects.get(pk=item_id, restaurant_id=restaurant_id)
     except MenuItem.DoesNotExist:
         return JsonResponse({'detail': 'Menu item not found'}, status=404)
 
     if request.method == 'DELETE':
         item.delete()
+        bump_menu_version(restaurant_id)
         return JsonResponse({'detail': 'Deleted'}, status=200)
 
     if request.method == 'PATCH':
@@ -231,6 +484,8 @@ def restaurant_menu_item_manage(request, restaurant_id: int, item_id: int):
             item.description = (data['description'] or '').strip()
         if 'is_available' in data:
             item.is_available = bool(data['is_available'])
+            # ручное переключение отменяет автоматический возврат из стоп-листа
+            item.unavailable_until = None
         if 'price' in data:
             try:
                 item.price = Decimal(str(data['price']))
@@ -242,12 +497,13 @@ def restaurant_menu_item_manage(request, restaurant_id: int, item_id: int):
                 item.section = None
             else:
                 try:
-                    section = MenuSection.objects.get(pk=section_id, restaurant=restaurant)
+                    section = MenuSection.objects.get(pk=section_id, restaurant_id=restaurant_id)
                 except MenuSection.DoesNotExist:
                     return JsonResponse({'detail': 'Section not found'}, status=404)
                 item.section = section
 
         item.save()
+        bump_menu_version(restaurant_id)
 
         return JsonResponse(
             {
@@ -266,26 +522,19 @@ def restaurant_menu_item_manage(request, restaurant_id: int, item_id: int):
 
 @login_required
 @csrf_exempt
+@restaurant_manager_required
 def restaurant_sections_manage(request, restaurant_id: int):
     """
     GET: список разделов ресторана
     POST: создать раздел
+    PATCH: переупорядочить разделы — {"order": [id, id, ...]}
     """
-    user: User = request.user  # type: ignore
-
-    if user.role not in (User.Roles.RESTAURANT, User.Roles.ADMIN):
-        return JsonResponse({"detail": "Forbidden"}, status=403)
-
-    try:
-        restaurant = Restaurant.objects.get(pk=restaurant_id)
-    except Restaurant.DoesNotExist:
-        return JsonResponse({"detail": "Restaurant not found"}, status=404)
-
-    if user.role == User.Roles.RESTAURANT and restaurant.owner_id != user.id:
-        return JsonResponse({"detail": "Forbidden"}, status=403)
-
     if request.method == "GET":
-        sections = restaurant.menu_sections.all().values("id", "name", "ordering")
+        sections = (
+            MenuSection.objects
+            .filter(restaurant_id=restaurant_id)
+            .values("id", "name", "ordering")
+        )
         return JsonResponse(list(sections), safe=False, json_dumps_params={"ensure_ascii": False})
 
     if request.method == "POST":
@@ -300,10 +549,11 @@ def restaurant_sections_manage(request, restaurant_id: int):
             return JsonResponse({"detail": "name обязателен"}, status=400)
 
         section = MenuSection.objects.create(
-            restaurant=restaurant,
+            restaurant_id=restaurant_id,
             name=name,
             ordering=ordering,
         )
+        bump_menu_version(restaurant_id)
 
         return JsonResponse(
             {"id": section.id, "name": section.name, "ordering": section.ordering},
@@ -311,31 +561,60 @@ def restaurant_sections_manage(request, restaurant_id: int):
             json_dumps_params={"ensure_ascii": False},
         )
 
+    if request.method == "PATCH":
+        data = _parse_json(request)
+        if data is None:
+            return JsonResponse({"detail": "Invalid JSON"}, status=400)
+
+        order = data.get("order")
+        if (
+            not isinstance(order, list)
+            or not order
+            or not all(isinstance(section_id, int) for section_id in order)
+            or len(set(order)) != len(order)
+        ):
+            return JsonResponse({"detail": "order должен быть списком id разделов"}, status=400)
+
+        # новый ordering для всех разделов — одним UPDATE ... SET ordering = CASE id ...
+        with transaction.atomic():
+            updated = (
+                MenuSection.objects
+                .filter(restaurant_id=restaurant_id, id__in=order)
+                .update(
+                    ordering=Case(
+                        *[
+                            When(id=section_id, then=Value(position))
+                            for position, section_id in enumerate(order, start=1)
+                        ],
+                        output_field=IntegerField(),
+                    )
+                )
+            )
+            if updated != len(order):
+                transaction.set_rollback(True)
+                return JsonResponse({"detail": "Section not found"}, status=404)
+        bump_menu_version(restaurant_id)
+
+        sections = (
+            MenuSection.objects
+            .filter(restaurant_id=restaurant_id)
+            .values("id", "name", "ordering")
+        )
+        return JsonResponse(list(sections), safe=False, json_dumps_params={"ensure_ascii": False})
+
     return JsonResponse({"detail": "Method not allowed"}, status=405)
 
 
 @login_required
 @csrf_exempt
+@restaurant_manager_required
 def restaurant_section_item_manage(request, restaurant_id: int, section_id: int):
     """
     PATCH: обновить раздел (например имя)
     DELETE: удалить раздел (позиции останутся без раздела)
     """
-    user: User = request.user  # type: ignore
-
-    if user.role not in (User.Roles.RESTAURANT, User.Roles.ADMIN):
-        return JsonResponse({"detail": "Forbidden"}, status=403)
-
     try:
-        restaurant = Restaurant.objects.get(pk=restaurant_id)
-    except Restaurant.DoesNotExist:
-        return JsonResponse({"detail": "Restaurant not found"}, status=404)
-
-    if user.role == User.Roles.RESTAURANT and restaurant.owner_id != user.id:
-        return JsonResponse({"detail": "Forbidden"}, status=403)
-
-    try:
-        section = MenuSection.objects.get(pk=section_id, restaurant=restaurant)
+        section = MenuSection.objects.get(pk=section_id, restaurant_id=restaurant_id)
     except MenuSection.DoesNotExist:
         return JsonResponse({"detail": "Section not found"}, status=404)
 
@@ -343,6 +622,7 @@ def restaurant_section_item_manage(request, restaurant_id: int, section_id: int)
         # Отвязываем блюда от раздела, но не удаляем сами блюда
         MenuItem.objects.filter(section=section).update(section=None)
         section.delete()
+        bump_menu_version(restaurant_id)
         return JsonResponse({"detail": "Deleted"}, status=200)
 
     if request.method == "PATCH":
@@ -355,6 +635,7 @@ def restaurant_section_item_manage(request, restaurant_id: int, section_id: int)
         if "ordering" in data:
             section.ordering = int(data["ordering"] or 0)
         section.save()
+        bump_menu_version(restaurant_id)
 
         return JsonResponse(
             {"id": section.id, "name": section.name, "ordering": section.ordering},
@@ -365,6 +646,7 @@ def restaurant_section_item_manage(request, restaurant_id: int, section_id: int)
 
 
 @login_required
+@restaurant_manager_required
 def restaurant_stats(request, restaurant_id: int):
     """
     Статистика по заказам ресторана:
@@ -373,138 +655,214 @@ def restaurant_stats(request, restaurant_id: int):
     - топ блюд
     - динамика по дням
     - по дням недели
-    """
-    user: User = request.user  # type: ignore
-
-    if user.role not in (User.Roles.RESTAURANT, User.Roles.ADMIN):
-        return JsonResponse({"detail": "Forbidden"}, status=403)
-
-    try:
-        restaurant = Restaurant.objects.get(pk=restaurant_id)
-    except Restaurant.DoesNotExist:
-        return JsonResponse({"detail": "Restaurant not found"}, status=404)
-
-    if user.role == User.Roles.RESTAURANT and restaurant.owner_id != user.id:
-        return JsonResponse({"detail": "Forbidden"}, status=403)
 
+    ?period=today — с начала текущих суток; 7d / 30d — скользящее окно
+    now - N дней; all — всё время.
+    """
     # ----- период -----
     period = request.GET.get("period", "7d")  # today | 7d | 30d | all
+    if period not in STATS_PERIODS:
+        period = "7d"
     now = timezone.now()
-    start = None
+    today = timezone.localdate(now)
 
+    start = None
     if period == "today":
-        start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        start = timezone.make_aware(datetime.combine(today, time.min))
     elif period == "7d":
         start = now - timedelta(days=7)
     elif period == "30d":
         start = now - timedelta(days=30)
-    elif period == "all":
-        start = None
-    else:
-        start = now - timedelta(days=7)
 
-    qs = Order.objects.filter(restaurant=restaurant)
+    # Целые дни периода читаются из дневных агрегатов, а неполный первый день
+    # скользящего окна (7d/30d) — из самих заказов начиная со start.
+    first_full_day = None
+    sums = _empty_stats_sums()
     if start is not None:
-        qs = qs.filter(created_at__gte=start)
+        start_day = timezone.localdate(start)
+        first_full_day = start_day + timedelta(days=1)
+        if start == timezone.make_aware(datetime.combine(start_day, time.min)):
+            first_full_day = start_day
+        else:
+            end = timezone.make_aware(datetime.combine(first_full_day, time.min))
+            sums = _order_stats_sums(restaurant_id, start, end)
+
+    # дашборды опрашивают статистику каждые несколько секунд — агрегаты целых
+    # дней берём из кеша, пока они не изменились (см. orders.rollups.invalidate_stats)
+    cache_key = stats_cache_key(restaurant_id, period, today)
+    rollup_sums = cache.get(cache_key)
+    if rollup_sums is None:
+        rollup_sums = _rollup_stats_sums(restaurant_id, first_full_day)
+        cache.set(cache_key, rollup_sums, STATS_CACHE_TTL)
+    _merge_stats_sums(sums, rollup_sums)
+
+    resp = _format_restaurant_stats(period, start, sums)
+    return JsonResponse({**resp, "to": now.isoformat()}, json_dumps_params={"ensure_ascii": False})
+
+
+def _empty_stats_sums() -> dict:
+    """
+    Суммы, из которых строится ответ статистики:
+    statuses — статус -> [заказов, выручка];
+    items — блюдо -> [название, штук, выручка] (не отменённые);
+    days — день -> [заказов, выручка] (не отменённые).
+    """
+    return {"statuses": {}, "items": {}, "days": {}}
 
-    # --- базовые группы ---
-    total_orders = qs.count()
-    delivered_qs = qs.filter(status=Order.Status.DELIVERED)
-    cancelled_qs = qs.filter(status=Order.Status.CANCELLED)
-    non_cancelled_qs = qs.exclude(status=Order.Status.CANCELLED)
 
-    delivered_count = delivered_qs.count()
-    cancelled_count = cancelled_qs.count()
+def _rollup_stats_sums(restaurant_id: int, first_day: date | None) -> dict:
+    daily_qs = RestaurantDailyStats.objects.filter(restaurant_id=restaurant_id)
+    items_qs = RestaurantItemDailyStats.objects.filter(restaurant_id=restaurant_id)
+    if first_day is not None:
+        daily_qs = daily_qs.filter(day__gte=first_day)
+        items_qs = items_qs.filter(day__gte=first_day)
 
-    # Выручка и средний чек считаем по НЕ отменённым заказам
-    revenue_agg = non_cancelled_qs.aggregate(total=Sum("total_price"))
-    revenue: Decimal = revenue_agg["total"] or Decimal("0.00")
-
-    non_cancelled_count = non_cancelled_qs.count()
-    if non_cancelled_count > 0:
-        avg_check = (revenue / non_cancelled_count).quantize(Decimal("0.01"))
-    else:
-        avg_check = Decimal("0.00")
+    sums = _empty_stats_sums()
+    for row in (
+        daily_qs
+        .values("status")
+        .annotate(orders_count=Sum("orders_count"), revenue=Sum("revenue"))
+        .order_by()
+    ):
+        sums["statuses"][row["status"]] = [row["orders_count"], row["revenue"] or Decimal("0.00")]
 
-    # ----- статусные счётчики -----
-    status_counts_raw = (
-        qs.values("status")
-        .annotate(count=Count("id"))
+    for row in (
+        items_qs
+        .values("menu_item_id", "menu_item__name")
+        .annotate(total_quantity=Sum("quantity"), total_revenue=Sum("revenue"))
         .order_by()
-    )
-    all_statuses = [s for s, _ in Order.Status.choices]
-    status_counts: dict[str, int] = {s: 0 for s in all_statuses}
-    for row in status_counts_raw:
-        status_counts[row["status"]] = row["count"]
+    ):
+        sums["items"][row["menu_item_id"]] = [
+            row["menu_item__name"],
+            row["total_quantity"],
+            row["total_revenue"] or Decimal("0.00"),
+        ]
+
+    for row in (
+        daily_qs
+        .exclude(status=Order.Status.CANCELLED)
+        .values("day")
+        .annotate(day_orders=Sum("orders_count"), day_revenue=Sum("revenue"))
+        .order_by()
+    ):
+        sums["days"][row["day"]] = [row["day_orders"], row["day_revenue"] or Decimal("0.00")]
+    return sums
 
-    # ----- топ блюд (по НЕ отменённым заказам) -----
-    items_qs = (
-        OrderItem.objects
-        .filter(order__restaurant=restaurant)
-        .exclude(order__status=Order.Status.CANCELLED)
-    )
-    if start is not None:
-        items_qs = items_qs.filter(order__created_at__gte=start)
 
-    items_qs = items_qs.annotate(
-        line_total=ExpressionWrapper(
-            F("price_at_moment") * F("quantity"),
-            output_field=DecimalField(max_digits=12, decimal_places=2),
-        )
-    )
+def _order_stats_sums(restaurant_id: int, start: datetime, end: datetime) -> dict:
+    """Те же суммы по заказам из [start, end) — неполный день внутри суток."""
+    orders = Order.objects.filter(restaurant_id=restaurant_id, created_at__gte=start, created_at__lt=end)
 
-    top_items_raw = (
-        items_qs
+    sums = _empty_stats_sums()
+    for row in (
+        orders
+        .values("status")
+        .annotate(orders_count=Count("id"), revenue=Sum("total_price"))
+        .order_by()
+    ):
+        sums["statuses"][row["status"]] = [row["orders_count"], row["revenue"] or Decimal("0.00")]
+
+    for row in (
+        OrderItem.objects
+        .filter(order__in=orders.exclude(status=Order.Status.CANCELLED))
         .values("menu_item_id", "menu_item__name")
         .annotate(
-            quantity=Sum("quantity"),
-            revenue=Sum("line_total"),
+            total_quantity=Sum("quantity"),
+            total_revenue=Sum(F("price_at_moment") * F("quantity")),
         )
-        .order_by("-quantity")[:10]
-    )
+        .order_by()
+    ):
+        sums["items"][row["menu_item_id"]] = [
+            row["menu_item__name"],
+            row["total_quantity"],
+            row["total_revenue"] or Decimal("0.00"),
+        ]
+
+    day = timezone.localdate(start)
+    for status, (orders_count, revenue) in sums["statuses"].items():
+        if status != Order.Status.CANCELLED:
+            totals = sums["days"].setdefault(day, [0, Decimal("0.00")])
+            totals[0] += orders_count
+            totals[1] += revenue
+    return sums
+
+
+def _merge_stats_sums(sums: dict, other: dict):
+    for key in ("statuses", "days"):
+        for bucket, (orders_count, revenue) in other[key].items():
+            totals = sums[key].setdefault(bucket, [0, Decimal("0.00")])
+            totals[0] += orders_count
+            totals[1] += revenue
+    for menu_item_id, (name, quantity, revenue) in other["items"].items():
+        totals = sums["items"].setdefault(menu_item_id, [name, 0, Decimal("0.00")])
+        totals[1] += quantity
+        totals[2] += revenue
+
+
+def _format_restaurant_stats(period: str, start: datetime | None, sums: dict) -> dict:
+    # ----- итоги и статусные счётчики -----
+    all_statuses = [s for s, _ in Order.Status.choices]
+    status_counts: dict[str, int] = {
+        s: sums["statuses"].get(s, [0])[0] for s in all_statuses
+    }
 
-    top_items = [
-        {
-            "menu_item_id": row["menu_item_id"],
-            "name": row["menu_item__name"],
-            "quantity": row["quantity"],
-            "revenue": str(row["revenue"] or Decimal("0.00")),
-        }
-        for row in top_items_raw
-    ]
+    total_orders = sum(status_counts.values())
+    delivered_count = status_counts[Order.Status.DELIVERED]
+    cancelled_count = status_counts[Order.Status.CANCELLED]
 
-    # ----- по дням (не отменённые) -----
-    by_day_raw = (
-        non_cancelled_qs
-        .annotate(day=TruncDate("created_at"))
-        .values("day")
-        .annotate(
-            orders_count=Count("id"),
-            revenue=Sum("total_price"),
-        )
-        .order_by("day")
-    )
+    # Выручка и средний чек считаем по НЕ отменённым заказам
+    revenue = Decimal("0.00")
+    non_cancelled_count = 0
+    for status, (orders_count, status_revenue) in sums["statuses"].items():
+        if status != Order.Status.CANCELLED:
+            revenue += status_revenue
+            non_cancelled_count += orders_count
+
+    if non_cancelled_count > 0:
+        avg_check = (revenue / non_cancelled_count).quantize(Decimal("0.01"))
+    else:
+        avg_check = Decimal("0.00")
+
+    # ----- топ блюд (по НЕ отменённым заказам) -----
+    top_items_raw = sorted(
+        (
+            (menu_item_id, name, quantity, item_revenue)
+            for menu_item_id, (name, quantity, item_revenue) in sums["items"].items()
+            if quantity > 0
+        ),
+        key=lambda row: row[2],
+        reverse=True,
+    )[:10]
 
-    by_day = [
+    top_items = [
         {
-            "date": row["day"].isoformat() if isinstance(row["day"], date) else str(row["day"]),
-            "orders_count": row["orders_count"],
-            "revenue": str(row["revenue"] or Decimal("0.00")),
+            "menu_item_id": menu_item_id,
+            "name": name,
+            "quantity": quantity,
+            "revenue": str(item_revenue),
         }
-        for row in by_day_raw
+        for menu_item_id, name, quantity, item_revenue in top_items_raw
     ]
 
-    # ----- по дням недели (не отменённые) -----
-    weekday_raw = (
-        non_cancelled_qs
-        .annotate(dow=ExtractWeekDay("created_at"))  # 1..7
-        .values("dow")
-        .annotate(
-            orders_count=Count("id"),
-            revenue=Sum("total_price"),
+    # ----- по дням (не отменённые) -----
+    by_day = []
+    # по дням недели (не отменённые) — сворачиваем те же дневные суммы
+    weekday_totals: dict[int, list] = {}
+    for day, (day_orders, day_revenue) in sorted(sums["days"].items()):
+        if day_orders <= 0:
+            continue
+        by_day.append(
+            {
+                "date": day.isoformat(),
+                "orders_count": day_orders,
+                "revenue": str(day_revenue),
+            }
         )
-        .order_by("dow")
-    )
+        # нумерация как у PostgreSQL: 1 = воскресенье, ..., 7 = суббота
+        dow = day.isoweekday() % 7 + 1
+        totals = weekday_totals.setdefault(dow, [0, Decimal("0.00")])
+        totals[0] += day_orders
+        totals[1] += day_revenue
 
     # map weekday number -> label
     # В PostgreSQL 1 = воскресенье, 2 = понедельник, ..., 7 = суббота
@@ -519,21 +877,19 @@ def restaurant_stats(request, restaurant_id: int):
     }
 
     orders_by_weekday = []
-    for row in weekday_raw:
-        dow = row["dow"] or 0
+    for dow, (orders_count, dow_revenue) in sorted(weekday_totals.items()):
         orders_by_weekday.append(
             {
-                "weekday": int(dow),
-                "weekday_display": weekday_labels.get(int(dow), str(dow)),
-                "orders_count": row["orders_count"],
-                "revenue": str(row["revenue"] or Decimal("0.00")),
+                "weekday": dow,
+                "weekday_display": weekday_labels.get(dow, str(dow)),
+                "orders_count": orders_count,
+                "revenue": str(dow_revenue),
             }
         )
 
-    resp = {
+    return {
         "period": period,
         "from": start.isoformat() if start else None,
-        "to": now.isoformat(),
         "totals": {
             "orders_count": total_orders,
             "delivered_count": delivered_count,
@@ -546,5 +902,3 @@ def restaurant_stats(request, restaurant_id: int):
         "by_day": by_day,
         "orders_by_weekday": orders_by_weekday,
     }
-
-    return JsonResponse(resp, json_dumps_params={"ensure_ascii": False})
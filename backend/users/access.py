@@ -0,0 +1,120 @@
+"""
+Права текущего пользователя, которые нужны почти каждому запросу:
+какими ресторанами он владеет и какой у него профиль курьера.
+
+AccessMiddleware кладёт в request.access ленивый объект Access. Данные
+загружаются не больше одного раза за запрос и кешируются на ACCESS_CACHE_TTL
+секунд, поэтому проверка владельца в управляющих эндпоинтах обходится без
+запросов в БД. Правки ресторанов и профилей курьеров в админке сбрасывают
+кеш (invalidate_access).
+"""
+from functools import cached_property, wraps
+
+from django.core.cache import cache
+from django.db import transaction
+from django.http import JsonResponse
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import SimpleLazyObject
+
+from delivery.models import CourierProfile
+from restaurants.models import Restaurant
+from .models import User
+
+ACCESS_CACHE_TTL = 60
+
+
+def _cache_key(user_id: int) -> str:
+    return f'access:{user_id}'
+
+
+def invalidate_access(*user_ids):
+    """
+    Сбрасывает кеш прав после коммита: сброс до коммита позволил бы
+    параллельному запросу снова закешировать старые данные на ACCESS_CACHE_TTL.
+    """
+    keys = [_cache_key(user_id) for user_id in user_ids if user_id is not None]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+class Access:
+    def __init__(self, user: User):
+        self.user = user
+
+    @cached_property
+    def _data(self) -> dict:
+        if not self.user.is_authenticated:
+            return {'role': None, 'restaurant_ids': [], 'courier': None}
+
+        key = _cache_key(self.user.id)
+        data = cache.get(key)
+        # роль входит в данные: если её сменили, пересобираем
+        if data is not None and data['role'] == self.user.role:
+            return data
+
+        data = {'role': self.user.role, 'restaurant_ids': [], 'courier': None}
+        if self.user.role == User.Roles.RESTAURANT:
+            data['restaurant_ids'] = list(
+                Restaurant.objects
+                .filter(owner_id=self.user.id)
+                .values_list('id', flat=True)
+            )
+        elif self.user.role == User.Roles.COURIER:
+            data['courier'] = (
+                CourierProfile.objects
+                .filter(user_id=self.user.id)
+                .values('id', 'is_active')
+                .first()
+            )
+        cache.set(key, data, ACCESS_CACHE_TTL)
+        return data
+
+    @property
+    def is_admin(self) -> bool:
+        return self.user.is_authenticated and self.user.role == User.Roles.ADMIN
+
+    @property
+    def owned_restaurant_ids(self) -> frozenset[int]:
+        return frozenset(self._data['restaurant_ids'])
+
+    @property
+    def courier_id(self) -> int | None:
+        courier = self._data['courier']
+        return courier['id'] if courier else None
+
+    @property
+    def courier_is_active(self) -> bool:
+        courier = self._data['courier']
+        return bool(courier and courier['is_active'])
+
+    def can_manage_restaurant(self, restaurant_id: int) -> bool:
+        return self.is_admin or restaurant_id in self.owned_restaurant_ids
+
+
+class AccessMiddleware(MiddlewareMixin):
+    """Ставится после AuthenticationMiddleware."""
+
+    def process_request(self, request):
+        request.access = SimpleLazyObject(lambda: Access(request.user))
+
+
+def restaurant_manager_required(view):
+    """
+    Пускает во view(request, restaurant_id, ...) только владельца ресторана
+    или админа. Владельцу проверка не стоит запросов в БД.
+    """
+    @wraps(view)
+    def wrapper(request, restaurant_id: int, *args, **kwargs):
+        user: User = request.user  # type: ignore
+
+        if user.role not in (User.Roles.RESTAURANT, User.Roles.ADMIN):
+            return JsonResponse({'detail': 'Forbidden'}, status=403)
+
+        if user.role == User.Roles.RESTAURANT:
+            if restaurant_id not in request.access.owned_restaurant_ids:
+                return JsonResponse({'detail': 'Forbidden'}, status=403)
+        elif not Restaurant.objects.filter(pk=restaurant_id).exists():
+            return JsonResponse({'detail': 'Restaurant not found'}, status=404)
+
+        return view(request, restaurant_id, *args, **kwargs)
+
+    return wrapper
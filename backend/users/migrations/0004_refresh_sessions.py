@@ -0,0 +1,29 @@
+# Generated by Django 6.0 on 2026-10-17 07:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_user_token_version'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='user',
+            name='token_version',
+        ),
+        migrations.CreateModel(
+            name='RefreshSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jti', models.CharField(max_length=32)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('revoked_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='refresh_sessions', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -30,4 +30,25 @@ class User(AbstractUser):
     )
 
     def __str__(self):
-        return f'{self.display_name or self.username} ({self.role})'
\ No newline at end of file
+        return f'{self.display_name or self.username} ({self.role})'
+
+
+class RefreshSession(models.Model):
+    """
+    Сессия refresh-токенов одного входа (устройства).
+
+    jti — идентификатор единственного действующего refresh-токена сессии;
+    обмен заменяет его новым, а предъявление уже использованного токена
+    отзывает всю сессию (см. users.tokens).
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='refresh_sessions',
+    )
+    jti = models.CharField(max_length=32)
+    created_at = models.DateTimeField(auto_now_add=True)
+    revoked_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.user_id} session {self.pk}'
\ No newline at end of file
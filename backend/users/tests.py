@@ -1,3 +1,143 @@
+import json
+
+from django.core.cache import cache
 from django.test import TestCase
 
-# Create your tests here.
+from delivery.models import CourierProfile
+from restaurants.models import Restaurant
+from users.access import Access, invalidate_access
+from users.models import User
+
+
+class AccessTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='x', role=User.Roles.RESTAURANT)
+        self.restaurant = Restaurant.objects.create(owner=self.owner, name='R', address='A')
+
+    def test_access_is_cached_between_requests(self):
+        self.assertEqual(Access(self.owner).owned_restaurant_ids, {self.restaurant.id})
+
+        with self.assertNumQueries(0):
+            self.assertEqual(Access(self.owner).owned_restaurant_ids, {self.restaurant.id})
+
+    def test_invalidation_applies_after_commit(self):
+        Access(self.owner).owned_restaurant_ids
+        second = Restaurant.objects.create(owner=self.owner, name='R2', address='B')
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            invalidate_access(self.owner.id)
+            # до коммита кеш ещё старый
+            self.assertEqual(Access(self.owner).owned_restaurant_ids, {self.restaurant.id})
+        for callback in callbacks:
+            callback()
+
+        self.assertEqual(Access(self.owner).owned_restaurant_ids, {self.restaurant.id, second.id})
+
+    def test_role_change_rebuilds_cached_access(self):
+        Access(self.owner).owned_restaurant_ids
+        self.owner.role = User.Roles.COURIER
+        self.owner.save()
+        profile = CourierProfile.objects.create(user=self.owner)
+
+        access = Access(self.owner)
+
+        self.assertEqual(access.owned_restaurant_ids, frozenset())
+        self.assertEqual(access.courier_id, profile.id)
+
+    def test_owner_check_costs_no_queries(self):
+        self.client.force_login(self.owner)
+        self.client.get(f'/api/restaurants/{self.restaurant.id}/menu/stop-list/')
+        other = Restaurant.objects.create(
+            owner=User.objects.create_user('other', password='x', role=User.Roles.RESTAURANT),
+            name='R3',
+            address='C',
+        )
+
+        # сессия и пользователь — из БД, права — из кеша
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/restaurants/{other.id}/menu/stop-list/')
+
+        self.assertEqual(response.status_code, 403)
+
+
+class RefreshTokenTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('client', password='secret-1')
+
+    def login(self):
+        response = self.client.post(
+            '/api/auth/login/',
+            json.dumps({'username': 'client', 'password': 'secret-1'}),
+            content_type='application/json',
+        )
+        return response.json()['tokens']
+
+    def refresh(self, token: str):
+        return self.client.post(
+            '/api/auth/token/refresh/',
+            json.dumps({'refresh': token}),
+            content_type='application/json',
+        )
+
+    def logout(self, access: str):
+        return self.client.post('/api/auth/logout/', headers={'Authorization': f'Bearer {access}'})
+
+    def test_refresh_rotates_token(self):
+        tokens = self.login()
+
+        rotated = self.refresh(tokens['refresh'])
+
+        self.assertEqual(rotated.status_code, 200)
+        self.assertNotEqual(rotated.json()['refresh'], tokens['refresh'])
+        self.assertEqual(self.refresh(rotated.json()['refresh']).status_code, 200)
+
+    def test_reused_token_revokes_the_session(self):
+        tokens = self.login()
+        rotated = self.refresh(tokens['refresh']).json()
+
+        # старый токен предъявлен повторно — отзываем сессию целиком
+        self.assertEqual(self.refresh(tokens['refresh']).status_code, 401)
+        self.assertEqual(self.refresh(rotated['refresh']).status_code, 401)
+
+    def test_devices_refresh_and_log_out_independently(self):
+        phone = self.login()
+        laptop = self.login()
+
+        # обмен на одном устройстве не трогает токены другого
+        phone = self.refresh(phone['refresh']).json()
+        laptop = self.refresh(laptop['refresh']).json()
+
+        self.logout(phone['access'])
+
+        self.assertEqual(self.refresh(phone['refresh']).status_code, 401)
+        self.assertEqual(self.refresh(laptop['refresh']).status_code, 200)
+
+    def test_logout_with_refresh_in_body(self):
+        tokens = self.login()
+
+        self.client.post(
+            '/api/auth/logout/',
+            json.dumps({'refresh': tokens['refresh']}),
+            content_type='application/json',
+        )
+
+        self.assertEqual(self.refresh(tokens['refresh']).status_code, 401)
+
+    def test_password_change_invalidates_every_session(self):
+        first, second = self.login(), self.login()
+
+        self.user.set_password('secret-2')
+        self.user.save()
+
+        self.assertEqual(self.refresh(first['refresh']).status_code, 401)
+        self.assertEqual(self.refresh(second['refresh']).status_code, 401)
+
+    def test_inactive_user_cannot_refresh(self):
+        tokens = self.login()
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+
+        self.assertEqual(self.refresh(tokens['refresh']).status_code, 401)
+
+    def test_tampered_token(self):
+        self.assertEqual(self.refresh('not-a-token').status_code, 401)
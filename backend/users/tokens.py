@@ -0,0 +1,180 @@
+"""
+Stateless-аутентификация API по подписанным токенам.
+
+login_view выдаёт пару токенов:
+
+- access — живёт ACCESS_TOKEN_TTL секунд и несёт id и роль пользователя;
+  TokenAuthenticationMiddleware проверяет только подпись и срок, поэтому
+  запрос с заголовком "Authorization: Bearer <access>" авторизуется
+  без чтения django_session и users_user;
+- refresh — живёт REFRESH_TOKEN_TTL, меняется на новую пару через
+  token_refresh_view. Здесь пользователь читается из БД: заблокированный
+  пользователь или сменённый пароль делают refresh-токен недействительным.
+
+Каждый вход заводит RefreshSession — свою для каждого устройства. Refresh-токен
+одноразовый: он несёт id сессии и её текущий jti, обмен заменяет jti условным
+UPDATE. Предъявление уже использованного токена сессии (jti не совпал) —
+признак кражи: сессия отзывается целиком, и ни вор, ни владелец её больше
+не продлят. Выход (logout_view) отзывает только сессию текущего устройства.
+
+Токены подписываются SECRET_KEY через django.core.signing. Запросы без
+заголовка Authorization по-прежнему используют сессии (админка, веб-клиент).
+"""
+import secrets
+
+from django.conf import settings
+from django.core import signing
+from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.utils.deprecation import MiddlewareMixin
+
+from .models import RefreshSession, User
+
+ACCESS_TOKEN_SALT = 'users.tokens.access'
+REFRESH_TOKEN_SALT = 'users.tokens.refresh'
+
+
+def _access_ttl() -> int:
+    return getattr(settings, 'ACCESS_TOKEN_TTL', 5 * 60)
+
+
+def _refresh_ttl() -> int:
+    return getattr(settings, 'REFRESH_TOKEN_TTL', 14 * 24 * 60 * 60)
+
+
+def _password_fingerprint(user: User) -> str:
+    # меняется при смене пароля — старые refresh-токены перестают работать
+    return user.get_session_auth_hash()[:16]
+
+
+def _new_jti() -> str:
+    return secrets.token_hex(16)
+
+
+def issue_tokens(user: User, session: RefreshSession | None = None) -> dict:
+    """Пара токенов для session; без неё — для новой сессии (новый вход)."""
+    if session is None:
+        session = RefreshSession.objects.create(user=user, jti=_new_jti())
+
+    access = signing.dumps(
+        {'uid': user.pk, 'role': user.role, 'sid': session.pk},
+        salt=ACCESS_TOKEN_SALT,
+        compress=True,
+    )
+    refresh = signing.dumps(
+        {'sid': session.pk, 'jti': session.jti, 'pwd': _password_fingerprint(user)},
+        salt=REFRESH_TOKEN_SALT,
+        compress=True,
+    )
+    return {
+        'access': access,
+        'refresh': refresh,
+        'token_type': 'Bearer',
+        'expires_in': _access_ttl(),
+    }
+
+
+def user_from_access_token(token: str) -> User | None:
+    """
+    Пользователь из access-токена без запроса в БД или None, если токен
+    подделан или просрочен. У такого User заполнены только pk и role.
+    """
+    try:
+        payload = signing.loads(token, salt=ACCESS_TOKEN_SALT, max_age=_access_ttl())
+    except signing.BadSignature:
+        return None
+
+    user = User(pk=payload['uid'], role=payload['role'])
+    user.refresh_session_id = payload.get('sid')
+    # объект соответствует существующей строке — его можно ставить во внешние ключи
+    user._state.adding = False
+    user._state.db = 'default'
+    user.from_token = True
+    return user
+
+
+def _refresh_payload(token: str) -> dict | None:
+    try:
+        payload = signing.loads(token, salt=REFRESH_TOKEN_SALT, max_age=_refresh_ttl())
+    except signing.BadSignature:
+        return None
+    # токены, выданные до появления сессий, не принимаются
+    return payload if 'sid' in payload else None
+
+
+def refresh_tokens(token: str) -> dict | None:
+    """
+    Новая пара токенов в обмен на refresh-токен или None. Токен при этом
+    расходуется: jti сессии меняется условным UPDATE, поэтому из двух
+    параллельных обменов одного токена успешен только один.
+    """
+    payload = _refresh_payload(token)
+    if payload is None:
+        return None
+
+    session = (
+        RefreshSession.objects
+        .select_related('user')
+        .filter(pk=payload['sid'], revoked_at__isnull=True, user__is_active=True)
+        .first()
+    )
+    if session is None:
+        return None
+    user = session.user
+    if not constant_time_compare(payload['pwd'], _password_fingerprint(user)):
+        return None
+
+    jti = _new_jti()
+    rotated = (
+        RefreshSession.objects
+        .filter(pk=session.pk, jti=payload['jti'], revoked_at__isnull=True)
+        .update(jti=jti)
+    )
+    if not rotated:
+        # токен этой сессии уже обменян — его повторно предъявил кто-то ещё
+        revoke_refresh_session(session.pk)
+        return None
+    session.jti = jti
+    return issue_tokens(user, session)
+
+
+def revoke_refresh_session(session_id: int | None):
+    """Делает недействительными refresh-токены одной сессии (устройства)."""
+    if session_id is None:
+        return
+    RefreshSession.objects.filter(pk=session_id, revoked_at__isnull=True).update(
+        revoked_at=timezone.now(),
+    )
+
+
+def refresh_session_id(token: str) -> int | None:
+    """id сессии из подлинного refresh-токена (для выхода) или None."""
+    payload = _refresh_payload(token)
+    return payload['sid'] if payload else None
+
+
+class TokenAuthenticationMiddleware(MiddlewareMixin):
+    """
+    Ставится после AuthenticationMiddleware: для запросов с Bearer-токеном
+    подменяет ленивого request.user, так что сессия вообще не читается.
+    """
+
+    def process_request(self, request):
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        scheme, _, token = header.partition(' ')
+        if scheme.lower() != 'bearer' or not token:
+            return None
+
+        user = user_from_access_token(token.strip())
+        if user is None:
+            return JsonResponse({'detail': 'Invalid or expired token'}, status=401)
+
+        async def auser():
+            return user
+
+        request.user = user
+        request.auser = auser
+        # токен не отправляется браузером сам по себе, CSRF-проверка не нужна
+        request._dont_enforce_csrf_checks = True
+        return None
@@ -5,6 +5,7 @@ from . import views
 urlpatterns = [
     path('auth/login/', views.login_view, name='login'),
     path('auth/logout/', views.logout_view, name='logout'),
+    path('auth/token/refresh/', views.token_refresh_view, name='token_refresh'),
     path('auth/me/', views.me_view, name='me'),
     path('auth/register/', views.register_view, name='register'),
 ]
\ No newline at end of file
@@ -5,6 +5,7 @@ from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 
 from .models import User
+from .tokens import issue_tokens, refresh_session_id, refresh_tokens, revoke_refresh_session
 
 
 def _parse_json(request):
@@ -33,6 +34,7 @@ def login_view(request):
     if user is None:
         return JsonResponse({'detail': 'Invalid credentials'}, status=401)
 
+    # сессия — для веб-клиента и админки, токены — для мобильных клиентов и API
     login(request, user)
 
     return JsonResponse(
@@ -42,16 +44,47 @@ def login_view(request):
             'role': user.role,
             'display_name': user.display_name,
             'phone': user.phone,
+            'tokens': issue_tokens(user),
         },
         json_dumps_params={'ensure_ascii': False},
     )
 
 
+@csrf_exempt
+def token_refresh_view(request):
+    """POST {"refresh": "..."} -> новая пара access/refresh."""
+    if request.method != 'POST':
+        return JsonResponse({'detail': 'Method not allowed'}, status=405)
+
+    data = _parse_json(request)
+    if data is None:
+        return JsonResponse({'detail': 'Invalid JSON'}, status=400)
+
+    refresh = data.get('refresh')
+    if not refresh or not isinstance(refresh, str):
+        return JsonResponse({'detail': 'refresh is required'}, status=400)
+
+    tokens = refresh_tokens(refresh)
+    if tokens is None:
+        return JsonResponse({'detail': 'Invalid or expired token'}, status=401)
+
+    return JsonResponse(tokens)
+
+
 @csrf_exempt
 def logout_view(request):
+    """
+    Выход с текущего устройства: отзывает сессию refresh-токенов из
+    Bearer access-токена или из {"refresh": "..."} в теле; другие устройства
+    остаются в системе.
+    """
     if request.method != 'POST':
         return JsonResponse({'detail': 'Method not allowed'}, status=405)
 
+    revoke_refresh_session(getattr(request.user, 'refresh_session_id', None))
+    data = _parse_json(request) if request.body else None
+    if isinstance(data, dict) and isinstance(data.get('refresh'), str):
+        revoke_refresh_session(refresh_session_id(data['refresh']))
     logout(request)
 
     return JsonResponse({'detail': 'Logged out'}, json_dumps_params={'ensure_ascii': False})
@@ -62,6 +95,9 @@ def me_view(request):
         return JsonResponse({'detail': 'Not authenticated'}, status=401)
 
     user: User = request.user  # type: ignore
+    if getattr(user, 'from_token', False):
+        # в access-токене только id и роль — профиль читаем из БД
+        user = User.objects.get(pk=user.pk)
 
     return JsonResponse(
         {